@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+from netCDF4 import Dataset
+
+
+FILL_VALUE = 1e20
+PSIMS_NAME = 'papsim_wfdei.cru_hist_default_firr_whe_annual_1979_{}.nc4'
+GSDE_VARIABLES = ['PH', 'OC', 'CLAY', 'SAND']
+
+
+def _dimension(ds, name, values, units, long_name=None):
+    ds.createDimension(name, len(values))
+    var = ds.createVariable(name, 'f8', (name, ))
+    var[:] = values
+    var.units = units
+    var.long_name = long_name or name
+    return var
+
+
+def _variable(ds, name, dims, shape, mask_density, rng, chunk_lats,
+              scale=1.):
+    var = ds.createVariable(
+        name, 'f4', dims, zlib=True, fill_value=FILL_VALUE,
+        chunksizes=tuple(min(n, chunk_lats) if d == 'lat' else n
+                         for d, n in zip(dims, shape)))
+    lat_axis = dims.index('lat')
+    for start in range(0, shape[lat_axis], chunk_lats):
+        stop = min(start + chunk_lats, shape[lat_axis])
+        block = list(shape)
+        block[lat_axis] = stop - start
+        values = (rng.random_sample(block) * scale).astype(np.float32)
+        # Mask whole pixels, as land/sea masks do.
+        pixel_shape = [n if d in ('lat', 'lon') else 1
+                       for d, n in zip(dims, block)]
+        masked = rng.random_sample(pixel_shape) < mask_density
+        values[np.broadcast_to(masked, block)] = FILL_VALUE
+        index = [slice(None)] * len(dims)
+        index[lat_axis] = slice(start, stop)
+        var[tuple(index)] = values
+    var.long_name = name
+    var.units = '1'
+    return var
+
+
+def psims_file(directory, n_lats=360, n_lons=720, n_times=34,
+               n_variables=2, mask_density=0.7, seed=0):
+    """Write a pSIMS-shaped file: global 0.5 degree (or coarser) grid,
+    latitudes north to south, yearly time steps and a mostly masked
+    ocean. The name follows the pSIMS convention `AtlasPsims` parses.
+
+    :param directory: Output directory
+    :type directory: str
+    :param n_lats: Latitude rows
+    :type n_lats: int
+    :param n_lons: Longitude columns
+    :type n_lons: int
+    :param n_times: Time steps
+    :type n_times: int
+    :param n_variables: Number of variables
+    :type n_variables: int
+    :param mask_density: Fraction of masked pixels
+    :type mask_density: float
+    :param seed: Random seed
+    :type seed: int
+    :return: Path of the file
+    :rtype: str
+    """
+    rng = np.random.RandomState(seed)
+    path = os.path.join(directory, PSIMS_NAME.format(1979 + n_times - 1))
+    res_lat, res_lon = 180. / n_lats, 360. / n_lons
+    ds = Dataset(path, 'w')
+    try:
+        _dimension(ds, 'time', np.arange(1, n_times + 1),
+                   'growing seasons since 1979-01-01 00:00:00')
+        _dimension(ds, 'lat',
+                   90. - res_lat / 2 - np.arange(n_lats) * res_lat,
+                   'degrees_north', 'latitude')
+        _dimension(ds, 'lon',
+                   -180. + res_lon / 2 + np.arange(n_lons) * res_lon,
+                   'degrees_east', 'longitude')
+        for i in range(n_variables):
+            _variable(ds, 'var{}'.format(i), ('time', 'lat', 'lon'),
+                      (n_times, n_lats, n_lons), mask_density, rng,
+                      chunk_lats=max(1, n_lats // 8), scale=10000.)
+    finally:
+        ds.close()
+    return path
+
+
+def gsde_file(directory, lat=0., lon=0., size=2., res=1. / 120,
+              n_depths=8, mask_density=0.3, seed=0):
+    """Write a GSDE-shaped tile: `size` degrees square at `res`, with
+    soil properties by depth.
+
+    :param directory: Output directory
+    :type directory: str
+    :param lat: Southern edge of the tile
+    :type lat: float
+    :param lon: Western edge of the tile
+    :type lon: float
+    :param size: Tile width and height in degrees
+    :type size: float
+    :param res: Grid resolution in degrees
+    :type res: float
+    :param n_depths: Soil layers
+    :type n_depths: int
+    :param mask_density: Fraction of masked pixels
+    :type mask_density: float
+    :param seed: Random seed
+    :type seed: int
+    :return: Path of the file
+    :rtype: str
+    """
+    rng = np.random.RandomState(seed)
+    n = int(round(size / res))
+    path = os.path.join(directory, 'gsde_{:+.1f}_{:+.1f}.nc4'.format(
+        lat, lon))
+    ds = Dataset(path, 'w')
+    try:
+        _dimension(ds, 'depth', np.arange(n_depths) * 10., 'cm')
+        _dimension(ds, 'lat', lat + res / 2 + np.arange(n) * res,
+                   'degrees_north', 'latitude')
+        _dimension(ds, 'lon', lon + res / 2 + np.arange(n) * res,
+                   'degrees_east', 'longitude')
+        for name in GSDE_VARIABLES:
+            _variable(ds, name, ('depth', 'lat', 'lon'),
+                      (n_depths, n, n), mask_density, rng,
+                      chunk_lats=min(n, 60), scale=100.)
+    finally:
+        ds.close()
+    return path
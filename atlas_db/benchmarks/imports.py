@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import json
+import argparse
+import subprocess
+
+
+HEAVY = ['numpy', 'pymongo', 'bson', 'netCDF4', 'elasticsearch', 'requests',
+         'lxml']
+
+# Import time budget in seconds, and libraries that must not be loaded,
+# for each entry point. Config must never be read at import.
+BUDGETS = [
+    ('atlas_db.constants', 0.05, HEAVY),
+    ('atlas_db.clients', 0.05, HEAVY),
+    ('atlas_db.grid', 0.5, ['pymongo', 'bson', 'netCDF4', 'elasticsearch',
+                            'requests', 'lxml']),
+    # pymongo is imported by the first client or write, not at import;
+    # bson encodes and decodes documents and is cheap.
+    ('atlas_db.extractors.mongodb', 1.0, ['pymongo', 'netCDF4',
+                                          'elasticsearch', 'requests',
+                                          'lxml']),
+    ('atlas_db.extractors.elastic', 0.5, ['pymongo', 'bson', 'netCDF4',
+                                          'elasticsearch', 'requests',
+                                          'lxml']),
+    ('atlas_db.ingestors.mongodb', 1.0, ['pymongo', 'netCDF4',
+                                         'elasticsearch', 'requests',
+                                         'lxml']),
+    ('atlas_db.interfaces.psims', 1.5, ['pymongo', 'netCDF4',
+                                        'elasticsearch', 'requests',
+                                        'lxml']),
+]
+
+PROBE = '''
+import sys, json, time
+start = time.time()
+import {module}
+seconds = time.time() - start
+from atlas_db import constants
+print(json.dumps({{
+    'seconds': seconds,
+    'loaded': [m for m in {heavy!r} if m in sys.modules],
+    'config_read': any(s._values is not None for s in constants._sections),
+}}))
+'''
+
+
+def measure(module, repeat=3):
+    """Import `module` in fresh interpreters and keep the fastest run.
+
+    :param module: Module to import
+    :type module: str
+    :param repeat: Number of interpreters to start
+    :type repeat: int
+    :return: Seconds, heavy libraries loaded and whether config was read
+    :rtype: dict
+    """
+    runs = list()
+    for _ in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)])
+        runs.append(json.loads(out.decode('utf-8')))
+    return min(runs, key=lambda run: run['seconds'])
+
+
+def check(repeat=3, scale=1.):
+    """Measure every entry point against its budget.
+
+    :param repeat: Interpreters started per module
+    :type repeat: int
+    :param scale: Multiplier for the time budgets, for slow machines
+    :type scale: float
+    :return: Results by module, each with a list of `failures`
+    :rtype: dict
+    """
+    results = dict()
+    for module, budget, forbidden in BUDGETS:
+        result = measure(module, repeat)
+        result['budget'] = budget * scale
+        failures = list()
+        if result['seconds'] > result['budget']:
+            failures.append('took {:.3f}s'.format(result['seconds']))
+        failures += ['loaded {}'.format(m) for m in result['loaded']
+                     if m in forbidden]
+        if result['config_read']:
+            failures.append('read the config')
+        result['failures'] = failures
+        results[module] = result
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check the import time of atlas_db entry points.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=1.,
+                        help='Multiplier for the time budgets')
+    args = parser.parse_args(argv)
+    results = check(args.repeat, args.scale)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    failed = [m for m, r in sorted(results.items()) if r['failures']]
+    for module in failed:
+        sys.stderr.write('{}: {}\n'.format(
+            module, ', '.join(results[module]['failures'])))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import bson
+from collections import namedtuple
+from bson.raw_bson import RawBSONDocument
+
+
+AtlasMemoryBulkResult = namedtuple('AtlasMemoryBulkResult',
+                                   ['matched_count', 'upserted_count'])
+
+
+class AtlasMemoryCollection(object):
+    def __init__(self, collection):
+        """`mongomock` collection with the parts of the pymongo API that
+        the ingestors and extractors use but `mongomock` lacks: raw BSON
+        inserts and replacements, `find_raw_batches`,
+        `aggregate_raw_batches`, and `$slice` on nested fields, which
+        `mongomock` drops from the result instead of cutting.
+
+        :param collection: Collection to wrap
+        :type collection: mongomock.collection.Collection
+        """
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def with_options(self, *args, **kwargs):
+        return self
+
+    def insert_many(self, docs, ordered=True, **kwargs):
+        docs = [bson.decode(doc.raw) if isinstance(doc, RawBSONDocument)
+                else doc for doc in docs]
+        return self._collection.insert_many(docs, ordered=ordered, **kwargs)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        # mongomock's bulk API lags pymongo's operation classes, so the
+        # `ReplaceOne`s the bulk writer sends are applied one by one.
+        matched = upserted = 0
+        for request in requests:
+            doc = request._doc
+            if isinstance(doc, RawBSONDocument):
+                doc = bson.decode(doc.raw)
+            result = self._collection.replace_one(
+                request._filter, doc, upsert=bool(request._upsert))
+            matched += result.matched_count
+            upserted += result.upserted_id is not None
+        return AtlasMemoryBulkResult(matched, upserted)
+
+    def create_indexes(self, indexes, **kwargs):
+        # Index builds are not simulated.
+        return [index.document['name'] for index in indexes]
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        projection, slices = split_slices(projection)
+        cursor = self._collection.find(filter, projection, *args, **kwargs)
+        return AtlasMemorySlicedCursor(cursor, slices) if slices else cursor
+
+    def find_raw_batches(self, filter=None, projection=None, batch_size=0,
+                         **kwargs):
+        return AtlasMemoryRawCursor(
+            self.find(filter, projection, **kwargs), batch_size or 101)
+
+    def aggregate_raw_batches(self, pipeline, batchSize=0, **kwargs):
+        return AtlasMemoryRawCursor(
+            self._collection.aggregate(pipeline, **kwargs), batchSize or 101)
+
+
+def split_slices(projection):
+    """Take the `$slice` operators out of an inclusion projection.
+
+    :return: Projection including the sliced fields whole, and the
+     `$slice` arguments by dotted path
+    :rtype: tuple
+    """
+    if not projection:
+        return projection, dict()
+    slices = dict((k, v['$slice']) for k, v in projection.items()
+                  if isinstance(v, dict) and '$slice' in v)
+    projection = dict(projection)
+    projection.update((k, True) for k in slices)
+    return projection, slices
+
+
+def apply_slice(values, window):
+    """`values` cut as the server does for `{'$slice': window}`.
+    """
+    if isinstance(window, int):
+        return values[:window] if window >= 0 else values[window:]
+    skip, count = window
+    if skip < 0:
+        skip = max(len(values) + skip, 0)
+    return values[skip:skip + count]
+
+
+class AtlasMemorySlicedCursor(object):
+    def __init__(self, cursor, slices):
+        """Cursor applying the `$slice` projections to the documents of
+        `cursor`.
+        """
+        self.cursor = cursor
+        self.slices = slices
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        doc = next(self.cursor)
+        for path, window in self.slices.items():
+            parent = doc
+            keys = path.split('.')
+            for key in keys[:-1]:
+                parent = parent.get(key) if isinstance(parent, dict) \
+                    else None
+            if isinstance(parent, dict) \
+                    and isinstance(parent.get(keys[-1]), list):
+                parent[keys[-1]] = apply_slice(parent[keys[-1]], window)
+        return doc
+
+    def limit(self, limit):
+        self.cursor = self.cursor.limit(limit)
+        return self
+
+
+class AtlasMemoryRawCursor(object):
+    def __init__(self, cursor, batch_size):
+        self.cursor = cursor
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        batch = list()
+        for doc in self.cursor:
+            batch.append(bson.encode(doc))
+            if len(batch) == self.batch_size:
+                yield b''.join(batch)
+                batch = list()
+        if batch:
+            yield b''.join(batch)
+
+    def close(self):
+        self.cursor.close()
+
+
+class AtlasMemoryDatabase(object):
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __getitem__(self, name):
+        return AtlasMemoryCollection(self._db[name])
+
+
+class AtlasMemoryClient(object):
+    def __init__(self):
+        """In-process stand-in for `MongoClient`, for benchmarking without
+        a server. Needs the optional `mongomock` package. Each process
+        has its own data, so writes made in pool workers are measured but
+        not visible to the parent.
+        """
+        import mongomock
+        self._client = mongomock.MongoClient()
+
+    def __getitem__(self, name):
+        return AtlasMemoryDatabase(self._client[name])
+
+    def close(self):
+        self._client.close()
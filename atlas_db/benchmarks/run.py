@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from netCDF4 import Dataset
+from atlas_db.benchmarks.fixtures import psims_file, gsde_file
+from atlas_db.clients import registry
+from atlas_db.constants import SCALE
+from atlas_db.extractors.mongodb import AtlasMongoExtractor
+from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+from atlas_db.ingestors.pool import AtlasWorkerPool
+from atlas_db.interfaces.psims import AtlasPsims
+from atlas_db.metrics import metrics
+
+
+def peak_rss(children=False):
+    """Peak resident set size of this process, or of its largest
+    terminated and waited-for child.
+
+    :return: Peak RSS in bytes, None where `resource` is unavailable
+    :rtype: int
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def throughput(stats, seconds):
+    """Write statistics of a run, with its stage timings and counters
+    from `metrics`.
+    """
+    return {'seconds': seconds,
+            'metrics': metrics.as_dict,
+            'docs': stats['docs'],
+            'bytes': stats['bytes'],
+            'batches': stats['batches'],
+            'retries': stats['retries'],
+            'docs_per_second': stats['docs'] / seconds if seconds else 0.}
+
+
+def latencies(seconds):
+    """Percentiles of a list of latencies.
+
+    :param seconds: Latencies in seconds
+    :type seconds: list
+    :return: Count and p50/p90/p99/max in milliseconds
+    :rtype: dict
+    """
+    ms = np.asarray(seconds) * 1000.
+    if not len(ms):
+        return {'n': 0}
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {'n': len(ms), 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99,
+            'max_ms': ms.max()}
+
+
+def drop_dataset(interface):
+    """Drop what an earlier run stored for the dataset of `interface`:
+    its collections, overviews included, metadata and checkpoint. Every
+    run then times inserts into empty collections, and does not fail on
+    the documents of the last one.
+
+    :param interface: Interface of the dataset
+    :type interface: AtlasNc4Interface
+    """
+    for variable in list(interface.variables) + [None]:
+        for collection in interface.grid_collections(variable):
+            registry.grid(interface.name, collection).drop()
+    registry.collection('grid_meta').delete_many({'name': interface.name})
+    interface.checkpoint.clear(interface.name)
+
+
+def bench_ingest(path):
+    """Ingest a pSIMS file with `AtlasPsims.ingest` in this process.
+
+    :return: Dataset name and results
+    :rtype: tuple
+    """
+    backend = AtlasMongoIngestor(SCALE)
+    interface = AtlasPsims(backend, path, SCALE)
+    drop_dataset(interface)
+    metrics.reset()
+    start = time.time()
+    interface.ingest()
+    result = throughput(backend.stats, time.time() - start)
+    result['peak_rss'] = peak_rss()
+    return interface.name, result
+
+
+def bench_parallel_ingest(path, variable, processes):
+    """Ingest one variable of a file with `parallel_ingest` on a
+    dedicated worker pool, under its own dataset name.
+
+    :return: Results
+    :rtype: dict
+    """
+    ds = Dataset(path)
+    try:
+        values = ds.variables[variable][:]
+        lats = ds.variables['lat'][:]
+        lons = ds.variables['lon'][:]
+    finally:
+        ds.close()
+    # The time axis comes first in the file; the ingestors want latitude.
+    values = np.ma.asarray(values).transpose(1, 2, 0)
+    registry.grid('parallel', variable).drop()
+    pool = AtlasWorkerPool(processes)
+    backend = AtlasMongoIngestor(SCALE, pool=pool)
+    metrics.reset()
+    start = time.time()
+    try:
+        backend.parallel_ingest(values, lats, lons, 'parallel', variable,
+                                no_index=True)
+        seconds = time.time() - start
+    finally:
+        # Workers must have exited for their peak RSS to be reported.
+        pool.close()
+    result = throughput(backend.stats, seconds)
+    result['processes'] = pool.processes
+    result['peak_rss_workers'] = peak_rss(children=True)
+    return result
+
+
+def bench_gsde(path):
+    """Ingest a GSDE-shaped tile the way `AtlasGsde` ingests each tile.
+
+    :return: Results
+    :rtype: dict
+    """
+    from atlas_db.interfaces.gsde import AtlasGsdeTile
+    backend = AtlasMongoIngestor(SCALE)
+    tile = AtlasGsdeTile(backend, path, SCALE)
+    drop_dataset(tile)
+    metrics.reset()
+    start = time.time()
+    tile.ingest()
+    result = throughput(backend.stats, time.time() - start)
+    result['peak_rss'] = peak_rss()
+    return result
+
+
+def bench_queries(name, variable, n_queries, sizes, budget=None, seed=0):
+    """Time `AtlasMongoExtractor.quadrilateral` over random viewports of
+    each size in degrees. Viewports are axis-aligned rectangles, the
+    shape map clients send.
+
+    :return: Latencies and document counts by viewport size
+    :rtype: dict
+    """
+    rng = np.random.RandomState(seed)
+    extractor = AtlasMongoExtractor()
+    extractor.set_grid_db(name, variable)
+    results = dict()
+    for size in sizes:
+        seconds = list()
+        docs = 0
+        for _ in range(n_queries):
+            w = rng.uniform(-180., 180. - size)
+            s = rng.uniform(-90., 90. - size)
+            e, n = w + size, s + size
+            start = time.time()
+            docs += len(extractor.quadrilateral(w, s, e, s, e, n, w, n,
+                                                budget=budget))
+            seconds.append(time.time() - start)
+        result = latencies(seconds)
+        result['docs'] = docs
+        results['{:g}'.format(size)] = result
+    return results
+
+
+def commit():
+    """Current git commit of the package, if it is a checkout.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark ingestion and extraction on synthetic '
+                    'netCDF files and print the results as JSON.')
+    parser.add_argument('--lats', type=int, default=360)
+    parser.add_argument('--lons', type=int, default=720)
+    parser.add_argument('--times', type=int, default=34)
+    parser.add_argument('--variables', type=int, default=2)
+    parser.add_argument('--mask-density', type=float, default=0.7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='parallel_ingest workers (default: all cores)')
+    parser.add_argument('--queries', type=int, default=50,
+                        help='Queries per viewport size')
+    parser.add_argument('--sizes', type=float, nargs='+',
+                        default=[1., 10., 45.],
+                        help='Viewport sizes in degrees')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='Pixel budget of queries (0: native grid)')
+    parser.add_argument('--gsde', action='store_true',
+                        help='Also ingest a 2 degree GSDE tile')
+    parser.add_argument('--memory', action='store_true',
+                        help='Use an in-process stand-in for mongod '
+                             '(needs mongomock)')
+    parser.add_argument('--directory', default=None,
+                        help='Keep the fixtures in this directory')
+    parser.add_argument('--output', default=None,
+                        help='Write the JSON here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.memory:
+        from atlas_db.benchmarks.memory import AtlasMemoryClient
+        registry.close()
+        registry.factory = AtlasMemoryClient
+    directory = args.directory or tempfile.mkdtemp(prefix='atlas_bench_')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    report = {'commit': commit(), 'backend': 'memory' if args.memory
+              else 'mongod', 'parameters': vars(args), 'results': dict()}
+    results = report['results']
+    try:
+        start = time.time()
+        path = psims_file(directory, args.lats, args.lons, args.times,
+                          args.variables, args.mask_density, args.seed)
+        results['fixture'] = {'seconds': time.time() - start,
+                              'bytes': os.path.getsize(path)}
+
+        name, results['ingest'] = bench_ingest(path)
+        results['parallel_ingest'] = bench_parallel_ingest(
+            path, 'var0', args.processes)
+        if args.gsde:
+            results['gsde_ingest'] = bench_gsde(
+                gsde_file(directory, seed=args.seed))
+        results['quadrilateral'] = bench_queries(
+            name, 'var0', args.queries, args.sizes, args.budget, args.seed)
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    out = json.dumps(report, indent=2, sort_keys=True, default=float)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        print(out)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+from atlas_db.constants import ELASTICSEARCH, MONGO, uri
+
+
+class AtlasMongoRegistry(object):
+    def __init__(self, settings=None, factory=None):
+        """Process-local registry of pooled Mongo clients and collection
+        handles, shared by ingestors and extractors. A client is never
+        reused across `fork`: the first call in a child process builds
+        that process its own client. Like the settings, pymongo is only
+        loaded when a client is first needed.
+
+        :param settings: Connection settings, defaults to `constants.MONGO`
+        :type settings: dict
+        :param factory: Called with no arguments to build a client in
+         place of `MongoClient`, e.g. an in-process stand-in
+        :type factory: function
+        """
+        self.settings = settings if settings is not None else MONGO
+        self.factory = factory
+        self._pid = None
+        self._client = None
+        self._collections = dict()
+
+    @property
+    def options(self):
+        """Keyword arguments for `MongoClient` taken from the settings.
+
+        :return: Client options
+        :rtype: dict
+        """
+        options = dict(
+            maxPoolSize=self.settings['max_pool_size'],
+            connectTimeoutMS=self.settings['connect_timeout_ms'],
+            serverSelectionTimeoutMS=self.settings[
+                'server_selection_timeout_ms'],
+            socketTimeoutMS=self.settings['socket_timeout_ms'],
+            w=self.settings['write_concern'],
+        )
+        return {k: v for k, v in options.items() if v is not None}
+
+    @property
+    def client(self):
+        """Pooled client for the current process.
+
+        :return: Mongo client
+        :rtype: MongoClient
+        """
+        if self._pid != os.getpid():
+            # Inherited handles belong to the parent's sockets; drop them
+            # without closing.
+            self._collections = dict()
+            if self.factory is not None:
+                self._client = self.factory()
+            else:
+                from pymongo import MongoClient
+                if not self.settings['local']:
+                    self._client = MongoClient(uri(self.settings),
+                                               **self.options)
+                else:
+                    self._client = MongoClient(
+                        'localhost', self.settings['port'], **self.options)
+            self._pid = os.getpid()
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.settings['database']]
+
+    def collection(self, name):
+        """Cached collection handle.
+
+        :param name: Collection name
+        :type name: str
+        :return: Collection
+        :rtype: pymongo.collection.Collection
+        """
+        db = self.db
+        if name not in self._collections:
+            self._collections[name] = db[name]
+        return self._collections[name]
+
+    def grid(self, metadata, variable):
+        """Cached handle for the `{metadata}_{variable}` collection, or
+        the wide `{metadata}` collection if `variable` is None.
+
+        :param metadata: name of metadata
+        :type metadata: str
+        :param variable: name of variable
+        :type variable: str
+        :return: Collection
+        :rtype: pymongo.collection.Collection
+        """
+        if variable is None:
+            return self.collection(metadata)
+        return self.collection('{}_{}'.format(metadata, variable))
+
+    def close(self):
+        if self._client is not None and self._pid == os.getpid():
+            self._client.close()
+        self._pid = None
+        self._client = None
+        self._collections = dict()
+
+
+class AtlasElasticRegistry(object):
+    def __init__(self, settings=None):
+        """Process-local Elasticsearch client, rebuilt after `fork` like
+        `AtlasMongoRegistry`. The client library is only imported when a
+        client is first needed.
+
+        :param settings: Connection settings, defaults to
+         `constants.ELASTICSEARCH`
+        :type settings: dict
+        """
+        self.settings = settings if settings is not None else ELASTICSEARCH
+        self._pid = None
+        self._client = None
+
+    @property
+    def client(self):
+        """Client for the current process.
+
+        :return: Elasticsearch client
+        :rtype: elasticsearch.Elasticsearch
+        """
+        if self._pid != os.getpid():
+            from elasticsearch import Elasticsearch
+            self._client = Elasticsearch(
+                self.settings['hosts'],
+                request_timeout=self.settings['request_timeout'])
+            self._pid = os.getpid()
+        return self._client
+
+    @staticmethod
+    def index(metadata, variable):
+        """Name of the `{metadata}_{variable}` index, or the wide
+        `{metadata}` index if `variable` is None. Index names must be
+        lower case.
+
+        :param metadata: name of metadata
+        :type metadata: str
+        :param variable: name of variable
+        :type variable: str
+        :return: Index name
+        :rtype: str
+        """
+        if variable is None:
+            return metadata.lower()
+        return '{}_{}'.format(metadata, variable).lower()
+
+    def close(self):
+        if self._client is not None and self._pid == os.getpid():
+            self._client.close()
+        self._pid = None
+        self._client = None
+
+
+registry = AtlasMongoRegistry()
+elastic_registry = AtlasElasticRegistry()
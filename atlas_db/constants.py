@@ -3,31 +3,218 @@ try:
     import configparser
 except ImportError:
     import ConfigParser as configparser
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 
 SCALE = 3
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
-cf = configparser.ConfigParser()
-cf.read(os.path.join(
-    BASE_DIR, 'static', 'config.ini'
-))
+CONFIG_ENV = 'ATLAS_DB_CONFIG'
+
+
+class AtlasConfig(object):
+    def __init__(self, path=None, settings=None):
+        """Configuration read on first use. A value is looked up in
+        `settings`, then in the `ATLAS_DB_{SECTION}_{KEY}` environment
+        variable, then in the config file; missing values fall back to
+        their defaults.
+
+        :param path: Config file, defaults to `$ATLAS_DB_CONFIG` or
+         `static/config.ini`
+        :type path: str
+        :param settings: Values by section and key, e.g.
+         `{'server': {'port': 27018}}`
+        :type settings: dict
+        """
+        self.path = path
+        self.settings = settings or dict()
+        self._parser = None
+
+    @property
+    def parser(self):
+        if self._parser is None:
+            self._parser = configparser.ConfigParser()
+            self._parser.read(self.path or os.environ.get(CONFIG_ENV) or
+                              os.path.join(BASE_DIR, 'static', 'config.ini'))
+        return self._parser
+
+    def get(self, section, key):
+        """Raw value of `key` in `section`, or None if it is not set.
+        """
+        if key in self.settings.get(section, dict()):
+            return self.settings[section][key]
+        env = 'ATLAS_DB_{}_{}'.format(section, key).upper()
+        if env in os.environ:
+            return os.environ[env]
+        if self.parser.has_option(section, key):
+            return self.parser.get(section, key)
+        return None
+
+
+class AtlasSection(Mapping):
+    def __init__(self, build):
+        """Read-only dict of settings, built by `build()` on first access
+        and rebuilt after `configure`.
+
+        :param build: Function returning the settings
+        :type build: function
+        """
+        self._build = build
+        self._values = None
+        _sections.append(self)
+
+    def _load(self):
+        if self._values is None:
+            self._values = self._build()
+        return self._values
+
+    def reset(self):
+        self._values = None
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return repr(self._load())
+
+
+_config = AtlasConfig()
+_sections = list()
+
+
+def configure(path=None, settings=None):
+    """Replace the configuration. Sections are re-read on their next
+    access, so this should run before any client is created.
+
+    :param path: Config file, defaults to `$ATLAS_DB_CONFIG` or
+     `static/config.ini`
+    :type path: str
+    :param settings: Values by section and key, taking precedence over
+     the environment and the file
+    :type settings: dict
+    """
+    global _config
+    _config = AtlasConfig(path, settings)
+    for section in _sections:
+        section.reset()
+
+
+def option(section, key, default=None, cast=str):
+    """Configured value, or `default` if it is missing.
+    """
+    value = _config.get(section, key)
+    if value is None:
+        return default
+    return cast(value)
 
-MONGO = dict(
+
+def write_concern(value):
+    if isinstance(value, int):
+        return value
+    return int(value) if value.isdigit() else value
+
+
+def boolean(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def strings(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def integers(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(int(v) for v in value)
+    return tuple(int(v) for v in strings(value))
+
+
+MONGO = AtlasSection(lambda: dict(
     local=True,
-    user=cf.get('user', 'username'),
-    password=cf.get('user', 'password'),
-    domain=cf.get('server', 'domain'),
-    database=cf.get('server', 'database'),
-    port=int(cf.get('server', 'port')),
-)
-
-ELASTICSEARCH = dict(
-    meta_index=cf.get('elasticsearch', 'meta_index'),
-    meta_type=cf.get('elasticsearch', 'meta_type'),
-)
-
-URI = "mongodb://{}:{}@{}/{}?authMechanism=SCRAM-SHA-1".format(
-    MONGO['user'], MONGO['password'], MONGO['domain'],
-    MONGO['database'])
+    user=option('user', 'username', ''),
+    password=option('user', 'password', ''),
+    domain=option('server', 'domain', 'localhost'),
+    database=option('server', 'database', 'atlas_v2'),
+    port=option('server', 'port', 27017, int),
+    max_pool_size=option('server', 'max_pool_size', 100, int),
+    connect_timeout_ms=option('server', 'connect_timeout_ms', 20000, int),
+    server_selection_timeout_ms=option(
+        'server', 'server_selection_timeout_ms', 30000, int),
+    socket_timeout_ms=option('server', 'socket_timeout_ms', None, int),
+    write_concern=option('server', 'write_concern', 1, write_concern),
+))
+
+INGEST = AtlasSection(lambda: dict(
+    batch_docs=option('ingest', 'batch_docs', 1000, int),
+    batch_bytes=option('ingest', 'batch_bytes', 8 * 1024 * 1024, int),
+    in_flight=option('ingest', 'in_flight', 1, int),
+    max_writers=option('ingest', 'max_writers', 8, int),
+    retries=option('ingest', 'retries', 5, int),
+    backoff=option('ingest', 'backoff', 0.5, float),
+    write_concern=option('ingest', 'write_concern', None, write_concern),
+    slab_bytes=option('ingest', 'slab_bytes', 64 * 1024 * 1024, int),
+    overviews=option('ingest', 'overviews', (), integers),
+    overview_method=option('ingest', 'overview_method', 'mean'),
+    encoding=option('ingest', 'encoding', 'list'),
+    packed_dtype=option('ingest', 'packed_dtype', None),
+    block_size=option('ingest', 'block_size', 0, int),
+))
+
+INDEX = AtlasSection(lambda: dict(
+    kinds=tuple(option('index', 'kinds', ['sphere'], strings)),
+))
+
+EXTRACT = AtlasSection(lambda: dict(
+    batch_size=option('extract', 'batch_size', 1000, int),
+    limit=option('extract', 'limit', 0, int),
+    pixel_budget=option('extract', 'pixel_budget', 262144, int),
+    concurrency=option('extract', 'concurrency', 8, int),
+    points_per_query=option('extract', 'points_per_query', 10000, int),
+))
+
+ELASTICSEARCH = AtlasSection(lambda: dict(
+    hosts=option('elasticsearch', 'hosts', ['http://localhost:9200'],
+                 strings),
+    meta_index=option('elasticsearch', 'meta_index', 'atlas_meta'),
+    meta_type=option('elasticsearch', 'meta_type', 'grid_meta'),
+    request_timeout=option('elasticsearch', 'request_timeout', 60, int),
+    thread_count=option('elasticsearch', 'thread_count', 4, int),
+    chunk_size=option('elasticsearch', 'chunk_size', 500, int),
+    max_chunk_bytes=option('elasticsearch', 'max_chunk_bytes',
+                           100 * 1024 * 1024, int),
+    replicas=option('elasticsearch', 'replicas', 1, int),
+    refresh_interval=option('elasticsearch', 'refresh_interval', '1s'),
+))
+
+METRICS = AtlasSection(lambda: dict(
+    debug=option('metrics', 'debug', False, boolean),
+    log=option('metrics', 'log', ''),
+    profile_dir=option('metrics', 'profile_dir', ''),
+))
+
+
+def uri(settings=None):
+    """Connection string for the Mongo server in `settings`.
+
+    :param settings: Connection settings, defaults to `MONGO`
+    :type settings: dict
+    :return: Mongo URI
+    :rtype: str
+    """
+    settings = settings if settings is not None else MONGO
+    return "mongodb://{}:{}@{}/{}?authMechanism=SCRAM-SHA-1".format(
+        settings['user'], settings['password'], settings['domain'],
+        settings['database'])
@@ -1,7 +1,48 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from atlas_db.constants import EXTRACT
 
 
 class AtlasExtractor(object):
     def __init__(self, *args, **kwargs):
-        pass
+        """Read side of a backend. Subclasses set `grid_db` to the store
+        of the selected variable, `grid` to its global grid (None if not
+        gridded) and `overviews` to its (factor, store, grid) levels.
+        """
+        self.grid_db = None
+        self.grid = None
+        self.overviews = list()
+
+    def level(self, west, south, east, north, budget=None):
+        """Finest pyramid level at which a bounding box covers at most
+        `budget` cells, or the coarsest level if none does.
+
+        :param budget: Target number of pixels, defaults to
+         `EXTRACT['pixel_budget']` (0 to always use the native grid)
+        :type budget: int
+        :return: Factor, store and grid of the level (factor 1 for the
+         native grid)
+        :rtype: tuple
+        """
+        budget = EXTRACT['pixel_budget'] if budget is None else budget
+        native = (1, self.grid_db, self.grid)
+        if not budget or not self.overviews:
+            return native
+        n_cells = self.grid.n_cells(west, south, east, north)
+        for level in [native] + self.overviews:
+            if n_cells <= budget * level[0] ** 2:
+                return level
+        return self.overviews[-1]
+
+    @staticmethod
+    def as_bbox(a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y, ):
+        """(west, south, east, north) if the quadrilateral is an
+        axis-aligned rectangle, otherwise None.
+        """
+        xs = [a_x, b_x, c_x, d_x]
+        ys = [a_y, b_y, c_y, d_y]
+        edges = zip(zip(xs, ys), zip(xs[1:] + xs[:1], ys[1:] + ys[:1]))
+        if len(set(xs)) != 2 or len(set(ys)) != 2 \
+                or any(p[0] != q[0] and p[1] != q[1] for p, q in edges):
+            return None
+        return min(xs), min(ys), max(xs), max(ys)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from atlas_db.clients import registry
+from atlas_db.constants import EXTRACT, uri
+from atlas_db.extractors.mongodb import AtlasMongoExtractor
+
+
+class AtlasAsyncMongoExtractor(object):
+    def __init__(self, concurrency=None, client=None, threads=None):
+        """Asyncio extractor that runs the same viewport query against
+        several `{metadata}_{variable}` collections at once, at most
+        `concurrency` at a time, and hands back each result as soon as it
+        is complete.
+
+        Queries are planned by `AtlasMongoExtractor` and read with an
+        asyncio Mongo driver: PyMongo's `AsyncMongoClient`, or Motor on
+        older PyMongo. Without either, with a client factory set on
+        `registry`, or for block-tiled datasets, the synchronous extractor
+        runs on a thread pool instead.
+
+        :param concurrency: Queries in flight, defaults to
+         `EXTRACT['concurrency']`
+        :type concurrency: int
+        :param client: Asyncio Mongo client to use instead of one built
+         from `registry`'s settings
+        :type client: pymongo.AsyncMongoClient
+        :param threads: Threads for synchronous reads, defaults to
+         `concurrency`
+        :type threads: int
+        """
+        self.concurrency = concurrency or EXTRACT['concurrency']
+        self._client = client
+        self._owns_client = client is None
+        self._executor = ThreadPoolExecutor(threads or self.concurrency)
+        self._extractors = dict()
+
+    @staticmethod
+    def driver():
+        """Asyncio Mongo client class, or None if none is installed.
+        """
+        try:
+            from pymongo import AsyncMongoClient
+            return AsyncMongoClient
+        except ImportError:
+            pass
+        try:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            return AsyncIOMotorClient
+        except ImportError:
+            return None
+
+    @property
+    def client(self):
+        """Asyncio client, built on first use in the running event loop.
+
+        :return: Client, or None to read on threads
+        :rtype: pymongo.AsyncMongoClient
+        """
+        if self._client is None and registry.factory is None:
+            driver = self.driver()
+            if driver is not None:
+                settings = registry.settings
+                if not settings['local']:
+                    self._client = driver(uri(settings), **registry.options)
+                else:
+                    self._client = driver('localhost', settings['port'],
+                                          **registry.options)
+        return self._client
+
+    async def close_client(self):
+        """Close the client this extractor built. It is rebuilt, in the
+        event loop running at the time, on next use.
+        """
+        if self._client is not None and self._owns_client:
+            closing = self._client.close()
+            if inspect.isawaitable(closing):
+                await closing
+            self._client = None
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def clear(self):
+        """Forget the dataset metadata read so far, e.g. after a dataset
+        is re-ingested.
+        """
+        self._extractors = dict()
+
+    @staticmethod
+    def target(target):
+        """(metadata, variable, wide) of a target given as
+        (metadata, variable) or (metadata, variable, wide).
+        """
+        metadata, variable, wide = (tuple(target) + (False, ))[:3]
+        return metadata, variable, wide
+
+    async def extractor(self, metadata, variable, wide=False):
+        """Synchronous extractor for a collection, with its metadata read
+        on a thread the first time it is asked for.
+
+        :return: Extractor
+        :rtype: AtlasMongoExtractor
+        """
+        key = (metadata, variable, wide)
+        if key not in self._extractors:
+            extractor = AtlasMongoExtractor()
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, extractor.set_grid_db, metadata, variable,
+                wide)
+            self._extractors[key] = extractor
+        return self._extractors[key]
+
+    async def quadrilateral(self, metadata, variable, a_x, a_y, b_x, b_y,
+                            c_x, c_y, d_x, d_y, wide=False, limit=None,
+                            budget=None, batch_size=None, select=None):
+        """Documents of one collection within a quadrilateral, as
+        returned by `AtlasMongoExtractor.quadrilateral`.
+
+        :return: List of GeoJSON documents
+        :rtype: list
+        """
+        coords = (a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y)
+        extractor = await self.extractor(metadata, variable, wide)
+        plan = extractor.quadrilateral_plan(*coords, budget=budget)
+        selection = extractor.selection(select)
+        # Selections that need an aggregation are read on a thread.
+        aggregate = selection is not None and extractor.encoding is None \
+            and selection.projection is None
+        if plan is None or aggregate or self.client is None:
+            return await self.read_in_thread(extractor, coords, limit,
+                                             budget, batch_size, select)
+        collection, query = plan
+        return await self.read(extractor, collection.name, query, limit,
+                               batch_size, selection)
+
+    async def read(self, extractor, name, query, limit=None,
+                   batch_size=None, selection=None):
+        """Run `query` on collection `name` with the asyncio client.
+        """
+        db = self.client[registry.settings['database']]
+        cursor = db[name].find(
+            extractor.variable_query(query),
+            projection=extractor.selected_projection(selection),
+            batch_size=batch_size or EXTRACT['batch_size'],
+            limit=EXTRACT['limit'] if limit is None else limit)
+        docs = list()
+        try:
+            async for doc in cursor:
+                docs.append(extractor.decode(doc, selection)
+                            if extractor.encoding is not None else doc)
+        finally:
+            closing = cursor.close()
+            if inspect.isawaitable(closing):
+                await closing
+        return docs
+
+    async def read_in_thread(self, extractor, coords, limit=None,
+                             budget=None, batch_size=None, select=None):
+        """Run `extractor.iter_quadrilateral` on the thread pool. When
+        cancelled, the thread stops at the next document and closes its
+        cursor.
+        """
+        stop = threading.Event()
+
+        def collect():
+            docs = list()
+            for doc in extractor.iter_quadrilateral(
+                    *coords, batch_size=batch_size, limit=limit,
+                    budget=budget, select=select):
+                if stop.is_set():
+                    break
+                docs.append(doc)
+            return docs
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, collect)
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+
+    async def iter_quadrilaterals(self, targets, a_x, a_y, b_x, b_y, c_x,
+                                  c_y, d_x, d_y, limit=None, budget=None,
+                                  batch_size=None, select=None):
+        """Query a quadrilateral in every target collection and yield
+        (target, documents) in the order the queries complete. Closing
+        the generator, or cancelling the task iterating over it (e.g.
+        when the viewport changes), cancels the queries still pending.
+
+        :param targets: (metadata, variable) or (metadata, variable,
+         wide) of each collection
+        :type targets: list
+        :param select: Elements of the values to return, by dimension
+         name, resolved for each target, see `AtlasSelection`
+        :type select: dict
+        :return: Async generator of (target, list of GeoJSON documents)
+        :rtype: async_generator
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(target):
+            metadata, variable, wide = self.target(target)
+            async with semaphore:
+                return target, await self.quadrilateral(
+                    metadata, variable, a_x, a_y, b_x, b_y, c_x, c_y,
+                    d_x, d_y, wide=wide, limit=limit, budget=budget,
+                    batch_size=batch_size, select=select)
+
+        tasks = [asyncio.ensure_future(run(t))
+                 for t in dict.fromkeys(targets)]
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            # Wait for the cancellations, and retrieve every error.
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def quadrilaterals(self, targets, a_x, a_y, b_x, b_y, c_x, c_y, d_x,
+                       d_y, limit=None, budget=None, batch_size=None,
+                       select=None):
+        """Blocking form of `iter_quadrilaterals` for synchronous
+        callers. Runs its own event loop, so it cannot be called from a
+        coroutine.
+
+        :return: List of GeoJSON documents by target
+        :rtype: dict
+        """
+        async def collect():
+            results = dict()
+            try:
+                async for target, docs in self.iter_quadrilaterals(
+                        targets, a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y,
+                        limit=limit, budget=budget, batch_size=batch_size,
+                        select=select):
+                    results[target] = docs
+            finally:
+                await self.close_client()
+            return results
+
+        return asyncio.run(collect())
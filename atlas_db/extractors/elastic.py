@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from atlas_db.clients import elastic_registry
+from atlas_db.constants import ELASTICSEARCH, EXTRACT, SCALE
+from atlas_db.extractors import AtlasExtractor
+from atlas_db.grid import AtlasGrid
+from atlas_db.ingestors.elastic import AtlasElasticDocument
+from atlas_db.ingestors.overviews import AtlasOverview
+
+
+class AtlasElasticExtractor(AtlasExtractor):
+    def __init__(self, *args, **kwargs):
+        """Read side of `AtlasElasticIngestor`, with the query methods of
+        `AtlasMongoExtractor`. Spatial filters run in filter context, so
+        they are cached by Elasticsearch and not scored, and large
+        results are paged with `search_after` on the grid cell number.
+        """
+        super(AtlasElasticExtractor, self).__init__(*args, **kwargs)
+        self.schema = AtlasElasticDocument
+        self.meta_index = ELASTICSEARCH['meta_index']
+        self.scaling = SCALE
+        self.value_field = 'properties.values'
+
+    @property
+    def db(self):
+        return elastic_registry.client
+
+    def set_grid_db(self, metadata, variable, wide=False):
+        """Select the index to query: `{metadata}_{variable}`, or for
+        datasets ingested in wide mode the `{metadata}` index, from which
+        only `variable` is returned.
+
+        :param metadata: name of metadata
+        :type metadata: str
+        :param variable: name of variable
+        :type variable: str
+        :param wide: Dataset was ingested with one document per pixel
+        :type wide: bool
+        """
+        meta = self.db.options(ignore_status=404).get(
+            index=self.meta_index, id=metadata,
+            source_includes=['grid', 'overviews', 'scaling'])
+        meta = meta.get('_source') or dict()
+        self.grid = AtlasGrid.from_dict(meta['grid']) \
+            if 'grid' in meta else None
+        if wide:
+            self.grid_db = elastic_registry.index(metadata, None)
+            self.value_field = 'properties.{}'.format(variable)
+        else:
+            self.grid_db = elastic_registry.index(metadata, variable)
+            self.value_field = 'properties.values'
+        factors = meta.get('overviews', dict()).get('factors')
+        self.overviews = list() if self.grid is None else [
+            (f, AtlasOverview.collection(self.grid_db, f),
+             AtlasOverview.coarsen(self.grid, f))
+            for f in sorted(factors or [])]
+        self.scaling = meta.get('scaling', SCALE)
+
+    @property
+    def source(self):
+        """Fields returned for each pixel.
+
+        :return: `_source` filter
+        :rtype: list
+        """
+        return ['location', self.value_field]
+
+    @staticmethod
+    def bbox_query(west, south, east, north):
+        """Bounding box filter. A box whose east edge is past 180 wraps
+        across the antimeridian.
+
+        :return: Query
+        :rtype: dict
+        """
+        if east > 180.:
+            east -= 360.
+        return {'bool': {'filter': [{'geo_bounding_box': {'location': {
+            'top_left': {'lat': north, 'lon': west},
+            'bottom_right': {'lat': south, 'lon': east}}}}]}}
+
+    @staticmethod
+    def quadrilateral_query(a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y, ):
+        """Polygon filter. `geo_polygon` is deprecated, so this uses the
+        equivalent `geo_shape` filter on the `geo_point` field.
+
+        :return: Query
+        :rtype: dict
+        """
+        return {'bool': {'filter': [{'geo_shape': {'location': {
+            'relation': 'intersects',
+            'shape': {'type': 'polygon', 'coordinates': [
+                [[a_x, a_y], [b_x, b_y],
+                 [c_x, c_y], [d_x, d_y],
+                 [a_x, a_y]]]}}}}]}}
+
+    def quadrilateral(self, a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y,
+                      limit=None, budget=None):
+        """Returns the GeoJSON documents within a quadrilateral
+
+        :return: List of GeoJSON files
+        :rtype: list
+        """
+        return list(self.iter_quadrilateral(
+            a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y, limit=limit,
+            budget=budget))
+
+    def iter_quadrilateral(self, a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y,
+                           batch_size=None, limit=None, budget=None):
+        """Stream the GeoJSON documents within a quadrilateral, one page
+        of `batch_size` hits per search. Axis-aligned rectangles are
+        answered by `iter_bbox`.
+
+        :param batch_size: Hits per page, defaults to
+         `EXTRACT['batch_size']`
+        :type batch_size: int
+        :param limit: Maximum documents to return, defaults to
+         `EXTRACT['limit']` (0 for no limit)
+        :type limit: int
+        :param budget: Target number of pixels, see `level`
+        :type budget: int
+        :return: Generator of GeoJSON documents
+        :rtype: generator
+        """
+        bbox = self.as_bbox(a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y)
+        if bbox is not None:
+            return self.iter_bbox(*bbox, batch_size=batch_size, limit=limit,
+                                  budget=budget)
+        index = self.grid_db
+        if self.grid is not None:
+            xs, ys = [a_x, b_x, c_x, d_x], [a_y, b_y, c_y, d_y]
+            _, index, _ = self.level(min(xs), min(ys), max(xs), max(ys),
+                                     budget)
+        query = self.quadrilateral_query(
+            a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y)
+        return self.iter_query(query, batch_size, limit, index)
+
+    def bbox(self, west, south, east, north, limit=None, budget=None):
+        """Returns the GeoJSON documents within a bounding box
+
+        :return: List of GeoJSON files
+        :rtype: list
+        """
+        return list(self.iter_bbox(west, south, east, north, limit=limit,
+                                   budget=budget))
+
+    def iter_bbox(self, west, south, east, north, batch_size=None,
+                  limit=None, budget=None):
+        """Stream the GeoJSON documents within a bounding box, from the
+        pyramid level chosen by `level`.
+
+        :return: Generator of GeoJSON documents
+        :rtype: generator
+        """
+        index = self.grid_db
+        if self.grid is not None:
+            _, index, _ = self.level(west, south, east, north, budget)
+        return self.iter_query(self.bbox_query(west, south, east, north),
+                               batch_size, limit, index)
+
+    def iter_query(self, query, batch_size=None, limit=None, index=None):
+        """Page through the hits of `query` in cell order with
+        `search_after`, so that deep pages cost the same as the first.
+
+        :return: Generator of GeoJSON documents
+        :rtype: generator
+        """
+        batch_size = batch_size or EXTRACT['batch_size']
+        limit = EXTRACT['limit'] if limit is None else limit
+        after = None
+        n = 0
+        while True:
+            size = batch_size if not limit else min(batch_size, limit - n)
+            body = dict(index=index or self.grid_db, query=query,
+                        source=self.source, sort=[{'cell': 'asc'}],
+                        size=size, track_total_hits=False)
+            if after is not None:
+                body['search_after'] = after
+            hits = self.db.search(**body)['hits']['hits']
+            for hit in hits:
+                yield self.as_geojson(hit['_source'])
+            n += len(hits)
+            if len(hits) < size or n == limit:
+                return
+            after = hits[-1]['sort']
+
+    @staticmethod
+    def as_geojson(source):
+        """Hit `_source` in the layout returned by `AtlasMongoExtractor`.
+        """
+        location = source['location']
+        return {'geometry': {'type': 'Point',
+                             'coordinates': [location['lon'],
+                                             location['lat']]},
+                'properties': source.get('properties', dict())}
@@ -1,35 +1,731 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from pymongo import MongoClient
-from atlas_db.constants import MONGO, URI
+import bson
+import numpy as np
+from atlas_db.clients import registry
+from atlas_db.constants import EXTRACT, SCALE
 from atlas_db.extractors import AtlasExtractor
+from atlas_db.extractors import raw
+from atlas_db.extractors.selection import AtlasSelection
+from atlas_db.grid import AtlasGrid
+from atlas_db.ingestors.encoding import AtlasEncoding
 from atlas_db.ingestors.mongodb import AtlasMongoDocument
+from atlas_db.ingestors.overviews import AtlasOverview
 
 
 class AtlasMongoExtractor(AtlasExtractor):
     def __init__(self, *args, **kwargs):
         super(AtlasMongoExtractor, self).__init__(*args, **kwargs)
-        client = MongoClient(URI) if not MONGO['local'] \
-            else MongoClient('localhost', MONGO['port'])
-        self.db = client[MONGO['database']]
         self.schema = AtlasMongoDocument
-        self.meta_db = self.db['grid_meta']
-        self.grid_db = None
+        self.meta_db = registry.collection('grid_meta')
+        self.encoding = None
+        self.block_size = 0
+        self.scaling = SCALE
+        self.value_field = 'properties.values'
+        self.wide = False
+        self.variable = None
+        self.meta = dict()
 
-    def quadrilateral(self, a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y, ):
+    def set_grid_db(self, metadata, variable, wide=False):
+        """Select the collection to query: `{metadata}_{variable}`, or for
+        datasets ingested in wide mode the `{metadata}` collection, from
+        which only `variable` is projected.
+
+        :param metadata: name of metadata
+        :type metadata: str
+        :param variable: name of variable
+        :type variable: str
+        :param wide: Dataset was ingested with one document per pixel
+        :type wide: bool
+        """
+        meta = self.meta_db.find_one(
+            {'name': metadata},
+            {'grid': True, 'overviews': True, 'variables': True,
+             'dimensions': True, 'block_size': True, 'scaling': True})
+        self.grid = AtlasGrid.from_dict(meta['grid']) \
+            if meta and 'grid' in meta else None
+        self.wide = wide
+        if wide:
+            self.grid_db = registry.grid(metadata, None)
+            self.value_field = 'properties.{}'.format(variable)
+        else:
+            self.grid_db = registry.grid(metadata, variable)
+            self.value_field = 'properties.values'
+        factors = (meta or dict()).get('overviews', dict()).get('factors')
+        self.overviews = list() if self.grid is None else [
+            (f, registry.collection(
+                AtlasOverview.collection(self.grid_db.name, f)),
+             AtlasOverview.coarsen(self.grid, f))
+            for f in sorted(factors or [])]
+        encoding = [v['encoding']
+                    for v in (meta or dict()).get('variables', [])
+                    if v['name'] == variable and 'encoding' in v]
+        self.encoding = AtlasEncoding.from_dict(encoding[0]) \
+            if encoding else None
+        self.block_size = (meta or dict()).get('block_size') or 0
+        self.scaling = (meta or dict()).get('scaling', SCALE)
+        self.variable = variable
+        self.meta = meta or dict()
+
+    def selection(self, select):
+        """Resolve a dimension selection against the metadata of the
+        selected variable; see `AtlasSelection` for the forms it takes.
+
+        :param select: Selection by dimension name
+        :type select: dict
+        :return: Selection, or None when every element is selected
+        :rtype: AtlasSelection
+        """
+        selection = AtlasSelection.from_metadata(self.meta, self.variable,
+                                                 select)
+        if selection is None or selection.full:
+            return None
+        return selection
+
+    def value_shape(self, selection=None):
+        """Shape of the values of one pixel: the sizes of the variable's
+        dimensions, cut down to `selection`.
+
+        :return: Shape, or None if the metadata has no dimensions
+        :rtype: tuple
+        """
+        if selection is not None:
+            return selection.selected_shape
+        try:
+            dimensions = AtlasSelection.variable_dimensions(self.meta,
+                                                            self.variable)
+        except (KeyError, ValueError):
+            return None
+        return tuple(d['size'] for d in dimensions)
+
+    def selected_projection(self, selection=None):
+        """`projection` with the value field cut down to `selection`
+        by `$slice`. Packed values are binaries, which the server cannot
+        slice, so they are cut after decoding instead.
+
+        :return: Projection
+        :rtype: dict
+        """
+        projection = self.projection
+        if selection is not None and self.encoding is None \
+                and selection.projection is not None:
+            projection[self.value_field] = selection.projection
+        return projection
+
+    def pipeline(self, query, selection, limit=None, fields=None):
+        """Aggregation returning the documents matching `query` with
+        only the selected elements of their values, for selections that
+        `$slice` cannot express.
+
+        :param fields: Other fields to project, defaults to the geometry
+        :type fields: dict
+        :return: Pipeline
+        :rtype: list
+        """
+        stages = [{'$match': query}]
+        if limit:
+            stages.append({'$limit': limit})
+        field = '$' + self.value_field
+        parent, key = self.value_field.split('.', 1)
+        project = dict(fields or {'_id': False, 'geometry': True})
+        # Wide documents leave out variables that are null.
+        project[parent] = {key: {'$cond': [
+            {'$isArray': field},
+            selection.expression(self.value_field), '$$REMOVE']}}
+        stages.append({'$project': project})
+        return stages
+
+    @property
+    def projection(self):
+        """Fields returned for each pixel, matching `AtlasMongoDocument`.
+
+        :return: Projection
+        :rtype: dict
+        """
+        return {'_id': False, 'geometry': True, self.value_field: True}
+
+    def variable_query(self, query):
+        """`query` restricted to documents holding the variable. Wide
+        documents leave out variables that are null, so pixels with only
+        other variables would otherwise match.
+
+        :param query: Query
+        :type query: dict
+        :return: Query
+        :rtype: dict
+        """
+        if not self.wide:
+            return query
+        return dict(query, **{self.value_field: {'$exists': True}})
+
+    def bbox_query(self, west, south, east, north, grid=None):
+        """Range query on the grid cell `_id`s covering a bounding box,
+        answered by a B-tree scan of the `_id` index.
+
+        :param grid: Grid of the queried level, defaults to `self.grid`
+        :type grid: AtlasGrid
+        :return: Query
+        :rtype: dict
+        """
+        ranges = (grid or self.grid).cell_ranges(west, south, east, north)
+        if not ranges:
+            # Nothing on the grid falls inside the box.
+            return {'_id': {'$in': []}}
+        clauses = [{'_id': {'$gte': first, '$lte': last}}
+                   for first, last in ranges]
+        return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+    @staticmethod
+    def quadrilateral_query(a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y, ):
+        return {'geometry': {'$geoIntersects': {
+            '$geometry': {'type': 'Polygon', 'coordinates': [
+                [[a_x, a_y], [b_x, b_y],
+                 [c_x, c_y], [d_x, d_y],
+                 [a_x, a_y]]]}}}}
+
+    def quadrilateral(self, a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y,
+                      limit=None, budget=None, select=None):
         """Returns the GeoJSON documents within a quadrilateral
 
         :return: List of GeoJSON files
         :rtype: list
         """
+        return list(self.iter_quadrilateral(
+            a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y, limit=limit,
+            budget=budget, select=select))
+
+    def iter_quadrilateral(self, a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y,
+                           batch_size=None, limit=None, budget=None,
+                           select=None):
+        """Stream the GeoJSON documents within a quadrilateral. Documents
+        are fetched from the server `batch_size` at a time, so memory use
+        stays flat however large the result. Axis-aligned rectangles on
+        gridded datasets are answered by `iter_bbox`. Large areas are read
+        from an overview level, see `level`.
+
+        :param batch_size: Documents per server round trip, defaults to
+         `EXTRACT['batch_size']`
+        :type batch_size: int
+        :param limit: Maximum documents to return, defaults to
+         `EXTRACT['limit']` (0 for no limit)
+        :type limit: int
+        :param budget: Target number of pixels, see `level`
+        :type budget: int
+        :param select: Elements of the values to return, by dimension
+         name, see `AtlasSelection`
+        :type select: dict
+        :return: Generator of GeoJSON documents
+        :rtype: generator
+        """
+        plan = self.quadrilateral_plan(a_x, a_y, b_x, b_y, c_x, c_y,
+                                       d_x, d_y, budget)
+        if plan is not None:
+            collection, query = plan
+            return self.iter_query(query, batch_size, limit, collection,
+                                   select)
+        xs, ys = [a_x, b_x, c_x, d_x], [a_y, b_y, c_y, d_y]
+        if self.as_bbox(a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y) is None:
+            def inside(x, y):
+                return self.contains(xs, ys, x, y)
+        else:
+            inside = None
+        return self.iter_block_pixels(min(xs), min(ys), max(xs), max(ys),
+                                      batch_size, limit, budget, inside,
+                                      select)
+
+    def quadrilateral_plan(self, a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y,
+                           budget=None):
+        """Collection and query that `iter_quadrilateral` reads, or None
+        for block-tiled datasets, whose pixels are cut out of their blocks
+        after the read. Axis-aligned rectangles on gridded datasets use
+        `bbox_plan`.
+
+        :return: Collection and query
+        :rtype: tuple
+        """
+        if self.block_size:
+            return None
+        bbox = self.as_bbox(a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y)
+        if bbox is not None and self.grid is not None:
+            return self.bbox_plan(*bbox, budget=budget)
+        collection = self.grid_db
+        if self.grid is not None:
+            xs, ys = [a_x, b_x, c_x, d_x], [a_y, b_y, c_y, d_y]
+            _, collection, _ = self.level(min(xs), min(ys), max(xs), max(ys),
+                                          budget)
+        return collection, self.quadrilateral_query(
+            a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y)
+
+    def bbox(self, west, south, east, north, limit=None, budget=None,
+             select=None):
+        """Returns the GeoJSON documents within a bounding box
+
+        :return: List of GeoJSON files
+        :rtype: list
+        """
+        return list(self.iter_bbox(west, south, east, north, limit=limit,
+                                   budget=budget, select=select))
+
+    def iter_bbox(self, west, south, east, north, batch_size=None,
+                  limit=None, budget=None, select=None):
+        """Stream the GeoJSON documents whose centroids fall within a
+        bounding box. On gridded datasets this is a range scan over grid
+        cell `_id`s of the pyramid level chosen by `level`; otherwise it
+        falls back to a `$geoIntersects` query.
+
+        :return: Generator of GeoJSON documents
+        :rtype: generator
+        """
+        plan = self.bbox_plan(west, south, east, north, budget)
+        if plan is None:
+            return self.iter_block_pixels(west, south, east, north,
+                                          batch_size, limit, budget,
+                                          select=select)
+        collection, query = plan
+        return self.iter_query(query, batch_size, limit, collection, select)
+
+    def bbox_plan(self, west, south, east, north, budget=None):
+        """Collection and query that `iter_bbox` reads, or None for
+        block-tiled datasets.
+
+        :return: Collection and query
+        :rtype: tuple
+        """
+        if self.block_size:
+            return None
+        if self.grid is None:
+            return self.grid_db, self.quadrilateral_query(
+                west, south, east, south, east, north, west, north)
+        _, collection, grid = self.level(west, south, east, north, budget)
+        return collection, self.bbox_query(west, south, east, north, grid)
+
+    def iter_query(self, query, batch_size=None, limit=None,
+                   collection=None, select=None):
+        """Stream the documents matching `query`. A selection of list
+        values is cut on the server, by `$slice` when the elements are
+        contiguous and by an aggregation otherwise.
+
+        :return: Generator of GeoJSON documents
+        :rtype: generator
+        """
+        collection = collection or self.grid_db
+        batch_size = batch_size or EXTRACT['batch_size']
+        limit = EXTRACT['limit'] if limit is None else limit
+        selection = self.selection(select)
+        query = self.variable_query(query)
+        if selection is not None and self.encoding is None \
+                and selection.projection is None:
+            cursor = collection.aggregate(
+                self.pipeline(query, selection, limit), batchSize=batch_size)
+        else:
+            cursor = collection.find(
+                query,
+                projection=self.selected_projection(selection),
+                batch_size=batch_size,
+                limit=limit)
+        try:
+            for doc in cursor:
+                yield self.decode(doc, selection) \
+                    if self.encoding is not None else doc
+        finally:
+            cursor.close()
+
+    def raster(self, west, south, east, north, budget=None,
+               batch_size=None, select=None):
+        """Dense array of the pixels whose centroids fall within a
+        bounding box, at the pyramid level chosen by `level`. Values are
+        copied into the array straight from raw cursor batches and divided
+        by `10**scaling`; pixels without data are masked.
+
+        :param budget: Target number of pixels, see `level`
+        :type budget: int
+        :param batch_size: Documents per server round trip
+        :type batch_size: int
+        :param select: Elements of the values to return, by dimension
+         name, see `AtlasSelection`
+        :type select: dict
+        :return: Values shaped (lat, lon) followed by the variable's
+         dimensions (e.g. time), latitudes ascending, and the latitude
+         and longitude of each row and column
+        :rtype: tuple
+        """
+        if self.grid is None:
+            raise ValueError('Raster output needs a gridded dataset.')
+        level = self.level(west, south, east, north, budget)
+        grid = level[2]
+        rows = grid.row_range(south, north)
+        cols = grid.col_ranges(west, east)
+        selection = self.selection(select)
+        shape = self.value_shape(selection) or (0, )
+        if rows is None or not cols:
+            return (np.ma.masked_all((0, 0) + shape), np.array([]),
+                    np.array([]))
+        row_idxs = np.arange(rows[0], rows[1] + 1)
+        col_idxs = np.concatenate([np.arange(c0, c1 + 1) for c0, c1 in cols])
+        col_pos = np.full(grid.n_cols, -1, dtype=np.int64)
+        col_pos[col_idxs] = np.arange(len(col_idxs))
+        data = mask = None
+
+        if self.block_size:
+            batches = ((np.ix_(block_rows - rows[0], col_pos[block_cols]),
+                        values) for block_rows, block_cols, values
+                       in self.iter_blocks(west, south, east, north, level,
+                                           batch_size, selection))
+        else:
+            batches = (((cells // grid.n_cols - rows[0],
+                         col_pos[cells % grid.n_cols]), values)
+                       for cells, values in self.iter_raw_values(
+                           self.bbox_query(west, south, east, north, grid),
+                           level[1], batch_size, selection))
+        for index, values in batches:
+            if data is None:
+                shape = (len(row_idxs), len(col_idxs), values.shape[-1])
+                data = np.zeros(shape, dtype=np.float64)
+                mask = np.ones(shape, dtype=bool)
+            data[index] = np.ma.getdata(values)
+            mask[index] = np.ma.getmaskarray(values)
+
+        if data is None:
+            data = np.zeros((len(row_idxs), len(col_idxs)) + shape)
+            mask = np.ones(data.shape, dtype=bool)
+        elif int(np.prod(shape)) == data.shape[2]:
+            data = data.reshape(data.shape[:2] + shape)
+            mask = mask.reshape(data.shape)
+        lons = grid.col_lons(col_idxs)
+        # Keep longitudes increasing across the antimeridian.
+        lons[lons < lons[0]] += 360.
+        return (np.ma.MaskedArray(data / 10**self.scaling, mask=mask),
+                grid.row_lats(row_idxs), lons)
+
+    def points(self, lons, lats, select=None, batch_size=None):
+        """Values at many points at once, e.g. time series at stations.
+        Points are snapped to the nearest full-resolution grid cell and
+        read with `_id` `$in` queries of up to
+        `EXTRACT['points_per_query']` cells (or blocks, for block-tiled
+        datasets), however many points there are.
+
+        :param lons: Longitudes of the points
+        :type lons: np.array
+        :param lats: Latitudes of the points
+        :type lats: np.array
+        :param select: Elements of the values to return, by dimension
+         name, see `AtlasSelection`
+        :type select: dict
+        :param batch_size: Documents per server round trip
+        :type batch_size: int
+        :return: Values shaped (point, n), masked where a point has no
+         data, and the latitude and longitude of each snapped point, NaN
+         for points off the globe (non-finite, or latitude outside
+         [-90, 90])
+        :rtype: tuple
+        """
+        if self.grid is None:
+            raise ValueError('Point lookups need a gridded dataset.')
+        lons, lats = np.broadcast_arrays(
+            np.asarray(lons, dtype=np.float64).ravel(),
+            np.asarray(lats, dtype=np.float64).ravel())
+        grid = self.grid
+        with np.errstate(invalid='ignore'):
+            valid = np.isfinite(lons) & np.isfinite(lats) \
+                & (lats >= -90.) & (lats <= 90.)
+        # Points off the globe are not snapped to any cell.
+        points = np.flatnonzero(valid)
+        n_rows = int(round(180. / grid.res_lat))
+        rows = np.clip(grid.rows(lats[points]), 0, n_rows - 1)
+        cols = grid.cols(lons[points])
+        selection = self.selection(select)
+        if self.block_size:
+            size = self.block_size
+            keys = grid.block_cells(rows // size, cols // size, size)
+        else:
+            keys = grid.cells(rows, cols)
+        # Each cell or block is read once, however many points share it.
+        unique, inverse = np.unique(keys, return_inverse=True)
+        step = EXTRACT['points_per_query']
+        data = mask = None
+
+        for start in range(0, len(unique), step):
+            query = {'_id': {'$in': unique[start:start + step].tolist()}}
+            if self.block_size:
+                batches = self.iter_point_blocks(query, rows, cols, keys,
+                                                 batch_size, selection)
+            else:
+                batches = ((np.searchsorted(unique, cells), values)
+                           for cells, values in self.iter_raw_values(
+                               query, self.grid_db, batch_size, selection))
+            for index, values in batches:
+                if data is None:
+                    # Blocks fill points; cells fill unique cells.
+                    shape = (len(points) if self.block_size
+                             else len(unique), values.shape[-1])
+                    data = np.zeros(shape, dtype=np.float64)
+                    mask = np.ones(shape, dtype=bool)
+                data[index] = np.ma.getdata(values)
+                mask[index] = np.ma.getmaskarray(values)
+
+        if data is None:
+            # Nothing was hit: the values still have their full width.
+            n = int(np.prod(self.value_shape(selection) or (0, )))
+            values = np.ma.masked_all((len(lats), n))
+        else:
+            if not self.block_size:
+                data, mask = data[inverse], mask[inverse]
+            values = np.ma.masked_all((len(lats), data.shape[1]))
+            values[points] = np.ma.MaskedArray(data / 10**self.scaling,
+                                               mask=mask)
+        snapped_lats = np.full(len(lats), np.nan)
+        snapped_lons = np.full(len(lons), np.nan)
+        snapped_lats[points] = grid.row_lats(rows)
+        snapped_lons[points] = grid.col_lons(cols)
+        return values, snapped_lats, snapped_lons
+
+    def iter_point_blocks(self, query, rows, cols, keys, batch_size=None,
+                          selection=None):
+        """Stream the values of points from the blocks matching
+        `query`, for `points`.
+
+        :return: Generator of (point indices, values), with values shaped
+         (point, n)
+        :rtype: generator
+        """
+        size = self.block_size
+        order = np.argsort(keys, kind='mergesort')
+        sorted_keys = keys[order]
         cursor = self.grid_db.find(
-            {'geometry': {'$geoIntersects': {
-                '$geometry': {'type': 'Polygon', 'coordinates': [
-                    [[a_x, a_y], [b_x, b_y],
-                     [c_x, c_y], [d_x, d_y],
-                     [a_x, a_y]]]}}}},
-            projection={'_id': False, 'type': True,
-                        'properties.centroid': True,
-                        'properties.value': True, })
-
-        return list(cursor)
+            query, projection={'_id': True, 'properties': True},
+            batch_size=batch_size or EXTRACT['batch_size'])
+        try:
+            for doc in cursor:
+                index = order[np.searchsorted(sorted_keys, doc['_id']):
+                              np.searchsorted(sorted_keys, doc['_id'],
+                                              side='right')]
+                values = self.encoding.decode_block(
+                    doc['properties']['values'], doc['properties']['mask'],
+                    size)[rows[index] % size, cols[index] % size]
+                if selection is not None:
+                    values = selection.apply(values)
+                yield index, values
+        finally:
+            cursor.close()
+
+    def iter_raw_values(self, query, collection, batch_size=None,
+                        selection=None):
+        """Stream the cell numbers and scaled values of per-pixel
+        documents, one array pair per raw cursor batch. Only `_id` and the
+        value field, cut down to `selection` for list values, are fetched.
+
+        :return: Generator of (cells, values), with values shaped
+         (document, n) and nulls masked
+        :rtype: generator
+        """
+        batch_size = batch_size or EXTRACT['batch_size']
+        query = self.variable_query(query)
+        on_server = selection is not None and self.encoding is None
+        if on_server and selection.projection is None:
+            cursor = collection.aggregate_raw_batches(
+                self.pipeline(query, selection, fields={'_id': True}),
+                batchSize=batch_size)
+        else:
+            projection = {'_id': True, self.value_field: True}
+            if on_server:
+                projection[self.value_field] = selection.projection
+            cursor = collection.find_raw_batches(
+                query, projection=projection, batch_size=batch_size)
+        try:
+            for batch in cursor:
+                cells, values = self.raw_values(batch)
+                if not len(cells):
+                    continue
+                if self.encoding is not None:
+                    values = np.ma.masked_equal(values,
+                                                self.encoding.sentinel)
+                    if selection is not None:
+                        values = selection.apply(values)
+                else:
+                    values = np.ma.masked_invalid(
+                        values.astype(np.float64, copy=False))
+                yield cells, values
+        finally:
+            cursor.close()
+
+    def raw_values(self, batch):
+        """Cell numbers and values of the documents of a raw batch that
+        hold the value field. When every document has the same layout,
+        e.g. packed values of one width or lists without nulls, both are
+        sliced straight out of the buffer; otherwise the batch is decoded.
+
+        :param batch: Raw cursor batch
+        :type batch: bytes
+        :return: Cells, and values shaped (document, n): packed integers,
+         or numbers with NaN for nulls
+        :rtype: tuple
+        """
+        fixed = raw.fixed_layout(batch)
+        if fixed is not None:
+            rows, layout = fixed
+            cells = raw.column(rows, layout, '_id')
+            values = raw.column(
+                rows, layout, self.value_field,
+                self.encoding.dtype if self.encoding is not None else None)
+            if cells is not None and values is not None:
+                return cells.astype(np.int64), values
+        key = self.value_field.split('.', 1)[1]
+        docs = [d for d in bson.decode_all(batch)
+                if key in d.get('properties', ())]
+        cells = np.array([d['_id'] for d in docs], dtype=np.int64)
+        if not docs:
+            return cells, np.zeros((0, 0))
+        if self.encoding is not None:
+            return cells, np.frombuffer(
+                b''.join(d['properties'][key] for d in docs),
+                dtype=self.encoding.dtype).reshape(len(docs), -1)
+        return cells, np.array([d['properties'][key] for d in docs],
+                               dtype=np.float64)
+
+    def iter_blocks(self, west, south, east, north, level, batch_size=None,
+                    selection=None):
+        """Stream the blocks of a block-tiled dataset that intersect a
+        bounding box, cropped to the pixels whose centroids fall inside.
+
+        :param level: Pyramid level to read, as returned by `level`
+        :type level: tuple
+        :param batch_size: Documents per server round trip
+        :type batch_size: int
+        :param selection: Elements of the values to keep
+        :type selection: AtlasSelection
+        :return: Generator of (rows, cols, values), the global rows and
+         columns of the cropped block and its scaled values shaped
+         (row, col, n)
+        :rtype: generator
+        """
+        _, collection, grid = level
+        size = self.block_size
+        ranges = grid.block_ranges(west, south, east, north, size)
+        rows = grid.row_range(south, north)
+        cols = grid.col_ranges(west, east)
+        if not ranges:
+            return
+        clauses = [{'_id': {'$gte': first, '$lte': last}}
+                   for first, last in ranges]
+        cursor = collection.find(
+            clauses[0] if len(clauses) == 1 else {'$or': clauses},
+            projection={'_id': False, 'grid': True, 'properties': True},
+            batch_size=batch_size or EXTRACT['batch_size'])
+        try:
+            for doc in cursor:
+                block_rows = doc['grid']['row'] + np.arange(size)
+                block_cols = doc['grid']['col'] + np.arange(size)
+                row_sel = (block_rows >= rows[0]) & (block_rows <= rows[1])
+                col_sel = np.logical_or.reduce(
+                    [(block_cols >= c0) & (block_cols <= c1)
+                     for c0, c1 in cols])
+                if not row_sel.any() or not col_sel.any():
+                    continue
+                values = self.encoding.decode_block(
+                    doc['properties']['values'], doc['properties']['mask'],
+                    size)
+                values = values[np.ix_(row_sel, col_sel)]
+                if selection is not None:
+                    values = selection.apply(values)
+                yield block_rows[row_sel], block_cols[col_sel], values
+        finally:
+            cursor.close()
+
+    def iter_block_pixels(self, west, south, east, north, batch_size=None,
+                          limit=None, budget=None, inside=None, select=None):
+        """Per-pixel GeoJSON documents of a block-tiled dataset, in the
+        layout of `AtlasMongoDocument.document`. Blocks are binaries, so a
+        selection is cut from the values after they are read.
+
+        :param inside: Called with centroid longitudes and latitudes,
+         returns which pixels to keep
+        :type inside: function
+        :param select: Elements of the values to return, by dimension name
+        :type select: dict
+        :return: Generator of GeoJSON documents
+        :rtype: generator
+        """
+        level = self.level(west, south, east, north, budget)
+        grid = level[2]
+        limit = EXTRACT['limit'] if limit is None else limit
+        selection = self.selection(select)
+        n = 0
+        for rows, cols, values in self.iter_blocks(
+                west, south, east, north, level, batch_size):
+            lats = grid.row_lats(rows)
+            lons = grid.col_lons(cols)
+            # Pixels with any data are kept, as in the per-pixel layouts.
+            valid = ~np.ma.getmaskarray(values).all(axis=2)
+            if selection is not None:
+                values = selection.apply(values)
+            if inside is not None:
+                valid &= inside(lons[np.newaxis, :], lats[:, np.newaxis])
+            for i, j in zip(*np.nonzero(valid)):
+                yield {'geometry': {'type': 'Point',
+                                    'coordinates': [float(lons[j]),
+                                                    float(lats[i])]},
+                       'properties': {'values': values[i, j].tolist()}}
+                n += 1
+                if n == limit:
+                    return
+
+    @staticmethod
+    def contains(xs, ys, x, y):
+        """Planar even-odd test of points (x, y) against a polygon.
+
+        :return: Boolean array broadcast from `x` and `y`
+        :rtype: np.array
+        """
+        x, y = np.broadcast_arrays(x, y)
+        inside = np.zeros(x.shape, dtype=bool)
+        for (x0, y0), (x1, y1) in zip(zip(xs, ys),
+                                      zip(xs[-1:] + xs[:-1],
+                                          ys[-1:] + ys[:-1])):
+            if y0 == y1:
+                continue
+            crosses = (y0 > y) != (y1 > y)
+            x_cross = x0 + (y - y0) * (x1 - x0) / float(y1 - y0)
+            inside ^= crosses & (x < x_cross)
+        return inside
+
+    def decode(self, doc, selection=None):
+        """Unpack the binary values of a document stored with a packed
+        encoding into a list, with None for nulls.
+
+        :param doc: Document as returned by the server
+        :type doc: dict
+        :param selection: Elements of the values to keep
+        :type selection: AtlasSelection
+        :return: Document in the list layout
+        :rtype: dict
+        """
+        properties = doc['properties']
+        key = self.value_field.split('.', 1)[1]
+        if key in properties:
+            values = self.encoding.decode(properties[key])
+            if selection is not None:
+                values = selection.apply(values)
+            properties[key] = values.tolist()
+        return doc
+
+    def iter_quadrilateral_batches(self, a_x, a_y, b_x, b_y, c_x, c_y,
+                                   d_x, d_y, batch_size=None, limit=None,
+                                   budget=None, select=None):
+        """Stream the documents within a quadrilateral as lists of up to
+        `batch_size` documents, e.g. one list per response chunk.
+
+        :return: Generator of lists of GeoJSON documents
+        :rtype: generator
+        """
+        batch_size = batch_size or EXTRACT['batch_size']
+        batch = list()
+        for doc in self.iter_quadrilateral(
+                a_x, a_y, b_x, b_y, c_x, c_y, d_x, d_y,
+                batch_size=batch_size, limit=limit, budget=budget,
+                select=select):
+            batch.append(doc)
+            if len(batch) == batch_size:
+                yield batch
+                batch = list()
+        if batch:
+            yield batch
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import struct
+from collections import OrderedDict
+import numpy as np
+
+
+# Fixed-width numbers: double, int32, int64.
+NUMBERS = {1: '<f8', 16: '<i4', 18: '<i8'}
+BINARY = 5
+DOCUMENTS = (3, 4)
+# Types prefixed by their length: string, JavaScript, symbol.
+STRINGS = (2, 13, 14)
+# Value sizes of the other fixed-width types: undefined, ObjectId, bool,
+# datetime, null, timestamp, decimal128, max key and min key.
+SIZES = {6: 0, 7: 12, 8: 1, 9: 8, 10: 0, 17: 8, 19: 16, 127: 0, 255: 0}
+
+
+def int32(buf, offset):
+    return struct.unpack_from('<i', buf, offset)[0]
+
+
+def leaves(buf, start=0, prefix=''):
+    """Scalar elements of the BSON document at `start` of `buf`, with
+    dotted paths (array elements by index), in storage order. Offsets
+    point at the value, or at the payload of a binary.
+
+    :param buf: Raw BSON
+    :type buf: bytes
+    :param start: Offset of the document
+    :type start: int
+    :param prefix: Path of the document
+    :type prefix: str
+    :return: List of (path, type, offset, size)
+    :rtype: list
+    :raises ValueError: An element type without a fixed layout
+    """
+    out = list()
+    i = start + 4
+    end = start + int32(buf, start) - 1
+    while i < end:
+        kind = struct.unpack_from('<B', buf, i)[0]
+        name_end = buf.index(b'\x00', i + 1)
+        path = prefix + buf[i + 1:name_end].decode('utf-8')
+        i = name_end + 1
+        if kind in DOCUMENTS:
+            out += leaves(buf, i, path + '.')
+            i += int32(buf, i)
+            continue
+        if kind == BINARY:
+            offset, size = i + 5, int32(buf, i)
+        elif kind in NUMBERS:
+            offset, size = i, np.dtype(NUMBERS[kind]).itemsize
+        elif kind in STRINGS:
+            offset, size = i, 4 + int32(buf, i)
+        elif kind in SIZES:
+            offset, size = i, SIZES[kind]
+        else:
+            raise ValueError('Unsupported BSON type {}.'.format(kind))
+        out.append((path, kind, offset, size))
+        i = offset + size
+    return out
+
+
+def fixed_layout(batch):
+    """Documents of a raw cursor batch as rows of bytes, when they all
+    share the layout of the first one: the same field names, types,
+    array lengths and binary sizes. Only numbers and binary payloads may
+    differ, so their columns can be sliced out of the buffer without
+    decoding each document.
+
+    :param batch: Concatenated BSON documents
+    :type batch: bytes
+    :return: Rows shaped (document, byte) and the leaves of the layout
+     by path, or None if the documents differ in layout
+    :rtype: tuple
+    """
+    if not batch:
+        return None
+    size = int32(batch, 0)
+    if len(batch) % size:
+        return None
+    try:
+        layout = leaves(batch)
+    except ValueError:
+        return None
+    rows = np.frombuffer(batch, dtype=np.uint8).reshape(-1, size)
+    fixed = np.ones(size, dtype=bool)
+    for _, kind, offset, n in layout:
+        if kind == BINARY or kind in NUMBERS:
+            fixed[offset:offset + n] = False
+    # Lengths, types and names are all in the fixed bytes.
+    if not (rows[:, fixed] == rows[0, fixed]).all():
+        return None
+    return rows, OrderedDict((path, (kind, offset, n))
+                             for path, kind, offset, n in layout)
+
+
+def column(rows, layout, path, dtype=None):
+    """Values of the field at `path` in every row of `fixed_layout`: a
+    number, a binary read as `dtype`, or an array of numbers of one type.
+
+    :param rows: Documents as rows of bytes
+    :type rows: np.array
+    :param layout: Leaves by path
+    :type layout: dict
+    :param path: Dotted path of the field
+    :type path: str
+    :param dtype: Type of the items of a binary
+    :type dtype: np.dtype
+    :return: Values shaped (document, ) for numbers and (document, n)
+     otherwise, or None if the field is missing or mixes types
+    :rtype: np.array
+    """
+    if path in layout:
+        kind, offset, n = layout[path]
+        if kind in NUMBERS:
+            dtype = NUMBERS[kind]
+        elif kind != BINARY or dtype is None:
+            return None
+        values = np.ascontiguousarray(rows[:, offset:offset + n])
+        return values.view(dtype).reshape(len(rows), -1) \
+            if kind == BINARY else values.view(dtype).ravel()
+    prefix = path + '.'
+    items = [v for p, v in layout.items()
+             if p.startswith(prefix) and '.' not in p[len(prefix):]]
+    kinds = set(kind for kind, _, _ in items)
+    if len(kinds) != 1 or kinds.pop() not in NUMBERS:
+        return None
+    dtype = np.dtype(NUMBERS[items[0][0]])
+    offsets = np.array([offset for _, offset, _ in items])
+    index = offsets[:, None] + np.arange(dtype.itemsize)
+    return np.ascontiguousarray(rows[:, index]).view(dtype).reshape(
+        len(rows), len(items))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+class AtlasSelection(object):
+    def __init__(self, dimensions, select):
+        """Elements of each pixel's values selected along its non-spatial
+        dimensions. Values are stored flattened in C order over the
+        variable's dimensions, e.g. (time, ) or (depth, time).
+
+        Each dimension in `select` takes one of:
+
+        * an index, e.g. `3` or `-1`
+        * an index range, e.g. `(0, 10)` or `slice(0, 10)`
+        * `{'value': v}`, the index whose coordinate is `v`
+        * `{'range': (v0, v1)}`, the indices whose coordinates fall
+          within [v0, v1]
+
+        Dimensions left out are selected whole.
+
+        :param dimensions: `grid_meta` entries of the variable's
+         dimensions, in storage order
+        :type dimensions: list
+        :param select: Selection by dimension name
+        :type select: dict
+        """
+        self.dimensions = dimensions
+        names = [d['name'] for d in dimensions]
+        unknown = set(select) - set(names)
+        if unknown:
+            raise ValueError('Unknown dimensions {}; the variable has '
+                             '{}.'.format(sorted(unknown), names))
+        self.bounds = [self.dimension_bounds(d, select[d['name']])
+                       if d['name'] in select else (0, d['size'])
+                       for d in dimensions]
+
+    @classmethod
+    def from_metadata(cls, metadata, variable, select):
+        """Selection for `variable` of a `grid_meta` document.
+
+        :return: Selection, or None if `select` is empty
+        :rtype: AtlasSelection
+        """
+        if not select:
+            return None
+        return cls(cls.variable_dimensions(metadata, variable), select)
+
+    @staticmethod
+    def variable_dimensions(metadata, variable):
+        """`grid_meta` entries of the dimensions of `variable`, in
+        storage order.
+
+        :return: Dimensions
+        :rtype: list
+        """
+        by_name = {d['name']: d for d in metadata.get('dimensions', [])}
+        names = [v.get('dimensions', []) for v in metadata['variables']
+                 if v['name'] == variable]
+        if not names:
+            raise ValueError('No metadata for variable {}.'.format(variable))
+        return [by_name[n] for n in names[0]]
+
+    @staticmethod
+    def coordinates(dimension):
+        """Coordinate values of a dimension. Metadata written before the
+        values were recorded only has the range, so evenly spaced values
+        are assumed.
+        """
+        if 'values' in dimension:
+            return np.asarray(dimension['values'], dtype=np.float64)
+        if dimension['size'] == 1:
+            return np.array([dimension['min']], dtype=np.float64)
+        return np.linspace(dimension['min'], dimension['max'],
+                           dimension['size'])
+
+    @classmethod
+    def dimension_bounds(cls, dimension, spec):
+        """Index range [start, stop) selected along one dimension.
+
+        :return: Start and stop indices
+        :rtype: tuple
+        """
+        size = dimension['size']
+        if isinstance(spec, dict):
+            coords = cls.coordinates(dimension)
+            if 'value' in spec:
+                i = int(np.argmin(np.abs(coords - spec['value'])))
+                if not np.isclose(coords[i], spec['value'], rtol=1e-9):
+                    raise ValueError('{} is not a value of {}.'.format(
+                        spec['value'], dimension['name']))
+                start, stop = i, i + 1
+            elif 'range' in spec:
+                lo, hi = sorted(spec['range'])
+                idxs = np.flatnonzero((coords >= lo) & (coords <= hi))
+                if not len(idxs):
+                    raise ValueError('No {} values within {}.'.format(
+                        dimension['name'], spec['range']))
+                start, stop = int(idxs.min()), int(idxs.max()) + 1
+            else:
+                raise ValueError('Select a dimension by `value` or '
+                                 '`range`.')
+        elif isinstance(spec, (slice, tuple, list)):
+            spec = spec if isinstance(spec, slice) else slice(*spec)
+            start, stop, step = spec.indices(size)
+            if step != 1:
+                raise ValueError('Only contiguous ranges can be selected.')
+        else:
+            i = int(spec)
+            if not -size <= i < size:
+                raise IndexError('{} index {} out of range.'.format(
+                    dimension['name'], i))
+            start = i % size
+            stop = start + 1
+        if stop <= start:
+            raise ValueError('Empty selection of {}.'.format(
+                dimension['name']))
+        return start, stop
+
+    @property
+    def shape(self):
+        return tuple(d['size'] for d in self.dimensions)
+
+    @property
+    def selected_shape(self):
+        """Shape of the selected elements of one pixel.
+        """
+        return tuple(stop - start for start, stop in self.bounds)
+
+    @property
+    def indices(self):
+        """Positions of the selected elements in the flattened values.
+
+        :return: Flat indices in storage order
+        :rtype: np.array
+        """
+        axes = np.meshgrid(*[np.arange(a, b) for a, b in self.bounds],
+                           indexing='ij')
+        return np.ravel_multi_index([a.ravel() for a in axes], self.shape)
+
+    @property
+    def full(self):
+        return all(b == (0, n) for b, n in zip(self.bounds, self.shape))
+
+    @property
+    def slice(self):
+        """(skip, count) for a `$slice` projection, or None if the
+        selected elements are not contiguous.
+        """
+        idxs = self.indices
+        if idxs[-1] - idxs[0] + 1 != len(idxs):
+            return None
+        return int(idxs[0]), len(idxs)
+
+    @property
+    def projection(self):
+        """Projection operator returning the selection, or None if it
+        needs an aggregation expression.
+        """
+        window = self.slice
+        if window is None:
+            return None
+        return {'$slice': list(window)}
+
+    def expression(self, field):
+        """Aggregation expression picking the selection out of `field`.
+        """
+        return {'$map': {'input': self.indices.tolist(),
+                         'in': {'$arrayElemAt': ['$' + field, '$$this']}}}
+
+    def apply(self, values):
+        """Select from values already read, along their last axis.
+
+        :param values: Values, a list or an array of shape (..., n)
+        :type values: list or np.array
+        :return: Selected values, of the same type
+        """
+        if isinstance(values, list):
+            return [values[i] for i in self.indices]
+        return values[..., self.indices]
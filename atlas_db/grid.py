@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+class AtlasGrid(object):
+    def __init__(self, lats, lons, res_lat=None, res_lon=None,
+                 off_lat=None, off_lon=None):
+        """Global integer indexing of a regular lat/lon grid. Rows count
+        up from -90 and columns from -180 (wrapping at 360), so pixels of
+        different files or tiles at the same resolution get the same
+        indices. Centroids may sit at a constant fraction of a cell from
+        those origins, e.g. half a cell for 89.75, -89.75, ...
+
+        :param lats: Latitudes of the dataset
+        :type lats: np.array
+        :param lons: Longitudes of the dataset
+        :type lons: np.array
+        :param res_lat: Latitude step, if it cannot be inferred from `lats`
+        :type res_lat: float
+        :param res_lon: Longitude step, if it cannot be inferred from `lons`
+        :type res_lon: float
+        :param off_lat: Centroid offset from -90 in cells
+        :type off_lat: float
+        :param off_lon: Centroid offset from -180 in cells
+        :type off_lon: float
+        """
+        self.res_lat = res_lat or self.step(lats)
+        self.res_lon = res_lon or self.step(lons)
+        self.res_lat = self.res_lat or self.res_lon
+        self.res_lon = self.res_lon or self.res_lat
+        if not self.res_lat:
+            raise ValueError('Cannot infer grid resolution.')
+        self.n_cols = int(round(360. / self.res_lon))
+        self.off_lat = self.offset(lats, self.res_lat, 90.) \
+            if off_lat is None else off_lat
+        self.off_lon = self.offset(lons, self.res_lon, 180.) \
+            if off_lon is None else off_lon
+
+    @staticmethod
+    def step(coords):
+        coords = np.ma.getdata(coords)
+        if len(coords) < 2:
+            return None
+        return float(np.median(np.abs(np.diff(coords))))
+
+    @staticmethod
+    def offset(coords, res, origin):
+        coords = np.ma.getdata(coords)
+        if not len(coords):
+            return 0.
+        x = (float(coords[0]) + origin) / res
+        # Rounded so that tiles of one grid agree despite float noise.
+        return float(round(x - np.floor(x), 6) % 1.)
+
+    def rows(self, lats):
+        """Global row index of each latitude.
+
+        :param lats: Latitudes
+        :type lats: np.array
+        :return: Row indices
+        :rtype: np.array
+        """
+        return np.rint((np.ma.getdata(lats) + 90.) / self.res_lat
+                       - self.off_lat).astype(np.int64)
+
+    def cols(self, lons):
+        """Global column index of each longitude.
+
+        :param lons: Longitudes
+        :type lons: np.array
+        :return: Column indices
+        :rtype: np.array
+        """
+        return np.rint(((np.ma.getdata(lons) + 180.) % 360.) / self.res_lon
+                       - self.off_lon).astype(np.int64) % self.n_cols
+
+    def row_lats(self, rows):
+        """Centroid latitude of each global row.
+        """
+        return (np.asarray(rows) + self.off_lat) * self.res_lat - 90.
+
+    def col_lons(self, cols):
+        """Centroid longitude of each global column, in [-180, 180).
+        """
+        return (np.asarray(cols) + self.off_lon) * self.res_lon - 180.
+
+    def cells(self, rows, cols):
+        """Row-major cell number, used as the document `_id`.
+
+        :param rows: Row indices
+        :type rows: np.array
+        :param cols: Column indices
+        :type cols: np.array
+        :return: Cell numbers
+        :rtype: np.array
+        """
+        return rows * self.n_cols + cols
+
+    def check(self, lats, lons):
+        """Make sure every pixel of a dataset gets its own cell, as
+        documents sharing an `_id` would overwrite each other.
+
+        :param lats: Latitudes of the dataset
+        :type lats: np.array
+        :param lons: Longitudes of the dataset
+        :type lons: np.array
+        :raises ValueError: Two latitudes or longitudes share a row or
+         column, e.g. on an irregular grid
+        """
+        for name, idxs in (('latitudes', self.rows(lats)),
+                           ('longitudes', self.cols(lons))):
+            if len(np.unique(idxs)) != len(idxs):
+                raise ValueError(
+                    'Some {} share a grid cell at resolution {} x {}; the '
+                    'grid is not regular.'.format(name, self.res_lat,
+                                                  self.res_lon))
+
+    def check_blocks(self, lats, lons, size):
+        """Make sure a dataset, tile or slab covers whole `size` x `size`
+        blocks, except at the edges of the globe. A block it covers in
+        part would share its `_id` with the block written from the
+        neighbouring tile.
+
+        :param lats: Latitudes of the rows
+        :type lats: np.array
+        :param lons: Longitudes of the columns
+        :type lons: np.array
+        :param size: Rows and columns per block
+        :type size: int
+        :raises ValueError: An edge falls inside a block
+        """
+        n_rows = int(round(180. / self.res_lat))
+        for name, idxs, n in (('latitude', self.rows(lats), n_rows),
+                              ('longitude', self.cols(lons), self.n_cols)):
+            idxs = np.unique(idxs)
+            if not len(idxs):
+                continue
+            # Contiguous runs of rows or columns, e.g. two for a file
+            # that wraps around the antimeridian.
+            breaks = np.flatnonzero(np.diff(idxs) != 1) + 1
+            starts = idxs[np.r_[0, breaks]]
+            stops = idxs[np.r_[breaks - 1, len(idxs) - 1]] + 1
+            for start, stop in zip(starts, stops):
+                if start % size or (stop % size and stop != n):
+                    raise ValueError(
+                        'Blocks of {} cells do not align with the {} '
+                        'edges of the data (cells {} to {}); use a block '
+                        'size that divides them.'.format(
+                            size, name, start, stop))
+
+    def row_range(self, south, north):
+        """Rows whose centroids lie within [south, north].
+
+        :return: First and last row, or None if no row is inside
+        :rtype: tuple
+        """
+        first = max(0, int(np.ceil(
+            (south + 90.) / self.res_lat - self.off_lat - 1e-9)))
+        last = int(np.floor(
+            (north + 90.) / self.res_lat - self.off_lat + 1e-9))
+        return (first, last) if last >= first else None
+
+    def col_ranges(self, west, east):
+        """Column ranges whose centroids lie within [west, east]. A box
+        crossing the antimeridian gives two ranges.
+
+        :return: List of (first, last) columns
+        :rtype: list
+        """
+        first = int(np.ceil(
+            (west + 180.) / self.res_lon - self.off_lon - 1e-9))
+        last = int(np.floor(
+            (east + 180.) / self.res_lon - self.off_lon + 1e-9))
+        if last < first:
+            return []
+        if last - first + 1 >= self.n_cols:
+            return [(0, self.n_cols - 1)]
+        first, last = first % self.n_cols, last % self.n_cols
+        if first <= last:
+            return [(first, last)]
+        return [(first, self.n_cols - 1), (0, last)]
+
+    def cell_ranges(self, west, south, east, north):
+        """Inclusive ranges of cell numbers covering a bounding box, one
+        per row and column range, merged into a single range when the box
+        spans the full width.
+
+        :return: List of (first, last) cells
+        :rtype: list
+        """
+        rows = self.row_range(south, north)
+        cols = self.col_ranges(west, east)
+        if rows is None or not cols:
+            return []
+        if cols == [(0, self.n_cols - 1)]:
+            return [(int(self.cells(rows[0], 0)),
+                     int(self.cells(rows[1], self.n_cols - 1)))]
+        return [(int(self.cells(r, c0)), int(self.cells(r, c1)))
+                for r in range(rows[0], rows[1] + 1) for c0, c1 in cols]
+
+    def n_cells(self, west, south, east, north):
+        """Number of grid cells whose centroids lie within a bounding box.
+
+        :return: Cell count
+        :rtype: int
+        """
+        rows = self.row_range(south, north)
+        if rows is None:
+            return 0
+        return (rows[1] - rows[0] + 1) * sum(
+            c1 - c0 + 1 for c0, c1 in self.col_ranges(west, east))
+
+    def blocks(self, values, lats, lons, size):
+        """Scatter a (lat, lon, ...) array into `size` x `size` blocks of
+        global rows and columns, masking cells the array does not cover.
+
+        :param values: n-d (masked) array, latitude first, longitude second
+        :type values: np.ma.MaskedArray
+        :param lats: Latitudes of the array's rows
+        :type lats: np.array
+        :param lons: Longitudes of the array's columns
+        :type lons: np.array
+        :param size: Rows and columns per block
+        :type size: int
+        :return: Blocks shaped (block row, row in block, block column,
+         column in block, n), and the block rows and columns they cover
+        :rtype: tuple
+        """
+        values = np.ma.asarray(values)
+        values = values.reshape(values.shape[:2] + (-1, ))
+        rows = self.rows(lats)
+        cols = self.cols(lons)
+        block_rows, row_idxs = np.unique(rows // size, return_inverse=True)
+        block_cols, col_idxs = np.unique(cols // size, return_inverse=True)
+        shape = (len(block_rows), size, len(block_cols), size,
+                 values.shape[2])
+        data = np.zeros(shape, dtype=values.dtype)
+        mask = np.ones(shape, dtype=bool)
+        index = (row_idxs[:, None], (rows % size)[:, None],
+                 col_idxs[None, :], (cols % size)[None, :])
+        data[index] = np.ma.getdata(values)
+        mask[index] = np.ma.getmaskarray(values)
+        return np.ma.MaskedArray(data, mask=mask), block_rows, block_cols
+
+    def block_cells(self, block_rows, block_cols, size):
+        """Row-major block number, used as the `_id` of block documents.
+        """
+        return block_rows * -(-self.n_cols // size) + block_cols
+
+    def block_ranges(self, west, south, east, north, size):
+        """Inclusive ranges of block numbers covering a bounding box.
+
+        :return: List of (first, last) blocks
+        :rtype: list
+        """
+        rows = self.row_range(south, north)
+        cols = self.col_ranges(west, east)
+        if rows is None or not cols:
+            return []
+        n_blocks = -(-self.n_cols // size)
+        if cols == [(0, self.n_cols - 1)]:
+            return [(int(self.block_cells(rows[0] // size, 0, size)),
+                     int(self.block_cells(rows[1] // size, n_blocks - 1,
+                                          size)))]
+        return [(int(self.block_cells(r, c0 // size, size)),
+                 int(self.block_cells(r, c1 // size, size)))
+                for r in range(rows[0] // size, rows[1] // size + 1)
+                for c0, c1 in cols]
+
+    def block_bounds(self, block_row, block_col, size):
+        """Outer cell edges of a block, clipped to the globe.
+
+        :return: (west, south, east, north)
+        :rtype: tuple
+        """
+        south = (block_row * size + self.off_lat - .5) * self.res_lat - 90.
+        west = (block_col * size + self.off_lon - .5) * self.res_lon - 180.
+        return (max(-180., west), max(-90., south),
+                min(180., west + size * self.res_lon),
+                min(90., south + size * self.res_lat))
+
+    @property
+    def as_dict(self):
+        return {'res_lat': self.res_lat,
+                'res_lon': self.res_lon,
+                'off_lat': self.off_lat,
+                'off_lon': self.off_lon,
+                'n_cols': self.n_cols,
+                }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls([], [], d['res_lat'], d['res_lon'],
+                   d.get('off_lat', 0.), d.get('off_lon', 0.))
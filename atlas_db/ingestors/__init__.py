@@ -1,11 +1,27 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import numpy as np
+from atlas_db.grid import AtlasGrid
+from atlas_db.ingestors.checkpoint import AtlasCheckpoint
+from atlas_db.metrics import metrics
 
 
 class AtlasIngestor(object):
     def __init__(self, scaling, *args, **kwargs):
         self.scaling = scaling
+        self.checkpoint = AtlasCheckpoint()
+
+    def stored_encodings(self, metadata):
+        """Encodings of the variables of a dataset already ingested, as
+        recorded in its metadata. Backends without packed encodings have
+        none.
+
+        :param metadata: name of metadata
+        :type metadata: str
+        :return: `AtlasEncoding.as_dict` by variable name
+        :rtype: dict
+        """
+        return dict()
 
     @staticmethod
     def num_or_null(arr):
@@ -37,9 +53,218 @@ class AtlasSchema(object):
         self.value = [None if np.isnan(x) else int(x * 10**scaling)
                       for x in value]
 
+    @staticmethod
+    def document(x, y, properties, key=None):
+        """Build the stored representation of a single pixel. Subclasses
+        override this rather than `__geo_interface__` so that the
+        per-pixel and batched paths share one layout.
+
+        :param x: Longitude of pixel centroid
+        :type x: float
+        :param y: Latitude of pixel centroid
+        :type y: float
+        :param properties: Scaled values, with None for nulls, keyed by
+         `values` or, for wide documents, by variable name
+        :type properties: dict
+        :param key: Global (row, column, cell) of the pixel
+        :type key: tuple
+        :return: Stored document
+        :rtype: dict
+        """
+        return dict()
+
+    @staticmethod
+    def block_document(bounds, properties, key, size):
+        """Build the stored representation of a block of pixels.
+
+        :param bounds: (west, south, east, north) edges of the block
+        :type bounds: tuple
+        :param properties: Packed `values` and validity `mask`
+        :type properties: dict
+        :param key: Global (row, column) of the block's first pixel and
+         the block number
+        :type key: tuple
+        :param size: Rows and columns per block
+        :type size: int
+        :return: Stored document
+        :rtype: dict
+        """
+        return dict()
+
+    @staticmethod
+    def scale_grid(values, scaling):
+        """Vectorized equivalent of the per-pixel scaling in `__init__`
+        for a whole (lat, lon, ...) block of values.
+
+        :param values: n-d (masked) array, latitude first, longitude second
+        :type values: np.ma.MaskedArray
+        :param scaling: Number of decimal places to keep
+        :type scaling: int
+        :return: Valid pixel mask (lat, lon), scaled integers and null mask,
+         both flattened to (lat, lon, n)
+        :rtype: tuple
+        """
+        values = np.ma.asarray(values)
+        values = values.reshape(values.shape[:2] + (-1, ))
+        mask = np.ma.getmaskarray(values)
+        data = np.ma.getdata(values)
+        nulls = mask | np.isnan(data)
+        scaled = np.trunc(
+            np.where(nulls, 0., data.astype(np.float64)) * 10**scaling)
+        if data.dtype != np.float64 and mask.any():
+            # `num_or_null` keeps the native dtype for partially masked
+            # pixels, so scale those in that precision too.
+            partial = mask.any(axis=2)[..., np.newaxis]
+            scaled = np.where(
+                partial, np.trunc(np.where(nulls, 0, data) * 10**scaling),
+                scaled)
+        return ~mask.all(axis=2), scaled.astype(np.int64), nulls
+
+    @classmethod
+    def documents(cls, values, lats, lons, scaling, grid=None,
+                  encoding=None):
+        """Yield one document per valid pixel of a (lat, lon, ...) block.
+        Masking, scaling and coordinate lookup run in NumPy over the whole
+        block; only the final documents are built in Python.
+
+        :param values: n-d (masked) array, latitude first, longitude second
+        :type values: np.ma.MaskedArray
+        :param lats: Latitudes of the block's rows
+        :type lats: np.array
+        :param lons: Longitudes of the block's columns
+        :type lons: np.array
+        :param scaling: Number of decimal places to keep
+        :type scaling: int
+        :param grid: Global grid indexing, inferred from lats/lons if None
+        :type grid: AtlasGrid
+        :param encoding: Store values packed, instead of as lists
+        :type encoding: AtlasEncoding
+        :return: Generator of documents
+        :rtype: generator
+        """
+        valid, scaled, nulls = cls.scale_grid(values, scaling)
+        lat_idxs, lon_idxs = np.nonzero(valid)
+        metrics.count('null_pixels', valid.size - len(lat_idxs))
+        ys = np.ma.getdata(lats)[lat_idxs].tolist()
+        xs = np.ma.getdata(lons)[lon_idxs].tolist()
+        rows = cls.scaled_lists(scaled, nulls, lat_idxs, lon_idxs, encoding)
+        keys = cls.keys(grid or AtlasGrid(lats, lons), lats, lons,
+                        lat_idxs, lon_idxs)
+        for x, y, value, key in zip(xs, ys, rows, keys):
+            yield cls.document(x, y, {'values': value}, key)
+
+    @classmethod
+    def wide_documents(cls, values, lats, lons, scaling, grid=None,
+                       encoding=None):
+        """Yield one document per pixel that is valid in any variable,
+        with each variable's values under its own name in `properties`.
+        Variables that are null at a pixel are left out of its document.
+
+        :param values: (variable, n-d array) pairs sharing lat/lon axes
+        :type values: list
+        :param lats: Latitudes of the block's rows
+        :type lats: np.array
+        :param lons: Longitudes of the block's columns
+        :type lons: np.array
+        :param scaling: Number of decimal places to keep
+        :type scaling: int
+        :param grid: Global grid indexing, inferred from lats/lons if None
+        :type grid: AtlasGrid
+        :param encoding: Packed encoding by variable name, for variables
+         that are not stored as lists
+        :type encoding: dict
+        :return: Generator of documents
+        :rtype: generator
+        """
+        encoding = encoding or dict()
+        grids = [(v, cls.scale_grid(arr, scaling)) for v, arr in values]
+        valid = np.logical_or.reduce([g[0] for v, g in grids])
+        lat_idxs, lon_idxs = np.nonzero(valid)
+        metrics.count('null_pixels', valid.size - len(lat_idxs))
+        ys = np.ma.getdata(lats)[lat_idxs].tolist()
+        xs = np.ma.getdata(lons)[lon_idxs].tolist()
+        columns = [(v, cls.scaled_lists(scaled, nulls, lat_idxs, lon_idxs,
+                                        encoding.get(v)),
+                    var_valid[lat_idxs, lon_idxs].tolist())
+                   for v, (var_valid, scaled, nulls) in grids]
+        keys = cls.keys(grid or AtlasGrid(lats, lons), lats, lons,
+                        lat_idxs, lon_idxs)
+        for i, (x, y, key) in enumerate(zip(xs, ys, keys)):
+            yield cls.document(x, y, {v: rows[i]
+                                      for v, rows, ok in columns if ok[i]},
+                               key)
+
+    @classmethod
+    def block_documents(cls, values, lats, lons, scaling, size, encoding,
+                        grid=None):
+        """Yield one document per `size` x `size` block of global grid
+        cells that has any valid pixel in a (lat, lon, ...) block of
+        values. Blocks are keyed on the global grid, so slabs (and tiles)
+        must be split on multiples of `size` rows and columns for each
+        block to be written whole; see `AtlasGrid.check_blocks`.
+
+        :param values: n-d (masked) array, latitude first, longitude second
+        :type values: np.ma.MaskedArray
+        :param lats: Latitudes of the block's rows
+        :type lats: np.array
+        :param lons: Longitudes of the block's columns
+        :type lons: np.array
+        :param scaling: Number of decimal places to keep
+        :type scaling: int
+        :param size: Rows and columns per block
+        :type size: int
+        :param encoding: Encoding of the packed values
+        :type encoding: AtlasEncoding
+        :param grid: Global grid indexing, inferred from lats/lons if None
+        :type grid: AtlasGrid
+        :return: Generator of documents
+        :rtype: generator
+        """
+        grid = grid or AtlasGrid(lats, lons)
+        grid.check_blocks(lats, lons, size)
+        blocks, block_rows, block_cols = grid.blocks(values, lats, lons, size)
+        n_rows, _, n_cols, _, n = blocks.shape
+        blocks = blocks.transpose(0, 2, 1, 3, 4).reshape(
+            n_rows * n_cols, size * size, n)
+        valid, scaled, nulls = cls.scale_grid(blocks, scaling)
+        blobs, masks = encoding.block_blobs(scaled, nulls)
+        rows = np.repeat(block_rows, n_cols)
+        cols = np.tile(block_cols, n_rows)
+        cells = grid.block_cells(rows, cols, size)
+        present = np.flatnonzero(valid.any(axis=1))
+        metrics.count('null_blocks', len(valid) - len(present))
+        for i in present:
+            key = (int(rows[i]) * size, int(cols[i]) * size, int(cells[i]))
+            yield cls.block_document(
+                grid.block_bounds(rows[i], cols[i], size),
+                {'values': blobs[i], 'mask': masks[i]}, key, size)
+
+    @staticmethod
+    def keys(grid, lats, lons, lat_idxs, lon_idxs):
+        """Global (row, column, cell) of each selected pixel.
+        """
+        rows = grid.rows(lats)[lat_idxs]
+        cols = grid.cols(lons)[lon_idxs]
+        return zip(rows.tolist(), cols.tolist(),
+                   grid.cells(rows, cols).tolist())
+
+    @staticmethod
+    def scaled_lists(scaled, nulls, lat_idxs, lon_idxs, encoding=None):
+        """Per-pixel value lists from the output of `scale_grid`, with
+        None in place of nulls, or binaries packed by `encoding`.
+        """
+        if encoding is not None:
+            return encoding.blobs(scaled, nulls, lat_idxs, lon_idxs)
+        rows = scaled[lat_idxs, lon_idxs].tolist()
+        row_nulls = nulls[lat_idxs, lon_idxs]
+        for i in np.flatnonzero(row_nulls.any(axis=1)):
+            rows[i] = [None if null else v
+                       for v, null in zip(rows[i], row_nulls[i])]
+        return rows
+
     @property
     def __geo_interface__(self):
-        return dict()
+        return self.document(self.x, self.y, {'values': self.value})
 
     @property
     def as_dict(self):
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+from atlas_db.constants import INGEST
+from atlas_db.metrics import metrics
+try:
+    from bson import encode
+except ImportError:
+    from bson import BSON
+    encode = BSON.encode
+
+
+DUPLICATE_KEY = 11000
+
+
+class AtlasBulkWriter(object):
+    def __init__(self, collection, batch_docs=None, batch_bytes=None,
+                 in_flight=None, retries=None, backoff=None,
+                 write_concern=None, upsert=False):
+        """Buffer documents and write them to Mongo with unordered
+        `insert_many` calls. A batch is flushed when it reaches either
+        `batch_docs` documents or `batch_bytes` of encoded BSON. With
+        `in_flight` > 0 batches are written on a background thread and
+        `append` blocks once that many batches are queued. Defaults come
+        from `constants.INGEST`.
+
+        Inserting a document whose `_id` already exists is an error,
+        except in a retried batch, whose earlier attempt may have landed.
+        With `upsert` set, documents replace those with the same `_id`
+        instead, e.g. when data is ingested again.
+
+        :param collection: Target collection
+        :type collection: pymongo.collection.Collection
+        :param batch_docs: Maximum documents per batch
+        :type batch_docs: int
+        :param batch_bytes: Maximum encoded bytes per batch
+        :type batch_bytes: int
+        :param in_flight: Batches queued for the writer thread, 0 to write
+         synchronously
+        :type in_flight: int
+        :param retries: Attempts for transient errors before giving up
+        :type retries: int
+        :param backoff: Initial retry delay in seconds, doubled each retry
+        :type backoff: float
+        :param write_concern: `w` option for the writes
+        :type write_concern: int or str
+        :param upsert: Replace documents that already exist
+        :type upsert: bool
+        """
+        def default(value, key):
+            return INGEST[key] if value is None else value
+
+        write_concern = default(write_concern, 'write_concern')
+        if write_concern is not None:
+            # pymongo is only imported once there is something to write,
+            # so that importing the ingestors stays cheap.
+            from pymongo.write_concern import WriteConcern
+            collection = collection.with_options(
+                write_concern=WriteConcern(w=write_concern))
+        self.collection = collection
+        self.batch_docs = default(batch_docs, 'batch_docs')
+        self.batch_bytes = default(batch_bytes, 'batch_bytes')
+        self.in_flight = default(in_flight, 'in_flight')
+        self.retries = default(retries, 'retries')
+        self.backoff = default(backoff, 'backoff')
+        self.upsert = upsert
+        self.stats = dict(docs=0, bytes=0, batches=0, retries=0,
+                          duplicates=0, seconds=0.)
+        self._docs = list()
+        self._bytes = 0
+        self._error = None
+        self._queue = None
+        self._thread = None
+        self._start = time.time()
+        if self.in_flight > 0:
+            self._queue = queue.Queue(maxsize=self.in_flight)
+            self._thread = threading.Thread(target=self._drain)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except Exception:
+            if exc_type is None:
+                raise
+
+    @property
+    def docs_per_second(self):
+        """Documents written per second since the writer was created.
+
+        :return: Achieved write rate
+        :rtype: float
+        """
+        elapsed = self.stats['seconds'] or time.time() - self._start
+        return self.stats['docs'] / elapsed if elapsed else 0.
+
+    def append(self, doc):
+        """Add a document, flushing the current batch first if the
+        document would push it over `batch_bytes`.
+
+        :param doc: Document to insert
+        :type doc: dict
+        """
+        self._raise()
+        if '_id' not in doc:
+            # Client-side ids make retried batches idempotent.
+            doc['_id'] = ObjectId()
+        with metrics.stage('encode'):
+            raw = RawBSONDocument(encode(doc))
+        size = len(raw.raw)
+        if self._docs and self._bytes + size > self.batch_bytes:
+            self.flush()
+        self._docs.append(raw)
+        self._bytes += size
+        if len(self._docs) >= self.batch_docs:
+            self.flush()
+
+    def extend(self, docs):
+        for doc in docs:
+            self.append(doc)
+
+    def flush(self):
+        """Send the current batch to Mongo, or to the writer thread."""
+        if not self._docs:
+            return
+        batch = (self._docs, self._bytes)
+        self._docs = list()
+        self._bytes = 0
+        if self._queue is None:
+            self._write(batch)
+        else:
+            self._queue.put(batch)
+        self._raise()
+
+    def close(self):
+        """Flush the final batch and wait for pending writes.
+
+        :return: Write statistics
+        :rtype: dict
+        """
+        try:
+            self.flush()
+        finally:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            self.stats['seconds'] = time.time() - self._start
+        self._raise()
+        return self.stats
+
+    def _drain(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                self._error = e
+
+    def _write(self, batch):
+        from pymongo.errors import (AutoReconnect, BulkWriteError,
+                                    WTimeoutError)
+        docs, size = batch
+        attempt = 0
+        start = time.time()
+        while True:
+            try:
+                written = self._send(docs)
+                break
+            except BulkWriteError as e:
+                # Documents that landed before a retried failure come back
+                # as duplicate keys. Anywhere else a duplicate key means
+                # two documents were given the same `_id`.
+                errors = e.details['writeErrors']
+                if not attempt or self.upsert \
+                        or any(err['code'] != DUPLICATE_KEY
+                               for err in errors) \
+                        or e.details.get('writeConcernErrors'):
+                    raise
+                written = e.details['nInserted']
+                self.stats['duplicates'] += len(errors)
+                metrics.count('duplicates', len(errors))
+                break
+            except (AutoReconnect, WTimeoutError):
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                self.stats['retries'] += 1
+                metrics.count('retries')
+        metrics.add_time('write', time.time() - start)
+        self.stats['docs'] += written
+        self.stats['bytes'] += size
+        self.stats['batches'] += 1
+        metrics.count('docs', written)
+        metrics.count('bytes', size)
+        metrics.count('batches')
+
+    def _send(self, docs):
+        """Write one batch.
+
+        :return: Documents inserted or replaced
+        :rtype: int
+        """
+        if not self.upsert:
+            self.collection.insert_many(docs, ordered=False)
+            return len(docs)
+        from pymongo import ReplaceOne
+        result = self.collection.bulk_write(
+            [ReplaceOne({'_id': doc['_id']}, doc, upsert=True)
+             for doc in docs], ordered=False)
+        return result.upserted_count + result.matched_count
+
+    def _raise(self):
+        if self._error is not None:
+            raise self._error
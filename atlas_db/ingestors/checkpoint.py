@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+from datetime import datetime
+
+
+class AtlasCheckpoint(object):
+    def __init__(self, *args, **kwargs):
+        """Progress of ingestion runs, as one record per completed unit
+        of work, keyed by (dataset, variable, unit). Units are latitude
+        bands of a file or whole GSDE tiles. This base class keeps records
+        in memory only.
+        """
+        self._records = dict()
+
+    @staticmethod
+    def key(dataset, variable, unit):
+        return '{}/{}/{}'.format(dataset, variable or '*', unit)
+
+    def get(self, dataset, variable, unit):
+        """Record of a completed unit.
+
+        :param dataset: `name` attribute from metadata
+        :type dataset: str
+        :param variable: Variable name, or None for wide and tile units
+        :type variable: str
+        :param unit: Unit of work
+        :type unit: str
+        :return: Stored record, or None if the unit is not complete
+        :rtype: dict
+        """
+        return self._records.get(self.key(dataset, variable, unit))
+
+    def mark(self, dataset, variable, unit, stats=None):
+        """Record a unit as complete.
+
+        :param dataset: `name` attribute from metadata
+        :type dataset: str
+        :param variable: Variable name, or None for wide and tile units
+        :type variable: str
+        :param unit: Unit of work
+        :type unit: str
+        :param stats: `AtlasStatistics.state` of the unit, by variable
+        :type stats: dict
+        """
+        self._records[self.key(dataset, variable, unit)] = self.record(
+            dataset, variable, unit, stats)
+
+    def clear(self, dataset):
+        prefix = '{}/'.format(dataset)
+        self._records = {k: v for k, v in self._records.items()
+                         if not k.startswith(prefix)}
+
+    def record(self, dataset, variable, unit, stats):
+        return {'_id': self.key(dataset, variable, unit),
+                'dataset': dataset,
+                'variable': variable,
+                'unit': unit,
+                'stats': stats or dict(),
+                'date_completed': datetime.now().isoformat(),
+                }
+
+
+class AtlasFileCheckpoint(AtlasCheckpoint):
+    def __init__(self, path, *args, **kwargs):
+        """Checkpoint kept in a local JSON-lines file, appended to as
+        units complete.
+
+        :param path: Path of the checkpoint file
+        :type path: str
+        """
+        super(AtlasFileCheckpoint, self).__init__(*args, **kwargs)
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._records[record['_id']] = record
+
+    def mark(self, dataset, variable, unit, stats=None):
+        super(AtlasFileCheckpoint, self).mark(dataset, variable, unit, stats)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.get(dataset, variable, unit)) + '\n')
+
+    def clear(self, dataset):
+        super(AtlasFileCheckpoint, self).clear(dataset)
+        with open(self.path, 'w') as f:
+            for record in self._records.values():
+                f.write(json.dumps(record) + '\n')
+
+
+class AtlasMongoCheckpoint(AtlasCheckpoint):
+    def __init__(self, collection, *args, **kwargs):
+        """Checkpoint kept in a Mongo collection.
+
+        :param collection: Checkpoint collection
+        :type collection: pymongo.collection.Collection
+        """
+        super(AtlasMongoCheckpoint, self).__init__(*args, **kwargs)
+        self.collection = collection
+
+    def get(self, dataset, variable, unit):
+        return self.collection.find_one(
+            {'_id': self.key(dataset, variable, unit)})
+
+    def mark(self, dataset, variable, unit, stats=None):
+        record = self.record(dataset, variable, unit, stats)
+        self.collection.replace_one({'_id': record['_id']}, record,
+                                    upsert=True)
+
+    def clear(self, dataset):
+        self.collection.delete_many({'dataset': dataset})
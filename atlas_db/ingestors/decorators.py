@@ -1,39 +1,59 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import sys
+import time
 from datetime import datetime
-from pymongo.errors import PyMongoError
-from config import DEBUG
+from functools import wraps
+from atlas_db.constants import METRICS
+from atlas_db.metrics import metrics
 
 
-def mongo_ingestion(name):
+def mongo_ingestion(name, profile=False):
+    """Record calls to an ingestion step in `metrics` as the stage
+    `name.lower()` and log them. Failed calls are logged as `error`
+    events and re-raised. Start and end times are printed when
+    `METRICS['debug']` is set.
+
+    :param name: Step name
+    :type name: str
+    :param profile: Run calls under cProfile when
+     `metrics.profile_dir` is set
+    :type profile: bool
+    """
 
     def decorator(f):
 
+        @wraps(f)
         def wrapper(*args, **kwargs):
 
-            start_time = datetime.now()
+            start_time = time.time()
 
-            if DEBUG:
-                print('*** Start {} ***\n{}\n\n'.format(name, start_time))
+            if METRICS['debug']:
+                print('*** Start {} ***\n{}\n\n'.format(
+                    name, datetime.fromtimestamp(start_time)))
 
             try:
-                f(*args, **kwargs)
-
-            except PyMongoError:
-                print('Error while committing on MongoDB')
-                raise
-            except:
-                print('Unexpected error:', sys.exc_info()[0])
+                if profile:
+                    result = metrics.profiled(f.__name__, f, *args, **kwargs)
+                else:
+                    result = f(*args, **kwargs)
+
+            except Exception as e:
+                metrics.log('error', stage=name.lower(),
+                            function=f.__name__,
+                            error=type(e).__name__, message=str(e),
+                            seconds=time.time() - start_time)
                 raise
 
-            end_time = datetime.now()
+            elapsed = time.time() - start_time
+            metrics.add_time(name.lower(), elapsed)
+            metrics.log(name.lower(), function=f.__name__, seconds=elapsed)
 
-            if DEBUG:
-                print('\n*** End {} ***\n{}\n'.format(name, end_time))
+            if METRICS['debug']:
+                print('\n*** End {} ***\n{}\n'.format(
+                    name, datetime.now()))
+                print('\n*** Elapsed ***\n{:.3f}s\n'.format(elapsed))
 
-            elapsed_time = end_time - start_time
-            print('\n*** Elapsed ***\n{}\n'.format(elapsed_time))
+            return result
 
         return wrapper
 
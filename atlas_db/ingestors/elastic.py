@@ -1,120 +1,340 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import sys
-import multiprocessing as mp
-import numpy as np
-from elasticsearch import Elasticsearch
+import time
+from atlas_db.clients import elastic_registry
+from atlas_db.constants import ELASTICSEARCH, METRICS
 from atlas_db.ingestors import AtlasIngestor, AtlasSchema
 from atlas_db.ingestors.decorators import mongo_ingestion
+from atlas_db.metrics import metrics
+
+
+MAPPING = {
+    'properties': {
+        'location': {'type': 'geo_point'},
+        'cell': {'type': 'long'},
+        'grid': {'properties': {'row': {'type': 'integer'},
+                                'col': {'type': 'integer'}}},
+        # Values are returned from `_source` but never searched.
+        'properties': {'type': 'object', 'enabled': False},
+    }
+}
 
 
 class AtlasElasticIngestor(AtlasIngestor):
     def __init__(self, *args, **kwargs):
+        """Elasticsearch backend with the interface of
+        `AtlasMongoIngestor`. Documents are streamed to one index per
+        variable with `parallel_bulk`. While an index is loading its
+        refresh is disabled and it has no replicas; `build_indexes`
+        restores both once the dataset is in, see `start_load`.
+
+        :param thread_count: Bulk request threads, defaults to
+         `ELASTICSEARCH['thread_count']`
+        :type thread_count: int
+        :param chunk_size: Documents per bulk request, defaults to
+         `ELASTICSEARCH['chunk_size']`
+        :type chunk_size: int
+        """
         super(AtlasElasticIngestor, self).__init__(*args, **kwargs)
-        # TODO: More robust ES connector
-        self.db = Elasticsearch()
-        self.schema = AtlasMongoDocument
-        self.meta_db = self.db['grid_meta']
-        self.grid_db = None
+        self.schema = AtlasElasticDocument
+        self.meta_index = ELASTICSEARCH['meta_index']
+        self.thread_count = kwargs.get('thread_count') \
+            or ELASTICSEARCH['thread_count']
+        self.chunk_size = kwargs.get('chunk_size') \
+            or ELASTICSEARCH['chunk_size']
+        self._pending = dict()
+        self.stats = dict(docs=0, errors=0)
 
-    def ingest(self, values, all_lons_lats, metadata, variable):
-        """Crudely parallelized ingestion for Mongo. `values` should be
-        at least 2 dimensions, with the first dimension corresponding to
-        latitude and the second to longitude.
+    @property
+    def db(self):
+        return elastic_registry.client
+
+    def ingest(self, values, lats, lons, metadata, variable, no_index=False,
+               grid=None, encoding=None, block_size=None):
+        """Ingest a latitude band of a variable into the
+        `{metadata}_{variable}` index. `values` should be at least 2
+        dimensions, with the first dimension corresponding to latitude and
+        the second to longitude. Values are always stored as lists, so
+        packed encodings and block documents are not supported.
 
         :param values: n-d array of values.
         :type values: np.array
-        :param all_lons_lats: iterator over enumerated latitude and longitude
-        :type all_lons_lats: iter
+        :param lats: latitudes of the first dimension of `values`
+        :type lats: np.array
+        :param lons: longitudes of the second dimension of `values`
+        :type lons: np.array
         :param metadata: `name` attribute from metadata
         :type metadata: str
         :param variable: Variable name
         :type variable: str
+        :param no_index: Do not queue the index for `build_indexes`
+        :type no_index: bool
+        :param grid: Global grid indexing of the dataset
+        :type grid: AtlasGrid
         :return: Ingestion success
         :rtype: bool
         """
-        try:
-            jobs = []
-            n = mp.cpu_count()
+        self.check_layout(encoding, block_size)
+        self.ingest_variable(values, lats, lons, metadata, variable, grid)
+
+        if not no_index:
+            self.index_grid(metadata, variable)
 
-            all_lons_lats = np.array([x for x in all_lons_lats])
+        return True
 
-            self.grid_db = self.db['{}_{}'.format(metadata, variable)]
+    @mongo_ingestion('Raster', profile=True)
+    def ingest_variable(self, values, lats, lons, metadata, variable,
+                        grid=None):
+        """Ingest a latitude band of data.
+
+        :param values: n-d array of values
+        :type values: np.array
+        :param lats: latitudes of the first dimension of `values`
+        :type lats: np.array
+        :param lons: longitudes of the second dimension of `values`
+        :type lons: np.array
+        :param metadata: name of metadata
+        :type metadata: str
+        :param variable: name of variable
+        :type variable: str
+        :param grid: Global grid indexing of the dataset
+        :type grid: AtlasGrid
+        :return:
+        :rtype:
+        """
+        return self.write_documents(
+            self.schema.documents(values, lats, lons, self.scaling, grid),
+            metadata, variable)
 
-            for i in range(n):
-                lons_lats = np.array_split(all_lons_lats, n)[i]
-                p = mp.Process(target=self.ingest_variable,
-                               args=(values, lons_lats))
-                jobs.append(p)
-                p.start()
-            for j in jobs:
-                j.join()
+    def ingest_wide(self, values, lats, lons, metadata, no_index=False,
+                    grid=None, encoding=None):
+        """Ingest several variables in one pass, one document per pixel
+        with every variable under `properties`, into the `{metadata}`
+        index.
 
-            self.index_grid()
-            return True
+        :param values: (variable, n-d array) pairs sharing lat/lon axes
+        :type values: list
+        :param lats: latitudes of the first dimension of the arrays
+        :type lats: np.array
+        :param lons: longitudes of the second dimension of the arrays
+        :type lons: np.array
+        :param metadata: `name` attribute from metadata
+        :type metadata: str
+        :param no_index: Do not queue the index for `build_indexes`
+        :type no_index: bool
+        :param grid: Global grid indexing of the dataset
+        :type grid: AtlasGrid
+        :return: Ingestion success
+        :rtype: bool
+        """
+        self.check_layout(encoding, None)
+        self.ingest_variables(values, lats, lons, metadata, grid)
 
-        except:
+        if not no_index:
+            self.index_grid(metadata, None)
 
-            return False
+        return True
 
     @mongo_ingestion('Raster')
-    def ingest_variable(self, values, lons_lats):
-        """Ingest one 'slice' of data per CPU core.
+    def ingest_variables(self, values, lats, lons, metadata, grid=None):
+        return self.write_documents(
+            self.schema.wide_documents(values, lats, lons, self.scaling,
+                                       grid),
+            metadata, None)
 
-        :param values: n-d array of values
-        :type values: np.array
-        :param lons_lats: array of enumerated latitudes and longitudes
-        :type lons_lats: np.array
-        :return:
-        :rtype:
+    @staticmethod
+    def check_layout(encoding, block_size):
+        if encoding or block_size:
+            raise ValueError('Elasticsearch stores one value list per '
+                             'pixel.')
+
+    def write_documents(self, docs, metadata, variable):
+        """Write `docs` to the `{metadata}_{variable}` index. Every
+        chunk is sent before failed documents are reported, so one bad
+        document does not stop the rest of the slab.
+
+        :return: Documents indexed and failed
+        :rtype: dict
+        :raises BulkIndexError: If any document failed to index
         """
-        for (lat_idx, lat), (lon_idx, lon) in lons_lats:
+        from elasticsearch import helpers
+        index = self.get_grid_index(metadata, variable)
+        self.start_load(index)
+        start = time.time()
+        stats = dict(docs=0, errors=0)
+        errors = list()
+
+        for ok, item in helpers.parallel_bulk(
+                self.db,
+                self.actions(metrics.timed(docs, 'transform'), index),
+                thread_count=self.thread_count,
+                chunk_size=self.chunk_size,
+                max_chunk_bytes=ELASTICSEARCH['max_chunk_bytes'],
+                raise_on_error=False):
+            if ok:
+                stats['docs'] += 1
+            else:
+                stats['errors'] += 1
+                errors.append(item)
 
-            try:
-                pixel_values = self.num_or_null(
-                    values[int(lat_idx), int(lon_idx)])
-                if pixel_values is None:
-                    continue
+        elapsed = time.time() - start
+        metrics.count('docs', stats['docs'])
+        for key in self.stats:
+            self.stats[key] += stats[key]
+        if METRICS['debug']:
+            print('\n*** Throughput ***\n{:.0f} docs/s\n'.format(
+                stats['docs'] / elapsed if elapsed else 0.))
 
-                tile = AtlasMongoDocument(
-                    lon, lat, pixel_values,
-                ).as_dict
-                result = self.grid_db.insert_one(tile)
+        if errors:
+            raise helpers.BulkIndexError(
+                '{} document(s) failed to index.'.format(len(errors)),
+                errors)
+        return stats
+
+    @staticmethod
+    def actions(docs, index):
+        """Bulk index actions. Pixels on a grid are keyed by their cell
+        number, so re-ingesting them overwrites rather than duplicates.
+        """
+        for doc in docs:
+            action = {'_index': index, '_source': doc}
+            if 'cell' in doc:
+                action['_id'] = doc['cell']
+            yield action
 
-                return True
+    @staticmethod
+    def get_grid_index(metadata, variable):
+        return elastic_registry.index(metadata, variable)
+
+    def start_load(self, index):
+        """Create `index` with the pixel mapping if needed, and turn off
+        refresh and replicas until `finish_load`. The settings to restore
+        are kept in the `_meta` of the index mapping rather than in this
+        process, so that ingestors in other processes writing to the
+        same index find the index loading and leave them alone.
+
+        :param index: Index name
+        :type index: str
+        """
+        load_settings = {'refresh_interval': '-1', 'number_of_replicas': 0}
+        if not self.db.indices.exists(index=index):
+            restore = {
+                'refresh_interval': ELASTICSEARCH['refresh_interval'],
+                'number_of_replicas': ELASTICSEARCH['replicas'],
+            }
+            # Another process may create it first, which is a 400.
+            created = self.db.options(ignore_status=400).indices.create(
+                index=index, settings=load_settings,
+                mappings=dict(MAPPING, _meta={'loading': restore}))
+            if created.get('acknowledged'):
+                return
+        # Read before checking, so settings put by a concurrent
+        # `start_load` are never mistaken for the ones to restore.
+        current = self.db.indices.get_settings(
+            index=index)[index]['settings']['index']
+        if self.loading(index) is not None:
+            return
+        restore = {
+            'refresh_interval': current.get(
+                'refresh_interval', ELASTICSEARCH['refresh_interval']),
+            'number_of_replicas': int(current.get(
+                'number_of_replicas', ELASTICSEARCH['replicas'])),
+        }
+        self.db.indices.put_mapping(index=index, meta={'loading': restore})
+        self.db.indices.put_settings(index=index, settings=load_settings)
 
-            except:
-                print('Unexpected error:', sys.exc_info()[0])
-                raise
+    def loading(self, index):
+        """Settings to restore once `index` is loaded.
+
+        :param index: Index name
+        :type index: str
+        :return: Settings, or None if the index is not loading (or was
+         never written to)
+        :rtype: dict
+        """
+        found = self.db.options(ignore_status=404).indices.get_mapping(
+            index=index)
+        mappings = found.get(index, dict()).get('mappings', dict())
+        return mappings.get('_meta', dict()).get('loading')
+
+    def finish_load(self, index):
+        """Restore the refresh interval and replicas of a loaded index
+        and make its documents searchable. Only `build_indexes` calls
+        this, once every process has written its part of the dataset.
+
+        :param index: Index name
+        :type index: str
+        """
+        settings = self.loading(index)
+        if settings is None:
+            return
+        self.db.indices.put_settings(index=index, settings=settings)
+        self.db.indices.put_mapping(index=index, meta={})
+        self.db.indices.refresh(index=index)
+
+    def drop_metadata(self, metadata):
+        self.db.options(ignore_status=404).delete(
+            index=self.meta_index, id=metadata['name'])
 
     @mongo_ingestion('Metadata')
     def ingest_metadata(self, metadata):
-        self.meta_db.insert_one(metadata)
+        self.db.index(index=self.meta_index, id=metadata['name'],
+                      document=metadata, refresh=True)
+
+    def index_grid(self, metadata, variable):
+        """Queue the `{metadata}_{variable}` index for `build_indexes`.
+
+        :param metadata: name of metadata
+        :type metadata: str
+        :param variable: name of variable, or None for wide datasets
+        :type variable: str
+        """
+        self._pending.setdefault(metadata, list()).append(
+            self.get_grid_index(metadata, variable))
 
     @mongo_ingestion('Index')
-    def index_grid(self):
-        self.grid_db.create_index([('geometry', GEOSPHERE)])
+    def build_indexes(self, metadata=None):
+        """Finish loading the queued indexes of a dataset, or of every
+        dataset. Elasticsearch indexes documents as they arrive, so this
+        only restores their settings and refreshes them.
 
+        :param metadata: name of metadata
+        :type metadata: str
+        :return: Seconds taken by index name
+        :rtype: dict
+        """
+        datasets = list(self._pending) if metadata is None else [metadata]
+        report = dict()
+        for name in datasets:
+            for index in self._pending.pop(name, []):
+                start = time.time()
+                self.finish_load(index)
+                report[index] = {'seconds': time.time() - start}
+        for index, built in sorted(report.items()):
+            print('{}: refreshed in {:.1f}s'.format(index, built['seconds']))
+        return report
 
-class AtlasMongoDocument(AtlasSchema):
+
+class AtlasElasticDocument(AtlasSchema):
     def __init__(self, *args, **kwargs):
-        """Schema for storing ATLAS data in Mongo.
+        """Schema for storing ATLAS data in Elasticsearch.
         """
-        super(AtlasMongoDocument, self).__init__(*args, **kwargs)
+        super(AtlasElasticDocument, self).__init__(*args, **kwargs)
 
-    @property
-    def __geo_interface__(self):
-        """Define centroid (x, y) as a GeoJSON point. n-d array of values
-         in the `properties` attribute.
+    @staticmethod
+    def document(x, y, properties, key=None):
+        """Centroid (x, y) as a `geo_point`, with the values in
+        `properties`. Pixels with a grid `key` also carry their cell
+        number, used as the document id and as the sort key for paging.
 
-        :return: GeoJSON object representing data point
+        :return: Elasticsearch document representing data point
         :rtype: dict
         """
-
-        document = {
-            'location': [self.x, self.y],
-            'properties': {
-                'values': self.value,
-            }}
+        document = {'location': {'lat': y, 'lon': x},
+                    'properties': properties}
+        if key is not None:
+            row, col, cell = key
+            document['cell'] = cell
+            document['grid'] = {'row': row, 'col': col}
 
         return document
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+from bson import Binary
+
+
+ENCODINGS = ['list', 'packed']
+DTYPES = ['<i2', '<i4', '<i8']
+
+
+class AtlasEncoding(object):
+    def __init__(self, dtype='<i4'):
+        """Packed storage of scaled values: a little-endian integer array
+        in a BSON binary, with the smallest value of the dtype standing in
+        for nulls.
+
+        :param dtype: NumPy dtype string of the packed values
+        :type dtype: str
+        """
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.sentinel = int(np.iinfo(self.dtype).min)
+
+    @classmethod
+    def for_range(cls, vmin, vmax, scaling):
+        """Smallest encoding that holds values in [vmin, vmax] scaled by
+        `10**scaling`.
+
+        :param vmin: Smallest value of the variable
+        :type vmin: float
+        :param vmax: Largest value of the variable
+        :type vmax: float
+        :param scaling: Number of decimal places kept
+        :type scaling: int
+        :return: Encoding
+        :rtype: AtlasEncoding
+        """
+        bound = max(abs(vmin or 0.), abs(vmax or 0.)) * 10**scaling
+        for dtype in DTYPES:
+            if bound <= np.iinfo(dtype).max:
+                return cls(dtype)
+        raise ValueError('Values do not fit in 64 bits after scaling.')
+
+    def pack(self, scaled, nulls):
+        """Scaled integers with nulls replaced by the sentinel.
+
+        :param scaled: Scaled values, as returned by `AtlasSchema.scale_grid`
+        :type scaled: np.array
+        :param nulls: Null mask of `scaled`
+        :type nulls: np.array
+        :return: Packed values
+        :rtype: np.array
+        :raises ValueError: A value does not fit in the dtype
+        """
+        valid = scaled[~nulls]
+        if valid.size and (valid.min() <= self.sentinel
+                           or valid.max() > np.iinfo(self.dtype).max):
+            raise ValueError('Values do not fit in {} after scaling.'.format(
+                self.dtype.str))
+        return np.where(nulls, self.sentinel, scaled).astype(self.dtype)
+
+    def blobs(self, scaled, nulls, lat_idxs, lon_idxs):
+        """Per-pixel binaries from the output of `scale_grid`, sliced
+        from a single buffer.
+        """
+        packed = np.ascontiguousarray(
+            self.pack(scaled[lat_idxs, lon_idxs], nulls[lat_idxs, lon_idxs]))
+        raw = packed.tobytes()
+        width = packed.shape[1] * self.dtype.itemsize
+        return [Binary(raw[i:i + width]) for i in range(0, len(raw), width)]
+
+    def block_blobs(self, scaled, nulls):
+        """Packed values and validity bitmask of each block, from the
+        output of `scale_grid` on a (block, pixel, n) array.
+
+        :return: Value binaries and mask binaries, one per block
+        :rtype: tuple
+        """
+        packed = np.ascontiguousarray(self.pack(scaled, nulls))
+        masks = np.packbits(~nulls.reshape(len(nulls), -1), axis=1)
+        return ([Binary(block.tobytes()) for block in packed],
+                [Binary(mask.tobytes()) for mask in masks])
+
+    def decode(self, blob):
+        """Values of one pixel, with nulls masked.
+
+        :param blob: Packed values
+        :type blob: bytes
+        :return: Scaled integer values
+        :rtype: np.ma.MaskedArray
+        """
+        values = np.frombuffer(blob, dtype=self.dtype)
+        return np.ma.masked_equal(values, self.sentinel)
+
+    def decode_block(self, values, mask, size):
+        """Values of one block, with nulls and missing pixels masked.
+
+        :param values: Packed values
+        :type values: bytes
+        :param mask: Packed validity bits
+        :type mask: bytes
+        :param size: Rows and columns per block
+        :type size: int
+        :return: Scaled integer values shaped (size, size, n)
+        :rtype: np.ma.MaskedArray
+        """
+        data = np.frombuffer(values, dtype=self.dtype).reshape(size, size, -1)
+        valid = np.unpackbits(np.frombuffer(mask, dtype=np.uint8),
+                              count=data.size).reshape(data.shape)
+        return np.ma.MaskedArray(data, mask=~valid.astype(bool))
+
+    @property
+    def as_dict(self):
+        return {'dtype': self.dtype.str,
+                'sentinel': self.sentinel,
+                }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['dtype'])
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+from collections import OrderedDict
+
+
+# Values of pymongo's ASCENDING, GEO2D and GEOSPHERE, which is only
+# imported once indexes are built.
+ASCENDING, GEO2D, GEOSPHERE = 1, '2d', '2dsphere'
+
+
+def index_model(keys, **kwargs):
+    from pymongo import IndexModel
+    return IndexModel(keys, **kwargs)
+
+
+INDEX_KINDS = {
+    # Spherical index on the GeoJSON point, for arbitrary polygons.
+    'sphere': lambda: index_model([('geometry', GEOSPHERE)]),
+    # Flat index on the coordinate pair. Cheaper to build and query for
+    # regular lat/lon grids; bounds accept both -180..180 and 0..360.
+    'planar': lambda: index_model([('geometry.coordinates', GEO2D)],
+                                  min=-180, max=360),
+    # Grid row/column plus geometry, for bbox range scans on the grid.
+    'grid': lambda: index_model([('grid.row', ASCENDING),
+                                 ('grid.col', ASCENDING),
+                                 ('geometry', GEOSPHERE)]),
+}
+
+
+class AtlasIndexPlan(object):
+    def __init__(self, kinds=('sphere', )):
+        """Indexes to build once all data for a dataset is loaded.
+        Collections are registered during ingestion and built together by
+        `build`, one `create_indexes` call per index so that each build
+        is timed on its own.
+
+        :param kinds: Keys of `INDEX_KINDS` to build on every collection
+        :type kinds: tuple
+        """
+        for kind in kinds:
+            if kind not in INDEX_KINDS:
+                raise ValueError('Unknown index kind: {}'.format(kind))
+        self.kinds = tuple(kinds)
+        self.pending = OrderedDict()
+
+    def check_layout(self, block_size):
+        """Refuse index kinds that cannot index the documents: the
+        planar index needs a coordinate pair, while block documents are
+        outlined by a polygon.
+
+        :param block_size: Rows and columns per block document, None for
+         one document per pixel
+        :type block_size: int
+        :raises ValueError: The planar index is planned for blocks
+        """
+        if block_size and 'planar' in self.kinds:
+            raise ValueError('The planar index cannot index block '
+                             'documents; use the sphere or grid index.')
+
+    def add(self, dataset, collection):
+        """Register a collection of `dataset` for indexing.
+
+        :param dataset: `name` attribute from metadata
+        :type dataset: str
+        :param collection: Collection to index
+        :type collection: pymongo.collection.Collection
+        """
+        self.pending.setdefault(dataset, OrderedDict())[
+            collection.name] = collection
+
+    def build(self, dataset=None):
+        """Build every pending index of `dataset`, or of all datasets.
+
+        :param dataset: `name` attribute from metadata
+        :type dataset: str
+        :return: By collection name, the index names, the build seconds
+         of each and their total
+        :rtype: dict
+        """
+        report = dict()
+        datasets = list(self.pending) if dataset is None else [dataset]
+        for name in datasets:
+            collections = self.pending.pop(name, dict())
+            for collection in collections.values():
+                seconds = OrderedDict()
+                for kind in self.kinds:
+                    start = time.time()
+                    index, = collection.create_indexes([INDEX_KINDS[kind]()])
+                    seconds[index] = time.time() - start
+                report[collection.name] = {
+                    'indexes': list(seconds),
+                    'index_seconds': seconds,
+                    'seconds': sum(seconds.values()),
+                }
+        return report
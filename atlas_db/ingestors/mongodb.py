@@ -1,160 +1,290 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import sys
-import multiprocessing as mp
-import numpy as np
-from pymongo import MongoClient, GEOSPHERE
-from atlas_db.constants import MONGO, URI
+from atlas_db.clients import registry
+from atlas_db.constants import INDEX, METRICS
+from atlas_db.grid import AtlasGrid
 from atlas_db.ingestors import AtlasIngestor, AtlasSchema
+from atlas_db.ingestors.bulk import AtlasBulkWriter
+from atlas_db.ingestors.checkpoint import AtlasMongoCheckpoint
 from atlas_db.ingestors.decorators import mongo_ingestion
+from atlas_db.ingestors.indexes import AtlasIndexPlan
+from atlas_db.ingestors.pool import AtlasSharedArray, default_pool, \
+    ingest_band
+from atlas_db.metrics import metrics
 
 
 class AtlasMongoIngestor(AtlasIngestor):
     def __init__(self, *args, **kwargs):
         super(AtlasMongoIngestor, self).__init__(*args, **kwargs)
-        client = MongoClient(URI) if not MONGO['local'] \
-            else MongoClient('localhost', MONGO['port'])
-        db = client[MONGO['database']]
-        self.meta_db = db['grid_meta']
+        self.meta_db = registry.collection('grid_meta')
         self.schema = AtlasMongoDocument
+        self.pool = kwargs.get('pool') or default_pool()
+        self.checkpoint = AtlasMongoCheckpoint(
+            registry.collection('ingest_checkpoints'))
+        self.index_plan = AtlasIndexPlan(
+            kwargs.get('index_kinds') or INDEX['kinds'])
+        # Replace existing documents rather than fail on their `_id`s.
+        self.upsert = kwargs.get('upsert', False)
+        self.stats = dict(docs=0, bytes=0, batches=0, retries=0,
+                          duplicates=0)
+
+    def add_stats(self, stats):
+        """Add the statistics of an `AtlasBulkWriter` to `stats`.
+        """
+        for key in self.stats:
+            self.stats[key] += stats[key]
 
-    def parallel_ingest(self, values, all_lons_lats, metadata, variable,
-                        no_index=False):
-        """Crudely parallelized ingestion for Mongo. `values` should be
-        at least 2 dimensions, with the first dimension corresponding to
-        latitude and the second to longitude.
+    def parallel_ingest(self, values, lats, lons, metadata, variable,
+                        no_index=False, grid=None, encoding=None):
+        """Parallelized ingestion for Mongo. `values` is copied once into
+        shared memory and the worker pool ingests it in latitude bands.
+        `values` should be at least 2 dimensions, with the first dimension
+        corresponding to latitude and the second to longitude. Errors in
+        workers are raised here.
 
         :param values: n-d array of values.
         :type values: np.array
-        :param all_lons_lats: iterator over enumerated latitude and longitude
-        :type all_lons_lats: iter
+        :param lats: latitudes of the first dimension of `values`
+        :type lats: np.array
+        :param lons: longitudes of the second dimension of `values`
+        :type lons: np.array
         :param metadata: `name` attribute from metadata
         :type metadata: str
         :param variable: Variable name
         :type variable: str
-        :param no_index: Quash indexing for tiled datasets
+        :param no_index: Do not queue the collection for indexing
         :type no_index: bool
+        :param grid: Global grid indexing of the dataset
+        :type grid: AtlasGrid
+        :param encoding: Packed value encoding, None to store lists
+        :type encoding: AtlasEncoding
         :return: Ingestion success
         :rtype: bool
         """
+        grid = grid or AtlasGrid(lats, lons)
+        shared = AtlasSharedArray(values)
         try:
-            jobs = []
-            n = mp.cpu_count()
-
-            all_lons_lats = np.array([x for x in all_lons_lats])
-
-            for i in range(n):
-                lons_lats = np.array_split(all_lons_lats, n)[i]
-                p = mp.Process(target=self.ingest_variable,
-                               args=(values, lons_lats, metadata, variable))
-                jobs.append(p)
-                p.start()
-            for j in jobs:
-                j.join()
-
-            if not no_index:
-                self.index_grid(metadata, variable)
-            return True
-
-        except:
-
-            return False
+            for result in self.pool.map_bands(
+                    ingest_band, len(lats), type(self), self.scaling,
+                    shared.spec, lats, lons, metadata, variable, grid,
+                    encoding, self.upsert):
+                self.add_stats(result['stats'])
+                metrics.merge(result['metrics'])
+                metrics.worker(result['pid'], result['stats']['docs'],
+                               result['seconds'])
+        finally:
+            shared.close()
+
+        if not no_index:
+            self.index_grid(metadata, variable)
+        return True
 
-    def ingest(self, values, all_lons_lats, metadata, variable,
-               no_index=False):
-        """Crudely parallelized ingestion for Mongo. `values` should be
-        at least 2 dimensions, with the first dimension corresponding to
+    def ingest(self, values, lats, lons, metadata, variable, no_index=False,
+               grid=None, encoding=None, block_size=None):
+        """Ingest a whole variable in the current process. `values` should
+        be at least 2 dimensions, with the first dimension corresponding to
         latitude and the second to longitude.
 
         :param values: n-d array of values.
         :type values: np.array
-        :param all_lons_lats: iterator over enumerated latitude and longitude
-        :type all_lons_lats: iter
+        :param lats: latitudes of the first dimension of `values`
+        :type lats: np.array
+        :param lons: longitudes of the second dimension of `values`
+        :type lons: np.array
         :param metadata: `name` attribute from metadata
         :type metadata: str
         :param variable: Variable name
         :type variable: str
-        :param no_index: Quash indexing for tiled datasets
+        :param no_index: Do not queue the collection for indexing
         :type no_index: bool
+        :param grid: Global grid indexing of the dataset
+        :type grid: AtlasGrid
+        :param encoding: Packed value encoding, None to store lists
+        :type encoding: AtlasEncoding
+        :param block_size: Store `block_size` x `block_size` pixel blocks
+         per document, with values packed by `encoding`
+        :type block_size: int
         :return: Ingestion success
         :rtype: bool
+        :raises Exception: Any write error, so that a failed slab is
+         never recorded as done
         """
-        try:
-
-            all_lons_lats = np.array([x for x in all_lons_lats])
-
-            self.ingest_variable(values, all_lons_lats, metadata, variable)
-
-            if not no_index:
-                self.index_grid(metadata, variable)
-
-            return True
+        self.index_plan.check_layout(block_size)
+        self.ingest_variable(values, lats, lons, metadata, variable, grid,
+                             encoding, block_size)
 
-        except:
+        if not no_index:
+            self.index_grid(metadata, variable)
 
-            return False
+        return True
 
-    @mongo_ingestion('Raster')
-    def ingest_variable(self, values, lons_lats, metadata, variable):
-        """Ingest one 'slice' of data per CPU core.
+    @mongo_ingestion('Raster', profile=True)
+    def ingest_variable(self, values, lats, lons, metadata, variable,
+                        grid=None, encoding=None, block_size=None):
+        """Ingest a latitude band of data. Documents are built for the
+        whole band at once by `AtlasMongoDocument.documents` and written
+        by an `AtlasBulkWriter`.
 
         :param values: n-d array of values
         :type values: np.array
-        :param lons_lats: array of enumerated latitudes and longitudes
-        :type lons_lats: np.array
+        :param lats: latitudes of the first dimension of `values`
+        :type lats: np.array
+        :param lons: longitudes of the second dimension of `values`
+        :type lons: np.array
         :param metadata: name of metadata
         :type metadata: str
         :param variable: name of variable
         :type variable: str
+        :param grid: Global grid indexing of the dataset
+        :type grid: AtlasGrid
+        :param encoding: Packed value encoding, None to store lists
+        :type encoding: AtlasEncoding
+        :param block_size: Rows and columns per block document, None for
+         one document per pixel
+        :type block_size: int
         :return:
         :rtype:
         """
+        if block_size:
+            return self.write_documents(
+                self.schema.block_documents(values, lats, lons, self.scaling,
+                                            block_size, encoding, grid),
+                metadata, variable)
+
+        return self.write_documents(
+            self.schema.documents(values, lats, lons, self.scaling, grid,
+                                  encoding),
+            metadata, variable)
+
+    def ingest_wide(self, values, lats, lons, metadata, no_index=False,
+                    grid=None, encoding=None):
+        """Ingest several variables in one pass, one document per pixel
+        with every variable under `properties`, into the `{metadata}`
+        collection.
+
+        :param values: (variable, n-d array) pairs sharing lat/lon axes
+        :type values: list
+        :param lats: latitudes of the first dimension of the arrays
+        :type lats: np.array
+        :param lons: longitudes of the second dimension of the arrays
+        :type lons: np.array
+        :param metadata: `name` attribute from metadata
+        :type metadata: str
+        :param no_index: Do not queue the collection for indexing
+        :type no_index: bool
+        :param grid: Global grid indexing of the dataset
+        :type grid: AtlasGrid
+        :param encoding: Packed value encodings by variable name
+        :type encoding: dict
+        :return: Ingestion success
+        :rtype: bool
+        :raises Exception: Any write error, so that a failed slab is
+         never recorded as done
+        """
+        self.ingest_variables(values, lats, lons, metadata, grid, encoding)
+
+        if not no_index:
+            self.index_grid(metadata, None)
 
-        grid_db = self.get_grid_db(metadata, variable)
-        docs = list()
-        n = 0
+        return True
 
-        for (lat_idx, lat), (lon_idx, lon) in lons_lats:
+    @mongo_ingestion('Raster')
+    def ingest_variables(self, values, lats, lons, metadata, grid=None,
+                         encoding=None):
+        """Ingest a latitude band of several variables as wide documents.
+
+        :param values: (variable, n-d array) pairs sharing lat/lon axes
+        :type values: list
+        :param lats: latitudes of the first dimension of the arrays
+        :type lats: np.array
+        :param lons: longitudes of the second dimension of the arrays
+        :type lons: np.array
+        :param metadata: name of metadata
+        :type metadata: str
+        :param grid: Global grid indexing of the dataset
+        :type grid: AtlasGrid
+        :param encoding: Packed value encodings by variable name
+        :type encoding: dict
+        :return:
+        :rtype:
+        """
+        return self.write_documents(
+            self.schema.wide_documents(values, lats, lons, self.scaling,
+                                       grid, encoding),
+            metadata, None)
 
-            try:
-                pixel_values = self.num_or_null(
-                    values[int(lat_idx), int(lon_idx)])
-                if pixel_values is None:
-                    continue
+    def write_documents(self, docs, metadata, variable):
+        """Write `docs` to the `{metadata}_{variable}` collection.
 
-                docs.append(AtlasMongoDocument(
-                    lon, lat, pixel_values, self.scaling
-                ).as_dict)
-                n += 1
+        :return: Write statistics of the `AtlasBulkWriter`
+        :rtype: dict
+        """
+        writer = AtlasBulkWriter(self.get_grid_db(metadata, variable),
+                                 upsert=self.upsert)
 
-                if n % 800 == 0 or n == len(lons_lats):
-                    result = grid_db.insert_many(docs)
-                    docs = list()
+        with writer:
+            writer.extend(metrics.timed(docs, 'transform'))
 
-            except:
-                print('Unexpected error:', sys.exc_info()[0])
-                raise
+        if METRICS['debug']:
+            print('\n*** Throughput ***\n{:.0f} docs/s\n'.format(
+                writer.docs_per_second))
 
-        return True
+        self.add_stats(writer.stats)
+        return writer.stats
 
-    def get_grid_db(self, metadata, variable):
-        client = MongoClient(URI) if not MONGO['local'] \
-            else MongoClient('localhost', MONGO['port'])
-        db = client[MONGO['database']]
-        return db['{}_{}'.format(metadata, variable)]
+    @staticmethod
+    def get_grid_db(metadata, variable):
+        return registry.grid(metadata, variable)
 
     def drop_metadata(self, metadata):
         self.meta_db.delete_one({'name': metadata['name']})
 
+    def stored_encodings(self, metadata):
+        meta = self.meta_db.find_one({'name': metadata},
+                                     {'variables': True}) or dict()
+        return dict((v['name'], v['encoding'])
+                    for v in meta.get('variables', []) if 'encoding' in v)
+
     @mongo_ingestion('Metadata')
     def ingest_metadata(self, metadata):
-        self.drop_metadata(metadata)
-        self.meta_db.insert_one(metadata)
+        self.meta_db.replace_one({'name': metadata['name']}, metadata,
+                                 upsert=True)
 
-    @mongo_ingestion('Index')
     def index_grid(self, metadata, variable):
-        self.get_grid_db(metadata, variable)\
-            .create_index([('geometry', GEOSPHERE)])
+        """Queue the `{metadata}_{variable}` collection for indexing by
+        `build_indexes`, after all data is loaded.
+
+        :param metadata: name of metadata
+        :type metadata: str
+        :param variable: name of variable, or None for wide datasets
+        :type variable: str
+        """
+        self.index_plan.add(metadata, self.get_grid_db(metadata, variable))
+
+    @mongo_ingestion('Index')
+    def build_indexes(self, metadata=None):
+        """Build all queued indexes of a dataset, or of every dataset,
+        and record the index kinds in its metadata.
+
+        :param metadata: name of metadata
+        :type metadata: str
+        :return: Index names and build seconds by collection name, see
+         `AtlasIndexPlan.build`
+        :rtype: dict
+        """
+        datasets = list(self.index_plan.pending) if metadata is None \
+            else [metadata]
+        report = dict()
+        for name in datasets:
+            report.update(self.index_plan.build(name))
+            self.meta_db.update_one(
+                {'name': name},
+                {'$set': {'indexes': list(self.index_plan.kinds)}})
+        for collection, built in sorted(report.items()):
+            for index, seconds in built['index_seconds'].items():
+                metrics.log('index_build', collection=collection,
+                            index=index, seconds=seconds)
+        return report
 
 
 class AtlasMongoDocument(AtlasSchema):
@@ -163,21 +293,45 @@ class AtlasMongoDocument(AtlasSchema):
         """
         super(AtlasMongoDocument, self).__init__(*args, **kwargs)
 
-    @property
-    def __geo_interface__(self):
+    @staticmethod
+    def document(x, y, properties, key=None):
         """Define centroid (x, y) as a GeoJSON point. n-d array of values
-         in the `properties` attribute.
+         in the `properties` attribute. Pixels with a grid `key` get its
+         cell number as a deterministic `_id`, so re-ingesting them is
+         idempotent.
 
         :return: GeoJSON object representing data point
         :rtype: dict
         """
 
-        document = {
+        document = dict()
+        if key is not None:
+            row, col, cell = key
+            document['_id'] = cell
+            document['grid'] = {'row': row, 'col': col}
+        document.update({
             # 'type': 'Feature',
             'geometry': {'type': 'Point',
-                         'coordinates': [self.x, self.y]},
-            'properties': {
-                'values': self.value,
-            }}
+                         'coordinates': [x, y]},
+            'properties': properties})
 
         return document
+
+    @staticmethod
+    def block_document(bounds, properties, key, size):
+        """Block of pixels keyed by its block number, with its outline as
+         a GeoJSON polygon and the global row and column of its first
+         pixel.
+
+        :return: GeoJSON object representing the block
+        :rtype: dict
+        """
+        west, south, east, north = bounds
+        row, col, cell = key
+        return {'_id': cell,
+                'grid': {'row': row, 'col': col, 'size': size},
+                'geometry': {'type': 'Polygon',
+                             'coordinates': [[[west, south], [east, south],
+                                              [east, north], [west, north],
+                                              [west, south]]]},
+                'properties': properties}
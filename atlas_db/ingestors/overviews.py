@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+from atlas_db.grid import AtlasGrid
+
+
+METHODS = ['mean', 'nearest']
+
+
+class AtlasOverview(object):
+    def __init__(self, grid, factor, method='mean'):
+        """Coarser copy of a gridded dataset, where each cell aggregates
+        `factor` x `factor` cells of the native grid. Cells are grouped by
+        global row and column, so slabs and tiles that are aligned to
+        `factor` rows aggregate independently. Masked cells are ignored.
+
+        :param grid: Native grid
+        :type grid: AtlasGrid
+        :param factor: Cells per overview cell along each axis
+        :type factor: int
+        :param method: 'mean' or 'nearest' (to the overview cell centre)
+        :type method: str
+        :raises ValueError: `factor` does not divide the columns of the
+         grid: the last overview column would wrap onto the first
+        """
+        if method not in METHODS:
+            raise ValueError('Unknown overview method: {}'.format(method))
+        if grid.n_cols % factor:
+            raise ValueError('Overview factor {} does not divide the {} '
+                             'columns of the grid.'.format(factor,
+                                                           grid.n_cols))
+        self.native = grid
+        self.factor = factor
+        self.method = method
+        self.grid = self.coarsen(grid, factor)
+
+    @staticmethod
+    def coarsen(grid, factor):
+        """Grid of the overview cells. Their centroids sit at the centre
+        of the native cells they cover.
+
+        :param grid: Native grid
+        :type grid: AtlasGrid
+        :param factor: Cells per overview cell along each axis
+        :type factor: int
+        :return: Overview grid
+        :rtype: AtlasGrid
+        """
+        centre = (factor - 1) / 2.
+        coarse = AtlasGrid([], [], grid.res_lat * factor,
+                           grid.res_lon * factor,
+                           (centre + grid.off_lat) / factor,
+                           (centre + grid.off_lon) / factor)
+        coarse.n_cols = grid.n_cols // factor
+        return coarse
+
+    @staticmethod
+    def suffix(factor):
+        return 'x{}'.format(factor)
+
+    @classmethod
+    def collection(cls, name, factor):
+        """Name of the overview of collection `name`.
+        """
+        return '{}_{}'.format(name, cls.suffix(factor))
+
+    def aggregate(self, values, lats, lons):
+        """Aggregate a (lat, lon, ...) block of the native grid.
+
+        :param values: n-d (masked) array, latitude first, longitude second
+        :type values: np.ma.MaskedArray
+        :param lats: Latitudes of the block's rows
+        :type lats: np.array
+        :param lons: Longitudes of the block's columns
+        :type lons: np.array
+        :return: Overview values (lat, lon, n), latitudes and longitudes
+        :rtype: tuple
+        """
+        blocks, rows, cols = self.native.blocks(values, lats, lons,
+                                                self.factor)
+        blocks = np.ma.masked_invalid(blocks)
+        if self.method == 'mean':
+            out = blocks.mean(axis=(1, 3), dtype=np.float64)
+        else:
+            out = self.nearest(blocks)
+        return (np.ma.asarray(out), self.grid.row_lats(rows),
+                self.grid.col_lons(cols))
+
+    def nearest(self, blocks):
+        """Per overview cell, the unmasked native cell closest to its
+        centre.
+        """
+        f = self.factor
+        centre = (f - 1) / 2.
+        offsets = sorted(((i, j) for i in range(f) for j in range(f)),
+                         key=lambda o: (o[0] - centre) ** 2
+                         + (o[1] - centre) ** 2)
+        shape = (blocks.shape[0], blocks.shape[2], blocks.shape[4])
+        out = np.ma.MaskedArray(np.zeros(shape),
+                                mask=np.ones(shape, dtype=bool))
+        for i, j in offsets:
+            pick = blocks[:, i, :, j]
+            fill = np.ma.getmaskarray(out).all(axis=2) \
+                & ~np.ma.getmaskarray(pick).all(axis=2)
+            out[fill] = pick[fill]
+        return out
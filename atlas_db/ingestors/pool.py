@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+import atexit
+import tempfile
+import multiprocessing as mp
+import numpy as np
+from atlas_db.metrics import metrics
+
+
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+_default_pool = None
+_worker_ingestors = dict()
+
+
+class AtlasSharedArray(object):
+    def __init__(self, values, directory=SHM_DIR):
+        """Copy a (masked) array into memory-mapped `.npy` files so that
+        worker processes can attach to it by path instead of receiving a
+        pickled copy. Files live in /dev/shm where available.
+
+        :param values: n-d array of values
+        :type values: np.ma.MaskedArray
+        :param directory: Directory for the backing files
+        :type directory: str
+        """
+        values = np.ma.asarray(values)
+        self.path = self._dump(np.ma.getdata(values), directory)
+        self.mask_path = None
+        if np.ma.getmask(values) is not np.ma.nomask:
+            self.mask_path = self._dump(np.ma.getmaskarray(values),
+                                        directory)
+
+    @staticmethod
+    def _dump(arr, directory):
+        fd, path = tempfile.mkstemp(prefix='atlas_', suffix='.npy',
+                                    dir=directory)
+        os.close(fd)
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=arr.dtype,
+                                        shape=arr.shape)
+        out[...] = arr
+        out.flush()
+        del out
+        return path
+
+    @property
+    def spec(self):
+        """Picklable handle passed to workers in place of the data.
+
+        :return: Paths of the data and mask files
+        :rtype: tuple
+        """
+        return self.path, self.mask_path
+
+    @staticmethod
+    def attach(spec):
+        """Open a shared array read-only from its `spec`.
+
+        :param spec: Value of `AtlasSharedArray.spec`
+        :type spec: tuple
+        :return: Memory-mapped masked array
+        :rtype: np.ma.MaskedArray
+        """
+        path, mask_path = spec
+        data = np.load(path, mmap_mode='r')
+        mask = np.ma.nomask if mask_path is None \
+            else np.load(mask_path, mmap_mode='r')
+        return np.ma.MaskedArray(data, mask=mask, copy=False)
+
+    def close(self):
+        for path in (self.path, self.mask_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+
+class AtlasWorkerPool(object):
+    def __init__(self, processes=None, bands_per_process=4):
+        """Persistent process pool that is reused across variables and
+        files. Work is handed out as latitude index ranges over an
+        `AtlasSharedArray`.
+
+        :param processes: Number of worker processes
+        :type processes: int
+        :param bands_per_process: Latitude bands per worker, for balancing
+        :type bands_per_process: int
+        """
+        self.processes = processes or mp.cpu_count()
+        self.bands_per_process = bands_per_process
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = mp.Pool(self.processes)
+        return self._pool
+
+    def bands(self, n_rows):
+        """Split `n_rows` latitude rows into contiguous index ranges.
+
+        :param n_rows: Number of latitude rows
+        :type n_rows: int
+        :return: List of (start, stop) pairs
+        :rtype: list
+        """
+        n = max(1, min(n_rows, self.processes * self.bands_per_process))
+        edges = np.linspace(0, n_rows, n + 1).astype(int)
+        return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])
+                if b > a]
+
+    def map_bands(self, func, n_rows, *args):
+        """Call `func((start, stop) + args)` for every band in the pool.
+        Exceptions raised in a worker are re-raised here.
+
+        :param func: Module-level function taking one task tuple
+        :type func: function
+        :param n_rows: Number of latitude rows
+        :type n_rows: int
+        :return: Results of `func` in band order
+        :rtype: list
+        """
+        tasks = [band + args for band in self.bands(n_rows)]
+        return self.pool.map(func, tasks, chunksize=1)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def default_pool():
+    """Process pool shared by every ingestor in this process.
+
+    :return: Shared worker pool
+    :rtype: AtlasWorkerPool
+    """
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = AtlasWorkerPool()
+        atexit.register(_default_pool.close)
+    return _default_pool
+
+
+def ingest_band(task):
+    """Worker side of `AtlasMongoIngestor.parallel_ingest`. The ingestor
+    is built once per worker process and reused for later tasks.
+
+    :return: Write statistics and metrics of the band, with the worker's
+     pid and the seconds it took
+    :rtype: dict
+    """
+    start, stop, cls, scaling, spec, lats, lons, metadata, variable, grid, \
+        encoding, upsert = task
+    key = (cls, scaling)
+    if key not in _worker_ingestors:
+        _worker_ingestors[key] = cls(scaling)
+    _worker_ingestors[key].upsert = upsert
+    values = AtlasSharedArray.attach(spec)
+    # Workers report each task's metrics to the parent, which merges them.
+    metrics.reset()
+    started = time.time()
+    stats = _worker_ingestors[key].ingest_variable(
+        values[start:stop], lats[start:stop], lons, metadata, variable, grid,
+        encoding)
+    seconds = time.time() - started
+    metrics.log('band', metadata=metadata, variable=variable, rows=[
+        start, stop], docs=stats['docs'], seconds=seconds)
+    return dict(stats=stats, metrics=metrics.as_dict, pid=os.getpid(),
+                seconds=seconds)
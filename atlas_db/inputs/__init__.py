@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 import numpy as np
+from atlas_db.grid import AtlasGrid
 
 
 class AtlasInput(object):
@@ -17,7 +18,12 @@ class AtlasInput(object):
         self._variables = None
         self._dimensions = None
         self._parameters = None
+        self._metadata = None
+        self._grid = None
+        self._statistics = dict()
+        self.slab_statistics = dict()
         self.scaling = 3
+        self.histogram_bins = None
 
     @property
     def lats(self):
@@ -37,6 +43,18 @@ class AtlasInput(object):
         """
         return self._lons
 
+    @property
+    def grid(self):
+        """Global integer indexing of the dataset's lat/lon grid.
+
+        :return: Grid indexing
+        :rtype: AtlasGrid
+        """
+        if self._grid is None:
+            self._grid = AtlasGrid(self.lats, self.lons)
+            self._grid.check(self.lats, self.lons)
+        return self._grid
+
     @property
     def dimensions(self):
         """List of dimensions other than longitude and latitude.
@@ -68,42 +86,221 @@ class AtlasInput(object):
     def parameters(self, value):
         self._parameters = value
 
+    def histogram_range(self, variable):
+        """Fixed histogram range for `variable`, taken from its
+        `valid_range` or `valid_min`/`valid_max` attributes.
+
+        :param variable: Variable name
+        :type variable: str
+        :return: (min, max) or None if the variable declares no range
+        :rtype: tuple
+        """
+        var = self.nc_dataset.variables[variable]
+        attrs = var.ncattrs()
+        if 'valid_range' in attrs:
+            return tuple(float(x) for x in var.valid_range)
+        if 'valid_min' in attrs and 'valid_max' in attrs:
+            return float(var.valid_min), float(var.valid_max)
+        return None
+
+    def declared_range(self, variable):
+        """Bounds of `variable` known without reading its values: its
+        `valid_range`, `valid_min`/`valid_max` or `actual_range`
+        attributes, else the range of its packed integer type.
+
+        :param variable: Variable name
+        :type variable: str
+        :return: (min, max) or None for floats that declare no range
+        :rtype: tuple
+        """
+        var = self.nc_dataset.variables[variable]
+        bounds = self.histogram_range(variable)
+        if bounds is None and 'actual_range' in var.ncattrs():
+            bounds = tuple(float(x) for x in var.actual_range)
+        if bounds is None and np.issubdtype(var.dtype, np.integer):
+            info = np.iinfo(var.dtype)
+            bounds = (float(info.min), float(info.max))
+        if bounds is None:
+            return None
+        # Unpack ranges given in the units of packed integers.
+        if np.issubdtype(var.dtype, np.integer):
+            scale = float(getattr(var, 'scale_factor', 1.))
+            offset = float(getattr(var, 'add_offset', 0.))
+            bounds = tuple(sorted(b * scale + offset for b in bounds))
+        return bounds
+
+    def new_statistics(self, variable):
+        return AtlasStatistics(self.histogram_bins,
+                               self.histogram_range(variable)
+                               if self.histogram_bins else None)
+
+    def iter_slabs(self, variable, rows=None, skip=None, align=None):
+        """Read `variable` whole. Inputs that can stream override this.
+
+        :param variable: Variable name
+        :type variable: str
+        :return: Generator of (start, stop, values)
+        :rtype: generator
+        """
+        yield 0, len(self.lats), self.nc_dataset.variables[variable][:]
+
+    def statistics(self, variable):
+        """Summary statistics for `variable`. These are gathered while
+        the variable is streamed for ingestion; a separate pass is made
+        only if it has not been read in full yet.
+
+        :param variable: Variable name
+        :type variable: str
+        :return: Statistics for the variable
+        :rtype: AtlasStatistics
+        """
+        if variable not in self._statistics:
+            for _ in self.iter_slabs(variable):
+                pass
+        return self._statistics[variable]
+
+    def _dimension_metadata(self, d):
+        var = self.nc_dataset.variables[d]
+        values = var[:]
+        return {'name': var.name,
+                'human_name': var.long_name,
+                'min': float(np.min(values)),
+                'max': float(np.max(values)),
+                'size': int(var.size),
+                'unit': var.units,
+                'values': np.ma.getdata(values).ravel().tolist(),
+                }
+
+    def _variable_metadata(self, v):
+        var = self.nc_dataset.variables[v]
+        meta = {'name': var.name,
+                'human_name': var.long_name,
+                'unit': var.units,
+                # In the variable's order, which is the order of the
+                # flattened values in each document.
+                'dimension_idxs': [self.dimensions.index(d)
+                                   for d in var.dimensions
+                                   if d in self.dimensions],
+                'dimensions': [d for d in var.dimensions
+                               if d in self.dimensions],
+                }
+        meta.update(self.statistics(v).as_dict)
+        return meta
+
     @property
     def metadata(self):
-        """Dictionary of all metadata for the current dataset.
+        """Dictionary of all metadata for the current dataset. Computed
+        on first access and cached.
+
+        Each variable lists its `dimensions`, and their positions
+        `dimension_idxs` in the dataset's `dimensions`, in the variable's
+        own order rather than the file's: the order its values are
+        flattened in within each document, which selections rely on.
 
         :return: Metadata for the current dataset.
         :rtype: dict
         """
-        return {
-            'name': self.name,
-            'human_name': self.human_name,
-            'date_created': datetime.now(),
-            'date_inserted': datetime.now(),
-            'scaling': self.scaling,
-            'dimensions': [
-                {'name': self.nc_dataset.variables[d].name,
-                 'human_name': self.nc_dataset.variables[d].long_name,
-                 'min': float(np.min(self.nc_dataset.variables[d][:])),
-                 'max': float(np.max(self.nc_dataset.variables[d][:])),
-                 'size': int(self.nc_dataset.variables[d].size),
-                 'unit': self.nc_dataset.variables[d].units,
-                 } for d in self.dimensions],
-            'variables': [
-                {'name': self.nc_dataset.variables[v].name,
-                 'human_name': self.nc_dataset.variables[v].long_name,
-                 'min': float(np.min(self.nc_dataset.variables[v][:])),
-                 'max': float(np.max(self.nc_dataset.variables[v][:])),
-                 'unit': self.nc_dataset.variables[v].units,
-                 'dimension_idxs': [i for i, d in enumerate(self.dimensions)
-                                    if d in self.nc_dataset.variables[
-                                        v].dimensions],
-                 'dimensions': [d for i, d in enumerate(self.dimensions)
-                                if
-                                d in self.nc_dataset.variables[v].dimensions],
-                 } for v in self.variables],
-            'parameters': [
-                {'name': k,
-                 'value': v,
-                 } for k, v in self.parameters.iteritems()]
-        }
+        if self._metadata is None:
+            self._metadata = {
+                'name': self.name,
+                'human_name': self.human_name,
+                'date_created': datetime.now(),
+                'date_inserted': datetime.now(),
+                'scaling': self.scaling,
+                'grid': self.grid.as_dict,
+                'dimensions': [self._dimension_metadata(d)
+                               for d in self.dimensions],
+                'variables': [self._variable_metadata(v)
+                              for v in self.variables],
+                'parameters': [
+                    {'name': k,
+                     'value': v,
+                     } for k, v in self.parameters.items()]
+            }
+        return self._metadata
+
+
+class AtlasStatistics(object):
+    def __init__(self, bins=None, hist_range=None):
+        """Streaming count, min, max, mean and optional fixed-bin
+        histogram of the unmasked values of a variable.
+
+        :param bins: Number of histogram bins, or None for no histogram
+        :type bins: int
+        :param hist_range: (min, max) of the histogram bins
+        :type hist_range: tuple
+        """
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+        self.edges = None
+        self.counts = None
+        if bins and hist_range is not None:
+            self.edges = np.linspace(hist_range[0], hist_range[1], bins + 1)
+            self.counts = np.zeros(bins, dtype=np.int64)
+
+    def update(self, values):
+        """Add a block of values.
+
+        :param values: n-d (masked) array
+        :type values: np.ma.MaskedArray
+        """
+        values = np.ma.masked_invalid(values).compressed()
+        if not values.size:
+            return
+        lo, hi = float(values.min()), float(values.max())
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+        self.count += int(values.size)
+        self.total += float(values.sum(dtype=np.float64))
+        if self.counts is not None:
+            self.counts += np.histogram(values, self.edges)[0]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def state(self):
+        """Mergeable accumulator state, for storing in checkpoints.
+
+        :return: Accumulator state
+        :rtype: dict
+        """
+        return {'count': self.count,
+                'total': self.total,
+                'min': self.min,
+                'max': self.max,
+                'counts': None if self.counts is None
+                else self.counts.tolist(),
+                }
+
+    def merge(self, state):
+        """Add the values summarised by another accumulator's `state`.
+
+        :param state: Value of `AtlasStatistics.state`
+        :type state: dict
+        """
+        if not state['count']:
+            return
+        self.min = state['min'] if self.min is None \
+            else min(self.min, state['min'])
+        self.max = state['max'] if self.max is None \
+            else max(self.max, state['max'])
+        self.count += state['count']
+        self.total += state['total']
+        if self.counts is not None and state['counts'] is not None:
+            self.counts += np.asarray(state['counts'], dtype=np.int64)
+
+    @property
+    def as_dict(self):
+        stats = {'min': self.min,
+                 'max': self.max,
+                 'count': self.count,
+                 'mean': self.mean,
+                 }
+        if self.counts is not None:
+            stats['histogram'] = {'bins': self.edges.tolist(),
+                                  'counts': self.counts.tolist()}
+        return stats
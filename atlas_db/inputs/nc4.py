@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from netCDF4 import Dataset
+import numpy as np
 from atlas_db.inputs import AtlasInput
+from atlas_db.constants import INGEST
+from atlas_db.metrics import metrics
 
 
 class AtlasNc4Input(AtlasInput):
@@ -15,6 +17,7 @@ class AtlasNc4Input(AtlasInput):
         """
         super(AtlasNc4Input, self).__init__(*args, **kwargs)
         self.nc_file = nc_file
+        from netCDF4 import Dataset
         self.nc_dataset = Dataset(self.nc_file, 'r')
         self.name = None
         self.human_name = None
@@ -84,3 +87,115 @@ class AtlasNc4Input(AtlasInput):
         if self._lon_var is None:
             self._lon_var = 'lon'
         return self._lon_var
+
+    def slab_rows(self, variable, slab_bytes=None):
+        """Number of latitude rows to read at a time for `variable`: a
+        multiple of the file's chunk size along latitude, so that no HDF5
+        chunk is decompressed twice, sized to about `slab_bytes`.
+
+        :param variable: Variable name
+        :type variable: str
+        :param slab_bytes: Target slab size, defaults to
+         `INGEST['slab_bytes']`
+        :type slab_bytes: int
+        :return: Rows per slab
+        :rtype: int
+        """
+        var = self.nc_dataset.variables[variable]
+        lat_axis = var.dimensions.index(self.lat_var)
+        chunking = var.chunking()
+        chunk_rows = 1 if chunking in [None, 'contiguous'] \
+            else chunking[lat_axis]
+        row_bytes = var.dtype.itemsize * var.size // var.shape[lat_axis]
+        slab_bytes = slab_bytes or INGEST['slab_bytes']
+        rows = max(1, slab_bytes // max(1, row_bytes * chunk_rows))
+        return int(min(rows * chunk_rows, var.shape[lat_axis]))
+
+    def slab_ranges(self, variable, rows=None, align=None):
+        """Latitude index ranges covering `variable`.
+
+        :param variable: Variable name
+        :type variable: str
+        :param rows: Rows per slab, defaults to `slab_rows(variable)`
+        :type rows: int
+        :param align: Only split slabs between global grid rows that are
+         multiples of `align`, so that overview cells never span two slabs
+        :type align: int
+        :return: List of (start, stop) pairs
+        :rtype: list
+        """
+        rows = rows or self.slab_rows(variable)
+        n = len(self.lats)
+        if not align or align <= 1:
+            return [(i, min(i + rows, n)) for i in range(0, n, rows)]
+        blocks = self.grid.rows(self.lats) // align
+        edges = np.flatnonzero(np.diff(blocks)) + 1
+        ranges = list()
+        start = 0
+        for edge in edges.tolist() + [n]:
+            if edge - start >= rows or edge == n:
+                ranges.append((start, edge))
+                start = edge
+        return ranges
+
+    def read_slab(self, variable, start, stop):
+        """Read latitude rows `start:stop` of `variable`, reordered to a
+        C-contiguous (lat, lon, ...) masked array.
+
+        :param variable: Variable name
+        :type variable: str
+        :param start: First latitude index
+        :type start: int
+        :param stop: Latitude index after the last row
+        :type stop: int
+        :return: Slab of values
+        :rtype: np.ma.MaskedArray
+        """
+        var = self.nc_dataset.variables[variable]
+        lat_axis = var.dimensions.index(self.lat_var)
+        lon_axis = var.dimensions.index(self.lon_var)
+        index = [slice(None)] * var.ndim
+        index[lat_axis] = slice(start, stop)
+        axes = [lat_axis, lon_axis] + [i for i in range(var.ndim)
+                                       if i not in [lat_axis, lon_axis]]
+        slab = np.ma.asarray(var[tuple(index)]).transpose(axes)
+        return np.ma.MaskedArray(
+            np.ascontiguousarray(np.ma.getdata(slab)),
+            mask=np.ascontiguousarray(np.ma.getmaskarray(slab)))
+
+    def iter_slabs(self, variable, rows=None, skip=None, align=None):
+        """Stream `variable` in latitude bands so that peak memory is
+        bounded by the slab size rather than the file size. The first
+        complete pass also records the variable's statistics; the
+        statistics of the latest slab are kept in `slab_statistics`.
+
+        :param variable: Variable name
+        :type variable: str
+        :param rows: Rows per slab, defaults to `slab_rows(variable)`
+        :type rows: int
+        :param skip: Called with (start, stop) before reading a slab.
+         Returning the slab's stored `AtlasStatistics.state` skips it.
+        :type skip: function
+        :param align: Passed to `slab_ranges`
+        :type align: int
+        :return: Generator of (start, stop, slab)
+        :rtype: generator
+        """
+        stats = None if variable in self._statistics \
+            else self.new_statistics(variable)
+        for start, stop in self.slab_ranges(variable, rows, align):
+            done = skip(start, stop) if skip is not None else None
+            if done is not None:
+                if stats is not None:
+                    stats.merge(done)
+                continue
+            with metrics.stage('read'):
+                slab = self.read_slab(variable, start, stop)
+            slab_stats = self.new_statistics(variable)
+            slab_stats.update(slab)
+            self.slab_statistics[variable] = slab_stats
+            if stats is not None:
+                stats.merge(slab_stats.state)
+            yield start, stop, slab
+        if stats is not None:
+            self._statistics[variable] = stats
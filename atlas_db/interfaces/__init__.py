@@ -1,6 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
+import numpy as np
+from atlas_db.constants import INGEST
 from atlas_db.ingestors import AtlasIngestor
+from atlas_db.ingestors.encoding import AtlasEncoding, DTYPES, ENCODINGS
+from atlas_db.ingestors.overviews import AtlasOverview
+from atlas_db.inputs.nc4 import AtlasNc4Input
+from atlas_db.metrics import metrics
 
 
 class AtlasInterface(object):
@@ -25,3 +32,276 @@ class AtlasInterface(object):
 
     def ingest(self):
         pass
+
+
+class AtlasNc4Interface(AtlasNc4Input):
+    def __init__(self, backend, *args, **kwargs):
+        """Model interface over a gridded netCDF file. Variables are read
+        in latitude slabs and each slab is handed to the backend as soon
+        as it is read. With `wide` set, all variables are read together
+        and stored as one document per pixel.
+
+        Every ingested slab is recorded in `checkpoint`; with `resume` set,
+        slabs recorded by an earlier run are skipped without being read.
+        Documents already stored, e.g. from a slab that was cut short, are
+        replaced when resuming or with `overwrite` set; otherwise they are
+        an error.
+
+        Each slab is also aggregated into the coarser `overviews` levels
+        (factors of the native resolution), stored in `_x{factor}`
+        collections next to the native one.
+
+        With `encoding` set to 'packed', values are stored as binaries of
+        `packed_dtype`, or else of the smallest integer type that holds
+        each variable's range. With
+        `block_size` set, each document holds a `block_size` x
+        `block_size` block of pixels of one variable, always packed; this
+        cannot be combined with `wide`.
+
+        :param backend: Ingestor for the dataset
+        :type backend: AtlasIngestor
+        """
+        super(AtlasNc4Interface, self).__init__(*args, **kwargs)
+        self.backend = backend
+        self.checkpoint = backend.checkpoint
+        self.no_index = False
+        self.wide = False
+        self.resume = False
+        self.overwrite = False
+        self.overviews = INGEST['overviews']
+        self.overview_method = INGEST['overview_method']
+        self._pyramid = None
+        self.encoding = INGEST['encoding']
+        self.packed_dtype = INGEST['packed_dtype']
+        self._encodings = None
+        self.block_size = INGEST['block_size']
+
+    @property
+    def pyramid(self):
+        """Overview levels of this file, finest first.
+
+        :return: List of overviews
+        :rtype: list
+        :raises ValueError: A factor does not divide the grid's columns
+        """
+        if self._pyramid is None:
+            self._pyramid = [
+                AtlasOverview(self.grid, f, self.overview_method)
+                for f in sorted(set(self.overviews)) if f > 1]
+        return self._pyramid
+
+    @property
+    def encodings(self):
+        """Packed encodings by variable name, empty when values are
+        stored as lists. Every variable takes `packed_dtype` if it is
+        set. Otherwise each variable's range is taken from its declared
+        bounds, see `declared_range`; only variables without any cost a
+        pass over the file, and that range is of this file alone.
+
+        :return: Encodings
+        :rtype: dict
+        :raises ValueError: `encoding` is not one of `ENCODINGS`, or
+         `packed_dtype` not one of `DTYPES`
+        """
+        if self._encodings is None:
+            if self.encoding not in ENCODINGS:
+                raise ValueError('Unknown encoding: {}'.format(
+                    self.encoding))
+            if self.packed_dtype and self.packed_dtype not in DTYPES:
+                raise ValueError('Unknown packed dtype: {}'.format(
+                    self.packed_dtype))
+            self._encodings = dict()
+            if self.encoding == 'packed' or self.block_size:
+                for v in self.variables:
+                    if self.packed_dtype:
+                        self._encodings[v] = AtlasEncoding(self.packed_dtype)
+                        continue
+                    bounds = self.declared_range(v)
+                    if bounds is None:
+                        stats = self.statistics(v)
+                        bounds = stats.min, stats.max
+                    self._encodings[v] = AtlasEncoding.for_range(
+                        bounds[0], bounds[1], self.scaling)
+        return self._encodings
+
+    def check_encodings(self):
+        """Make sure the values are packed as the dataset's stored ones
+        are. Files or tiles ingested into the same collections one at a
+        time would otherwise each record their own encoding, and the
+        metadata would only keep the last one.
+
+        :raises ValueError: A variable's encoding differs from the one in
+         the stored metadata
+        """
+        stored = self.backend.stored_encodings(self.name)
+        for variable, encoding in self.encodings.items():
+            if variable in stored \
+                    and stored[variable]['dtype'] != encoding.dtype.str:
+                raise ValueError(
+                    '{} of {} is stored as {}, not {}; set `packed_dtype` '
+                    'to match.'.format(variable, self.name,
+                                       stored[variable]['dtype'],
+                                       encoding.dtype.str))
+
+    @property
+    def align(self):
+        """Slab row alignment that keeps every overview cell and every
+        block, at each level, in one slab.
+        """
+        factors = [o.factor for o in self.pyramid]
+        if self.block_size:
+            factors = [self.block_size * f for f in [1] + factors]
+        if not factors:
+            return None
+        return int(np.lcm.reduce(factors))
+
+    def ingest(self):
+        self.ingest_data()
+        # Statistics for the metadata come from the ingestion pass.
+        self.backend.ingest_metadata(self.metadata)
+        self.backend.build_indexes(self.name)
+        metrics.log('summary', name=self.name, **metrics.as_dict)
+
+    def ingest_data(self):
+        if self.wide and self.block_size:
+            raise ValueError('Block documents hold a single variable.')
+        if self.block_size:
+            # Fail before the first slab rather than at the last one.
+            self.grid.check_blocks(self.lats, self.lons, self.block_size)
+        self.check_encodings()
+        self.backend.upsert = self.resume or self.overwrite
+        if self.wide:
+            self.ingest_wide()
+        else:
+            for variable in self.variables:
+                self.ingest_variable(variable)
+        self.metadata['wide'] = self.wide
+        self.metadata['block_size'] = self.block_size
+        for meta in self.metadata['variables']:
+            if meta['name'] in self.encodings:
+                meta['encoding'] = self.encodings[meta['name']].as_dict
+        self.metadata['overviews'] = {
+            'factors': [o.factor for o in self.pyramid],
+            'method': self.overview_method}
+
+    def unit(self, start, stop):
+        """Checkpoint unit for latitude rows `start:stop` of this file.
+        """
+        return '{}:{}-{}'.format(os.path.basename(self.nc_file), start, stop)
+
+    def completed(self, variable, key=None):
+        """`skip` callback for `iter_slabs` that looks slabs up in the
+        checkpoint when resuming.
+
+        :param variable: Variable whose statistics to return
+        :type variable: str
+        :param key: Checkpoint variable, if different (None for wide)
+        :type key: str
+        :return: Callback, or None when not resuming
+        :rtype: function
+        """
+        if not self.resume:
+            return None
+
+        def skip(start, stop):
+            record = self.checkpoint.get(self.name, key,
+                                         self.unit(start, stop))
+            return None if record is None else record['stats'][variable]
+
+        return skip
+
+    def ingest_variable(self, variable):
+        name = self.name
+        encoding = self.encodings.get(variable)
+
+        for start, stop, values in self.iter_slabs(
+                variable, skip=self.completed(variable, variable),
+                align=self.align):
+            lats = self.lats[start:stop]
+            # Backends raise when a slab fails, which ends the file here
+            # and leaves the slab unmarked for a resumed run.
+            self.backend.ingest(values, lats, self.lons, name, variable,
+                                no_index=True, grid=self.grid,
+                                encoding=encoding,
+                                block_size=self.block_size)
+            self.ingest_overviews(values, lats, variable)
+            self.checkpoint.mark(
+                name, variable, self.unit(start, stop),
+                {variable: self.slab_statistics[variable].state})
+
+        if not self.no_index:
+            for collection in self.grid_collections(variable):
+                self.backend.index_grid(name, collection)
+
+    def ingest_wide(self):
+        encodings = self.encodings
+        rows = min(self.slab_rows(v) for v in self.variables)
+        slabs = [self.iter_slabs(v, rows, self.completed(v), self.align)
+                 for v in self.variables]
+
+        for band in zip(*slabs):
+            start, stop = band[0][:2]
+            lats = self.lats[start:stop]
+            values = [(v, slab) for v, (_, _, slab)
+                      in zip(self.variables, band)]
+            self.backend.ingest_wide(values, lats, self.lons, self.name,
+                                     no_index=True, grid=self.grid,
+                                     encoding=encodings)
+            self.ingest_overviews(values, lats)
+            self.checkpoint.mark(
+                self.name, None, self.unit(start, stop),
+                {v: self.slab_statistics[v].state for v in self.variables})
+        for slab in slabs:
+            # Run each generator to completion so it records statistics.
+            for _ in slab:
+                pass
+
+        if not self.no_index:
+            for collection in self.grid_collections(None):
+                self.backend.index_grid(self.name, collection)
+
+    def grid_collections(self, variable):
+        """Collections of `variable`, as passed to `index_grid`: the
+        native one and one per overview level.
+
+        :param variable: Variable name, None for wide datasets
+        :type variable: str
+        :return: Collection names, relative to the dataset name
+        :rtype: list
+        """
+        if variable is None:
+            return [None] + [o.suffix(o.factor) for o in self.pyramid]
+        return [variable] + [o.collection(variable, o.factor)
+                             for o in self.pyramid]
+
+    def ingest_overviews(self, values, lats, variable=None):
+        """Aggregate a slab that is already in memory into every overview
+        level and ingest the results.
+
+        :param values: Slab of `variable`, or (variable, slab) pairs for
+         wide datasets
+        :type values: np.ma.MaskedArray or list
+        :param lats: Latitudes of the slab's rows
+        :type lats: np.array
+        :param variable: Variable name, None for wide datasets
+        :type variable: str
+        """
+        for overview in self.pyramid:
+            if variable is None:
+                pairs = [(v, overview.aggregate(slab, lats, self.lons))
+                         for v, slab in values]
+                _, o_lats, o_lons = pairs[0][1]
+                self.backend.ingest_wide(
+                    [(v, agg[0]) for v, agg in pairs], o_lats, o_lons,
+                    overview.collection(self.name, overview.factor),
+                    no_index=True, grid=overview.grid,
+                    encoding=self.encodings)
+            else:
+                o_values, o_lats, o_lons = overview.aggregate(
+                    values, lats, self.lons)
+                self.backend.ingest(
+                    o_values, o_lats, o_lons, self.name,
+                    overview.collection(variable, overview.factor),
+                    no_index=True, grid=overview.grid,
+                    encoding=self.encodings.get(variable),
+                    block_size=self.block_size)
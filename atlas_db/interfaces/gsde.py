@@ -1,52 +1,123 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
-import itertools
-import numpy as np
-import requests
-from lxml import html
-from atlas_db.inputs.nc4 import AtlasNc4Input
+import json
+import hashlib
+import threading
+import multiprocessing as mp
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from atlas_db.interfaces import AtlasNc4Interface
 from atlas_db.ingestors.mongodb import AtlasMongoIngestor
 from atlas_db.constants import BASE_DIR, SCALE
 
 
-class AtlasGsdeTile(AtlasNc4Input):
-    def __init__(self, backend, *args, **kwargs):
+# Tiles are ingested one by one into the same collections, so a packed
+# dtype cannot come from the range of any one tile.
+PACKED_DTYPE = '<i4'
+
+
+class AtlasGsdeTile(AtlasNc4Interface):
+    def __init__(self, *args, **kwargs):
         super(AtlasGsdeTile, self).__init__(*args, **kwargs)
         self.name = 'gsde'
         self.human_name = 'Global Soil Dataset for Earth System Modeling'
-        self.backend = backend
         self.excluded_vars = ['cropland', 'fieldsize', 'elev', 'sldr', 'salb',
                               'slu1', 'slro']
         self.no_index = True
+        self.packed_dtype = self.packed_dtype or PACKED_DTYPE
 
     def ingest(self):
+        self.ingest_data()
         if self.no_index:
             self.backend.ingest_metadata(self.metadata)
-        for variable in self.variables:
-            self.ingest_variable(variable)
+        else:
+            self.backend.build_indexes(self.name)
+
 
-    def ingest_variable(self, variable):
+class AtlasTileCache(object):
+    def __init__(self, directory):
+        """On-disk cache of downloaded tiles keyed by URL. Each file has a
+        `.json` sidecar with the size and ETag it was downloaded with, so
+        a cached tile is reused only while the server still reports them.
 
-        values = self.nc_dataset[variable][:]
+        :param directory: Cache directory
+        :type directory: str
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
 
-        lons_lats = itertools.product(
-            enumerate(self.lats), enumerate(self.lons))
+    def path(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.directory, '{}_{}'.format(
+            digest, url.split('/')[-1]))
 
-        values = np.swapaxes(
-            values, self.nc_dataset.variables[variable].dimensions.index(
-                self.lat_var), 0)
+    def valid(self, url, headers):
+        """Whether the cached copy of `url` matches the server's headers.
 
-        values = np.swapaxes(
-            values, self.nc_dataset.variables[variable].dimensions.index(
-                self.lon_var), 1)
+        :param url: Tile URL
+        :type url: str
+        :param headers: Response headers from a HEAD request
+        :type headers: dict
+        :return: Cached copy can be used
+        :rtype: bool
+        """
+        path = self.path(url)
+        if not os.path.exists(path) or not os.path.exists(path + '.json'):
+            return False
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        size = headers.get('Content-Length')
+        etag = headers.get('ETag')
+        return os.path.getsize(path) == meta['size'] \
+            and (size is None or int(size) == meta['size']) \
+            and (etag is None or etag == meta['etag'])
 
-        self.backend.ingest(values, lons_lats, self.metadata['name'], variable,
-                            no_index=self.no_index)
+    def fetch(self, session, url, chunk_size):
+        """Return the local path of `url`, downloading it unless a valid
+        copy is cached.
+
+        :param session: HTTP session
+        :type session: requests.Session
+        :param url: Tile URL
+        :type url: str
+        :param chunk_size: Download chunk size in bytes
+        :type chunk_size: int
+        :return: Local file
+        :rtype: str
+        """
+        path = self.path(url)
+        head = session.head(url, allow_redirects=True)
+        head.raise_for_status()
+        if self.valid(url, head.headers):
+            return path
+        r = session.get(url, stream=True)
+        r.raise_for_status()
+        partial = path + '.part'
+        with open(partial, 'wb') as f:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+        os.rename(partial, path)
+        with open(path + '.json', 'w') as f:
+            json.dump({'url': url,
+                       'size': os.path.getsize(path),
+                       'etag': r.headers.get('ETag')}, f)
+        return path
+
+    def remove(self, url):
+        for path in (self.path(url), self.path(url) + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
 
 
 class AtlasGsde(object):
-    """Ingestion object for PSIMS.
+    """Ingestion object for GSDE. Tiles are downloaded by a pool of
+    threads into a bounded queue that ingest workers consume, so
+    downloading and ingesting overlap.
 
     """
     def __init__(self, *args, **kwargs):
@@ -56,9 +127,53 @@ class AtlasGsde(object):
         self.url = 'http://users.rcc.uchicago.edu' \
                    '/~davidkelly999/gsde.2deg.tile/'
         self.bounds = dict(lonmin=0, lonmax=180, latmin=0, latmax=90)
+        self.resume = False
+        self.download_threads = 4
+        self.ingest_workers = 2
+        self.queue_size = 8
+        self.chunk_size = 1024 * 1024
+        self.retries = 3
+        self.keep_cache = True
+        self.cache_dir = os.path.join(BASE_DIR, 'data', 'netcdf', 'gsde')
+        self._cache = None
+        self._backend = None
+        self._session = None
+
+    @property
+    def cache(self):
+        """Tile cache in `cache_dir`, created on first use."""
+        if self._cache is None:
+            self._cache = AtlasTileCache(self.cache_dir)
+        return self._cache
+
+    @property
+    def backend(self):
+        """Ingestor for the checkpoint, in-process tiles and indexes."""
+        if self._backend is None:
+            self._backend = AtlasMongoIngestor(SCALE)
+        return self._backend
+
+    @property
+    def session(self):
+        """HTTP session pooling a connection per download thread, which
+        retries failed requests `retries` times.
+        """
+        if self._session is None:
+            import requests
+            from urllib3.util.retry import Retry
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.download_threads,
+                pool_maxsize=self.download_threads,
+                max_retries=Retry(total=self.retries, backoff_factor=.5,
+                                  status_forcelist=(500, 502, 503, 504)))
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+        return self._session
 
     def get_all_tile_dirs(self):
-        response = requests.get(self.url)
+        from lxml import html
+        response = self.session.get(self.url)
         parsed = html.fromstring(response.text)
         links = parsed.xpath('//tr//td//a/@href')
         lat_links = [
@@ -67,7 +182,7 @@ class AtlasGsde(object):
         ]
         lon_lat_links = list()
         for i, lat_link in enumerate(lat_links):
-            response = requests.get(self.url+lat_link)
+            response = self.session.get(self.url+lat_link)
             parsed = html.fromstring(response.text)
             links = parsed.xpath('//tr//td//a/@href')
             lon_links = [
@@ -77,23 +192,107 @@ class AtlasGsde(object):
             ]
             lon_lat_links += [self.url+lat_link+lon_link
                               for lon_link in lon_links]
-        for i, link in enumerate(lon_lat_links):
-            nc_file = self.download_nc4(link)
-            tile = AtlasGsdeTile(AtlasMongoIngestor(SCALE), nc_file, SCALE)
-            tile.no_index = i+1 < len(lon_lat_links)
-            tile.ingest()
-            os.remove(nc_file)
-
-    @staticmethod
-    def download_nc4(url):
-        local_file = os.path.join(BASE_DIR, 'data', 'netcdf', 'gsde',
-                                  url.split('/')[-1])
-        r = requests.get(url, stream=True)
-        with open(local_file, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-        return local_file
+        self.ingest_tiles(lon_lat_links)
+
+    def ingest_tiles(self, links):
+        """Download and ingest tiles concurrently, then build the indexes
+        once every tile is in.
+
+        :param links: Tile URLs
+        :type links: list
+        """
+        links = [link for link in links if not (
+            self.resume and self.backend.checkpoint.get(
+                self.name, None, link.split('/')[-1]) is not None)]
+        pending = queue.Queue()
+        for link in links:
+            pending.put(link)
+        downloaded = queue.Queue(maxsize=self.queue_size)
+        collections = set()
+        errors = list()
+        # Fork the ingest processes before any threads start.
+        pool = mp.Pool(self.ingest_workers) if self.ingest_workers > 0 \
+            else None
+
+        def download():
+            while True:
+                try:
+                    link = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    downloaded.put((link, self.cache.fetch(
+                        self.session, link, self.chunk_size)))
+                except Exception as e:
+                    errors.append((link, e))
+
+        def ingest():
+            while True:
+                item = downloaded.get()
+                if item is None:
+                    return
+                link, nc_file = item
+                try:
+                    collections.update(self.ingest_tile(nc_file, pool))
+                    self.backend.checkpoint.mark(self.name, None,
+                                                 link.split('/')[-1])
+                    if not self.keep_cache:
+                        self.cache.remove(link)
+                except Exception as e:
+                    errors.append((link, e))
+
+        downloaders = [threading.Thread(target=download)
+                       for _ in range(self.download_threads)]
+        ingestors = [threading.Thread(target=ingest)
+                     for _ in range(max(1, self.ingest_workers))]
+        for t in downloaders + ingestors:
+            t.daemon = True
+            t.start()
+        for t in downloaders:
+            t.join()
+        for _ in ingestors:
+            downloaded.put(None)
+        for t in ingestors:
+            t.join()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        for link, e in errors:
+            print('Failed tile {}: {!r}'.format(link, e))
+        if errors:
+            raise Exception('{} of {} tiles failed.'.format(
+                len(errors), len(links)))
+
+        for collection in sorted(collections):
+            self.backend.index_grid(self.name, collection)
+        self.backend.build_indexes(self.name)
+
+    def ingest_tile(self, nc_file, pool=None):
+        """Ingest one downloaded tile without building indexes. Runs in
+        `pool` if given, since netCDF reads are not thread-safe.
+
+        :param nc_file: Path to the tile
+        :type nc_file: str
+        :param pool: Ingest worker processes
+        :type pool: multiprocessing.Pool
+        :return: Collections written, overviews included
+        :rtype: list
+        """
+        if pool is not None:
+            return pool.apply(ingest_tile, (nc_file, self.resume))
+        return ingest_tile(nc_file, self.resume, self.backend)
+
+    def download_nc4(self, url):
+        return self.cache.fetch(self.session, url, self.chunk_size)
+
+
+def ingest_tile(nc_file, resume, backend=None):
+    tile = AtlasGsdeTile(backend or AtlasMongoIngestor(SCALE), nc_file, SCALE)
+    tile.no_index = True
+    tile.resume = resume
+    tile.ingest()
+    return [c for v in tile.variables for c in tile.grid_collections(v)]
 
 
 if __name__ == '__main__':
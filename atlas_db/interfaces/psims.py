@@ -1,62 +1,51 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import itertools
-import numpy as np
-from atlas_db.inputs.nc4 import AtlasNc4Input
-from atlas_db.ingestors.mongodb import AtlasMongoIngestor
-from atlas_db.constants import SCALE
+from atlas_db.interfaces import AtlasNc4Interface
 
 
-class AtlasPsims(AtlasNc4Input):
+class AtlasPsims(AtlasNc4Interface):
     """Ingestion object for PSIMS.
 
     """
-    def __init__(self, backend, *args, **kwargs):
+    def __init__(self, *args, **kwargs):
         super(AtlasPsims, self).__init__(*args, **kwargs)
-        self.name = ''.join(self.nc_file.split('/')[-1].split('.')[:-1])
-        params = ['agricultural_model', 'climate_model', None, 'harms',
-                  'irrigation', 'variable', 'crop']
-        self.parameters = {
-            params[i]: v for i, v in enumerate(self.name.split('_'))
-            if i in [0, 1, 2, 3, 4, 5, 6]}
+        self.name, self.parameters = self.parse_name(self.nc_file)
         # self.name = '_'.join(self.name.split('_')[3:5])
         self.human_name = 'pSIMS: {0} {1} {2}'.format(
             self.parameters['agricultural_model'],
             self.parameters['climate_model'],
             self.parameters['irrigation'])
-        self.backend = backend
-
-    def ingest(self):
-        self.backend.ingest_metadata(self.metadata)
-        for variable in self.variables:
-            self.ingest_variable(variable)
-
-    def ingest_variable(self, variable):
-
-        print(variable)
-
-        values = self.nc_dataset[variable][:]
 
-        lons_lats = itertools.product(
-            enumerate(self.lats), enumerate(self.lons))
-
-        values = np.swapaxes(
-            values, self.nc_dataset.variables[variable].dimensions.index(
-                self.lat_var), 0)
-
-        values = np.swapaxes(
-            values, self.nc_dataset.variables[variable].dimensions.index(
-                self.lon_var), 1)
-
-        self.backend.ingest(values, lons_lats, self.metadata['name'], variable)
+    @staticmethod
+    def parse_name(nc_file):
+        """Dataset name and parameters from the name of a pSIMS file,
+        e.g. papsim_wfdei.cru_hist_default_firr_whe_annual_1979_2012.nc4.
+        The file is not opened.
+
+        :param nc_file: Path to the file
+        :type nc_file: str
+        :return: Dataset name and parameters
+        :rtype: tuple
+        """
+        name = ''.join(nc_file.split('/')[-1].split('.')[:-1])
+        params = ['agricultural_model', 'climate_model', None, 'harms',
+                  'irrigation', 'variable', 'crop']
+        parameters = {
+            params[i]: v for i, v in enumerate(name.split('_'))
+            if i in [0, 1, 2, 3, 4, 5, 6]}
+        missing = [p for p in ('agricultural_model', 'climate_model',
+                               'irrigation') if p not in parameters]
+        if missing:
+            raise ValueError('{} is not a pSIMS file name; missing {}.'.format(
+                nc_file, ', '.join(missing)))
+        return name, parameters
 
 
 if __name__ == '__main__':
     import os
+    import sys
     from atlas_db.constants import BASE_DIR
-    _filename = '{}_{}_{}_{}_{}_{}_{}_{}_{}.nc4'.format(
-        'papsim', 'wfdei.cru', 'hist', 'default', 'firr', 'whe',
-        'annual', 1979, 2012)
-    NC_FILE = os.path.join(BASE_DIR, 'data', 'netcdf', 'psims', _filename)
-    p = AtlasPsims(AtlasMongoIngestor(SCALE), NC_FILE, SCALE)
-    p.ingest()
+    from atlas_db.interfaces.scheduler import main
+    # Ingest every file of the pSIMS data directory unless told otherwise.
+    sys.exit(main(sys.argv[1:] or [
+        os.path.join(BASE_DIR, 'data', 'netcdf', 'psims')]))
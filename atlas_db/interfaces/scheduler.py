@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import glob
+import time
+import argparse
+import traceback
+import multiprocessing as mp
+from atlas_db.constants import INGEST, SCALE
+from atlas_db.metrics import metrics
+
+
+class AtlasScheduler(object):
+    def __init__(self, interface=None, backend=None, scaling=SCALE,
+                 processes=None, resume=False, overwrite=False):
+        """Ingest many files, one per worker process, on a bounded
+        process pool. Largest files are started first so that the batch
+        does not end waiting on one big file. A file that fails is
+        reported and the rest of the batch carries on.
+
+        The pool is sized to the cores and to `INGEST['max_writers']`,
+        the bulk writes the server should see at once: each worker keeps
+        up to `INGEST['in_flight']` writes outstanding.
+
+        :param interface: Interface class, called as
+         `interface(backend, path, scaling)`, defaults to `AtlasPsims`
+        :type interface: type
+        :param backend: Ingestor class, called as `backend(scaling)`,
+         defaults to `AtlasMongoIngestor`
+        :type backend: type
+        :param scaling: Number of decimals to keep
+        :type scaling: int
+        :param processes: Worker processes, defaults to `processes_for`
+        :type processes: int
+        :param resume: Skip slabs recorded by an earlier run, see
+         `AtlasNc4Interface`
+        :type resume: bool
+        :param overwrite: Replace documents stored by an earlier run, see
+         `AtlasNc4Interface`
+        :type overwrite: bool
+        """
+        if interface is None:
+            from atlas_db.interfaces.psims import AtlasPsims
+            interface = AtlasPsims
+        if backend is None:
+            from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+            backend = AtlasMongoIngestor
+        self.interface = interface
+        self.backend = backend
+        self.scaling = scaling
+        self.processes = processes
+        self.resume = resume
+        self.overwrite = overwrite
+
+    @staticmethod
+    def processes_for(n_files):
+        """Worker processes for a batch of `n_files` files.
+
+        :return: Number of processes
+        :rtype: int
+        """
+        writes = max(1, INGEST['in_flight'])
+        return max(1, min(mp.cpu_count(), INGEST['max_writers'] // writes,
+                          n_files))
+
+    @staticmethod
+    def find(paths, pattern='*.nc4'):
+        """Files to ingest: each path is a file, a directory searched for
+        `pattern`, or a glob.
+
+        :param paths: Files, directories or globs
+        :type paths: list
+        :return: Paths, largest first
+        :rtype: list
+        """
+        files = list()
+        for path in paths:
+            if os.path.isdir(path):
+                files += glob.glob(os.path.join(path, pattern))
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                files += glob.glob(path)
+        files = sorted(set(os.path.abspath(f) for f in files))
+        return sorted(files, key=os.path.getsize, reverse=True)
+
+    def plan(self, files):
+        """Split `files` into tasks and files rejected up front: names
+        the interface cannot parse, and names already taken by another
+        file of the batch, which would be written to the same
+        collections.
+
+        :return: Tasks, and a result for each rejected file
+        :rtype: tuple
+        """
+        parse = getattr(self.interface, 'parse_name', None)
+        tasks = list()
+        rejected = list()
+        names = dict()
+        for path in files:
+            try:
+                name = parse(path)[0] if parse is not None else path
+            except ValueError as e:
+                rejected.append(dict(path=path, error=str(e)))
+                continue
+            if name in names:
+                rejected.append(dict(
+                    path=path, name=name,
+                    error='Dataset {} is also ingested from {}.'.format(
+                        name, names[name])))
+                continue
+            names[name] = path
+            tasks.append((self.interface, self.backend, self.scaling, path,
+                          self.resume, self.overwrite))
+        return tasks, rejected
+
+    def run(self, paths, progress=True, pattern='*.nc4'):
+        """Ingest every file found in `paths`.
+
+        :param paths: Files, directories or globs, see `find`
+        :type paths: list
+        :param progress: Print a line as each file completes
+        :type progress: bool
+        :param pattern: Files to take from directories
+        :type pattern: str
+        :return: Batch summary with a result for each file
+        :rtype: dict
+        """
+        files = self.find(paths, pattern)
+        tasks, results = self.plan(files)
+        total_bytes = sum(os.path.getsize(t[3]) for t in tasks)
+        processes = self.processes or self.processes_for(len(tasks))
+        status = dict(files=len(files), done=0, bytes=0, docs=0,
+                      total_bytes=total_bytes, start=time.time())
+        for result in results:
+            self.report(result, status, progress)
+        metrics.reset()
+        if tasks:
+            pool = mp.Pool(processes)
+            try:
+                for result in pool.imap_unordered(ingest_file, tasks,
+                                                  chunksize=1):
+                    if result.get('metrics'):
+                        metrics.merge(result.pop('metrics'))
+                    results.append(result)
+                    self.report(result, status, progress)
+                pool.close()
+            except BaseException:
+                # E.g. Ctrl-C: stop the files still running.
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        seconds = time.time() - status['start']
+        failed = [r for r in results if r.get('error')]
+        summary = dict(files=len(files), ingested=len(results) - len(failed),
+                       failed=len(failed), processes=processes,
+                       seconds=seconds, bytes=status['bytes'],
+                       docs=status['docs'],
+                       bytes_per_second=status['bytes'] / seconds
+                       if seconds else 0.,
+                       docs_per_second=status['docs'] / seconds
+                       if seconds else 0.,
+                       results=results, metrics=metrics.as_dict)
+        metrics.log('batch', **dict((k, v) for k, v in summary.items()
+                                    if k not in ('results', 'metrics')))
+        return summary
+
+    @staticmethod
+    def report(result, status, progress=True):
+        """Add a file's result to the batch status and print progress.
+        """
+        status['done'] += 1
+        status['bytes'] += result.get('bytes', 0)
+        status['docs'] += result.get('docs', 0)
+        metrics.log('file', **result)
+        if not progress:
+            return
+        elapsed = time.time() - status['start']
+        rate = status['bytes'] / elapsed if elapsed else 0.
+        remaining = status['total_bytes'] - status['bytes']
+        line = '[{}/{}] {:.1f}/{:.1f} MB, {:.2f} MB/s, {:.0f} docs/s'.format(
+            status['done'], status['files'], status['bytes'] / 1e6,
+            status['total_bytes'] / 1e6, rate / 1e6,
+            status['docs'] / elapsed if elapsed else 0.)
+        if rate and remaining:
+            line += ', ~{:.0f}s left'.format(remaining / rate)
+        if result.get('error'):
+            line += ' | FAILED {}: {}'.format(
+                os.path.basename(result['path']),
+                result['error'].strip().splitlines()[-1])
+        else:
+            line += ' | {} in {:.1f}s'.format(
+                os.path.basename(result['path']), result['seconds'])
+        print(line)
+        sys.stdout.flush()
+
+
+def ingest_file(task):
+    """Worker side of `AtlasScheduler.run`: ingest one file. Errors are
+    returned rather than raised, so one bad file does not stop the
+    batch.
+
+    :return: Path, worker pid, dataset name, input bytes, documents
+     written, seconds, and the metrics of the file or the error
+    :rtype: dict
+    """
+    interface, backend, scaling, path, resume, overwrite = task
+    result = dict(path=path, worker=os.getpid())
+    metrics.reset()
+    start = time.time()
+    try:
+        ingestor = backend(scaling)
+        dataset = interface(ingestor, path, scaling)
+        dataset.resume = resume
+        dataset.overwrite = overwrite
+        result['name'] = dataset.name
+        dataset.ingest()
+        stats = getattr(ingestor, 'stats', None) or dict()
+        result.update(bytes=os.path.getsize(path),
+                      docs=stats.get('docs', 0), metrics=metrics.as_dict)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.time() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Ingest every pSIMS file in directories or globs.')
+    parser.add_argument('paths', nargs='+',
+                        help='Files, directories or globs of .nc4 files')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Files ingested at once (default: cores, '
+                             'bounded by the write budget)')
+    parser.add_argument('--pattern', default='*.nc4',
+                        help='Files to take from directories')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip slabs ingested by an earlier run')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Replace documents stored by an earlier run')
+    args = parser.parse_args(argv)
+    scheduler = AtlasScheduler(processes=args.processes, resume=args.resume,
+                               overwrite=args.overwrite)
+    summary = scheduler.run(args.paths, pattern=args.pattern)
+    if not summary['files']:
+        sys.stderr.write('No files found.\n')
+        return 1
+    print('{} of {} files ingested in {:.1f}s, {:.2f} MB/s, '
+          '{:.0f} docs/s'.format(summary['ingested'], summary['files'],
+                                 summary['seconds'],
+                                 summary['bytes_per_second'] / 1e6,
+                                 summary['docs_per_second']))
+    for result in summary['results']:
+        if result.get('error'):
+            sys.stderr.write('{}\n{}\n'.format(result['path'],
+                                               result['error']))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
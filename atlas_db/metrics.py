@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from atlas_db.constants import METRICS
+
+
+STAGES = ['read', 'transform', 'encode', 'write', 'index']
+
+
+class AtlasMetrics(object):
+    def __init__(self, log=None, profile_dir=None):
+        """Process-local ingestion metrics: seconds and calls per stage,
+        counters, and the throughput of each pool worker. Stages are
+        timed where they run, so on the writer thread `write` overlaps
+        `transform` and `encode` and the stage seconds can add up to more
+        than the wall time.
+
+        Events are appended to `log` as JSON lines if it is set. With
+        `profile_dir` set, profiled calls (see `profiled`) each write a
+        cProfile `.prof` file there.
+
+        :param log: JSON-lines log file, defaults to `METRICS['log']`
+        :type log: str
+        :param profile_dir: Profile output directory, defaults to
+         `METRICS['profile_dir']`
+        :type profile_dir: str
+        """
+        self._log_path = log
+        self._profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._profiles = 0
+        self.reset()
+
+    @property
+    def log_path(self):
+        return METRICS['log'] if self._log_path is None else self._log_path
+
+    @log_path.setter
+    def log_path(self, value):
+        self._log_path = value
+
+    @property
+    def profile_dir(self):
+        return METRICS['profile_dir'] if self._profile_dir is None \
+            else self._profile_dir
+
+    @profile_dir.setter
+    def profile_dir(self, value):
+        self._profile_dir = value
+
+    def reset(self):
+        with self._lock:
+            self.stages = dict()
+            self.counters = dict()
+            self.workers = dict()
+
+    def add_time(self, stage, seconds, calls=1):
+        with self._lock:
+            totals = self.stages.setdefault(stage, dict(seconds=0., calls=0))
+            totals['seconds'] += seconds
+            totals['calls'] += calls
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of a `with` block as stage `name`.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+
+    def timed(self, items, stage):
+        """Iterate over `items`, timing the production of each item (but
+        not its consumption) as `stage`. Used for lazy document builders.
+
+        :param items: Iterable to time
+        :type items: iterable
+        :param stage: Stage name
+        :type stage: str
+        :return: Generator of the items
+        :rtype: generator
+        """
+        iterator = iter(items)
+        seconds = 0.
+        calls = 0
+        try:
+            while True:
+                start = time.time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.time() - start
+                calls += 1
+                yield item
+        finally:
+            self.add_time(stage, seconds, calls)
+
+    def worker(self, pid, docs, seconds):
+        """Record a task run by the pool worker `pid`.
+
+        :param pid: Worker process id
+        :type pid: int
+        :param docs: Documents the task wrote
+        :type docs: int
+        :param seconds: Seconds the task took
+        :type seconds: float
+        """
+        with self._lock:
+            totals = self.workers.setdefault(
+                pid, dict(docs=0, seconds=0., tasks=0))
+            totals['docs'] += docs
+            totals['seconds'] += seconds
+            totals['tasks'] += 1
+
+    def merge(self, state):
+        """Add the `as_dict` of another process's metrics to these.
+        """
+        for stage, totals in state['stages'].items():
+            self.add_time(stage, totals['seconds'], totals['calls'])
+        for name, n in state['counters'].items():
+            self.count(name, n)
+        for pid, totals in state['workers'].items():
+            with self._lock:
+                mine = self.workers.setdefault(
+                    int(pid), dict(docs=0, seconds=0., tasks=0))
+                for key in mine:
+                    mine[key] += totals[key]
+
+    @property
+    def as_dict(self):
+        """Snapshot of the metrics, with the docs/s of each worker.
+
+        :return: Stages, counters and workers
+        :rtype: dict
+        """
+        with self._lock:
+            workers = dict()
+            for pid, totals in self.workers.items():
+                workers[pid] = dict(totals)
+                workers[pid]['docs_per_second'] = \
+                    totals['docs'] / totals['seconds'] \
+                    if totals['seconds'] else 0.
+            return {'stages': {k: dict(v) for k, v in self.stages.items()},
+                    'counters': dict(self.counters),
+                    'workers': workers}
+
+    def log(self, event, **fields):
+        """Append an event to the JSON-lines log, if there is one.
+
+        :param event: Event name
+        :type event: str
+        """
+        if not self.log_path:
+            return
+        record = dict(fields, event=event, time=time.time(), pid=os.getpid())
+        line = json.dumps(record, sort_keys=True, default=str)
+        with self._lock:
+            with open(self.log_path, 'a') as f:
+                f.write(line + '\n')
+
+    def profile_path(self, name):
+        """Path for the next profile of `name`, or None when profiling
+        is off.
+        """
+        if not self.profile_dir:
+            return None
+        with self._lock:
+            self._profiles += 1
+            n = self._profiles
+        if not os.path.isdir(self.profile_dir):
+            os.makedirs(self.profile_dir)
+        return os.path.join(self.profile_dir, '{}_{}_{}.prof'.format(
+            name, os.getpid(), n))
+
+    def profiled(self, name, f, *args, **kwargs):
+        """Call `f` under cProfile if `profile_dir` is set, saving the
+        profile for `pstats` or snakeviz.
+
+        :return: Result of `f`
+        """
+        path = self.profile_path(name)
+        if path is None:
+            return f(*args, **kwargs)
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(f, *args, **kwargs)
+        finally:
+            profile.dump_stats(path)
+            self.log('profile', name=name, path=path)
+
+
+metrics = AtlasMetrics()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from atlas_db import constants
+from atlas_db.clients import registry
+
+
+@pytest.fixture(autouse=True)
+def settings():
+    """Run every test on the built-in defaults rather than the local
+    config file. Call the fixture with sections of values to override,
+    e.g. `settings(ingest={'overviews': (2, )})`.
+    """
+    def configure(**sections):
+        constants.configure(os.devnull, sections)
+
+    configure()
+    yield configure
+    constants.configure()
+
+
+@pytest.fixture
+def memory():
+    """`registry` backed by a fresh in-process Mongo stand-in.
+    """
+    pytest.importorskip('mongomock')
+    from atlas_db.benchmarks.memory import AtlasMemoryClient
+    registry.close()
+    registry.factory = AtlasMemoryClient
+    yield registry
+    registry.close()
+    registry.factory = None
+
+
+@pytest.fixture
+def psims_path(tmp_path):
+    """Small pSIMS-shaped file: 4 degree grid, 5 years, two variables.
+    """
+    pytest.importorskip('netCDF4')
+    from atlas_db.benchmarks.fixtures import psims_file
+    return psims_file(str(tmp_path), n_lats=45, n_lons=90, n_times=5,
+                      n_variables=2, mask_density=0.5)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+from atlas_db.constants import SCALE
+from atlas_db.extractors.aio import AtlasAsyncMongoExtractor
+from atlas_db.extractors.mongodb import AtlasMongoExtractor
+
+WORLD = (-180, -90, 180, -90, 180, 90, -180, 90)
+
+
+class SlowExtractor(AtlasAsyncMongoExtractor):
+    """Extractor whose queries wait for `release`, recording how many
+    run at once and which were cancelled.
+    """
+    def __init__(self, *args, **kwargs):
+        super(SlowExtractor, self).__init__(*args, **kwargs)
+        self.running = 0
+        self.most = 0
+        self.cancelled = list()
+        self.release = dict()
+
+    async def quadrilateral(self, metadata, variable, *args, **kwargs):
+        self.running += 1
+        self.most = max(self.most, self.running)
+        try:
+            await self.release.setdefault(variable, asyncio.Event()).wait()
+            return [variable]
+        except asyncio.CancelledError:
+            self.cancelled.append(variable)
+            raise
+        finally:
+            self.running -= 1
+
+
+def test_fan_out(memory, psims_path):
+    from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+    from atlas_db.interfaces.psims import AtlasPsims
+    dataset = AtlasPsims(AtlasMongoIngestor(SCALE), psims_path, SCALE)
+    dataset.ingest()
+    targets = [(dataset.name, 'var0'), (dataset.name, 'var1')]
+    extractor = AtlasAsyncMongoExtractor(concurrency=2)
+    try:
+        results = extractor.quadrilaterals(targets, *WORLD, limit=0,
+                                           budget=10 ** 6)
+    finally:
+        extractor.close()
+    assert sorted(results) == sorted(targets)
+    for name, variable in targets:
+        sync = AtlasMongoExtractor()
+        sync.set_grid_db(name, variable)
+        assert results[(name, variable)] == sync.quadrilateral(
+            *WORLD, limit=0, budget=10 ** 6)
+
+
+def test_concurrency_bound():
+    extractor = SlowExtractor(concurrency=2)
+
+    async def run():
+        results = list()
+        async for target, docs in extractor.iter_quadrilaterals(
+                [('ds', str(i)) for i in range(6)], *WORLD):
+            results.append(docs[0])
+            # Let the next query in only once this one is out.
+            for event in extractor.release.values():
+                if not event.is_set():
+                    event.set()
+                    break
+        return results
+
+    async def start():
+        task = asyncio.ensure_future(run())
+        while not extractor.release:
+            await asyncio.sleep(0)
+        next(iter(extractor.release.values())).set()
+        return await task
+
+    assert sorted(asyncio.run(start())) == [str(i) for i in range(6)]
+    assert extractor.most == 2
+    extractor.close()
+
+
+def test_cancel_consumer_cancels_pending_queries():
+    extractor = SlowExtractor(concurrency=4)
+
+    async def run():
+        got = list()
+
+        async def consume():
+            async for target, docs in extractor.iter_quadrilaterals(
+                    [('ds', v) for v in 'abcd'], *WORLD):
+                got.append(target)
+
+        task = asyncio.ensure_future(consume())
+        while extractor.running < 4:
+            await asyncio.sleep(0)
+        extractor.release['a'].set()
+        while not got:
+            await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return got
+
+    assert asyncio.run(run()) == [('ds', 'a')]
+    assert sorted(extractor.cancelled) == ['b', 'c', 'd']
+    assert extractor.running == 0
+    extractor.close()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import pytest
+
+pytest.importorskip('netCDF4')
+from atlas_db.benchmarks import run  # noqa: E402
+
+
+def test_ingest_can_be_repeated(memory, psims_path):
+    name, first = run.bench_ingest(psims_path)
+    stored = memory.grid(name, 'var0').count_documents({})
+    second = run.bench_ingest(psims_path)[1]
+    assert first['docs'] == second['docs'] > 0
+    assert memory.grid(name, 'var0').count_documents({}) == stored
+
+
+def test_parallel_ingest_can_be_repeated(memory, psims_path):
+    first = run.bench_parallel_ingest(psims_path, 'var0', 1)
+    second = run.bench_parallel_ingest(psims_path, 'var0', 1)
+    assert first['docs'] == second['docs'] > 0
+
+
+def test_smoke(memory, tmp_path):
+    output = str(tmp_path / 'report.json')
+    report = run.main(['--memory', '--lats', '18', '--lons', '36',
+                       '--times', '3', '--queries', '2', '--sizes', '10',
+                       '45', '--processes', '1', '--output', output])
+    with open(output) as f:
+        assert json.load(f)['backend'] == 'memory'
+    results = report['results']
+    assert results['ingest']['docs'] > 0
+    assert 0 < results['parallel_ingest']['docs'] < \
+        results['ingest']['docs']
+    assert sorted(results['quadrilateral']) == ['10', '45']
+    assert results['quadrilateral']['45']['n'] == 2
+
+
+def test_gsde_can_be_repeated(memory, tmp_path):
+    from atlas_db.benchmarks.fixtures import gsde_file
+    path = gsde_file(str(tmp_path), res=.25, n_depths=2)
+    assert run.bench_gsde(path)['docs'] == run.bench_gsde(path)['docs'] > 0
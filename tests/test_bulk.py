@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import bson
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+from atlas_db.ingestors.bulk import AtlasBulkWriter, DUPLICATE_KEY
+
+
+class FlakyCollection(object):
+    def __init__(self, failures=()):
+        """Collection whose `insert_many` calls fail with `failures` in
+        turn, each a function taking the batch that stores part of it
+        and returns an exception, before succeeding.
+        """
+        self.docs = dict()
+        self.failures = list(failures)
+        self.calls = 0
+
+    def with_options(self, **kwargs):
+        return self
+
+    def insert_many(self, docs, ordered=True):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)(self, docs)
+        for doc in docs:
+            self.store(doc)
+
+    def store(self, doc):
+        doc = bson.decode(doc.raw)
+        if doc['_id'] in self.docs:
+            return False
+        self.docs[doc['_id']] = doc
+        return True
+
+    def landed(self, n):
+        """Failure that stores the first `n` documents, then drops the
+        connection.
+        """
+        def fail(collection, docs):
+            for doc in docs[:n]:
+                collection.store(doc)
+            return AutoReconnect('connection reset')
+        return fail
+
+    @staticmethod
+    def duplicates(collection, docs):
+        """Failure of an insert over documents that already exist."""
+        inserted = [collection.store(doc) for doc in docs]
+        return BulkWriteError({
+            'nInserted': sum(inserted),
+            'writeErrors': [{'index': i, 'code': DUPLICATE_KEY}
+                            for i, ok in enumerate(inserted) if not ok]})
+
+
+def docs(n, start=0):
+    return [{'_id': i, 'properties': {'values': [i]}}
+            for i in range(start, start + n)]
+
+
+def test_batches_by_count_and_bytes():
+    collection = FlakyCollection()
+    writer = AtlasBulkWriter(collection, batch_docs=3, batch_bytes=10 ** 6,
+                             in_flight=0, write_concern=None)
+    with writer:
+        writer.extend(docs(7))
+    assert collection.calls == 3
+    assert writer.stats['docs'] == 7
+    assert writer.stats['batches'] == 3
+    assert sorted(collection.docs) == list(range(7))
+
+    collection = FlakyCollection()
+    size = len(bson.encode(docs(1)[0]))
+    writer = AtlasBulkWriter(collection, batch_docs=100,
+                             batch_bytes=2 * size, in_flight=1,
+                             write_concern=None)
+    with writer:
+        writer.extend(docs(5))
+    assert collection.calls == 3
+    assert writer.stats['docs'] == 5
+
+
+def test_duplicate_key_on_first_attempt_raises():
+    collection = FlakyCollection()
+    collection.docs[1] = {'_id': 1}
+    collection.failures = [FlakyCollection.duplicates]
+    writer = AtlasBulkWriter(collection, batch_docs=10, in_flight=0,
+                             write_concern=None)
+    writer.extend(docs(3))
+    with pytest.raises(BulkWriteError):
+        writer.close()
+    assert writer.stats['docs'] == 0
+
+
+def test_retried_batch_tolerates_documents_that_landed():
+    collection = FlakyCollection()
+    collection.failures = [collection.landed(2), FlakyCollection.duplicates]
+    writer = AtlasBulkWriter(collection, batch_docs=10, in_flight=0,
+                             retries=2, backoff=0, write_concern=None)
+    with writer:
+        writer.extend(docs(5))
+    assert sorted(collection.docs) == list(range(5))
+    assert writer.stats['retries'] == 1
+    # Only the documents the final attempt inserted are counted.
+    assert writer.stats['docs'] == 3
+    assert writer.stats['duplicates'] == 2
+
+
+def test_errors_on_the_writer_thread_are_raised():
+    collection = FlakyCollection()
+    collection.failures = [collection.landed(0)] * 3
+    writer = AtlasBulkWriter(collection, batch_docs=2, in_flight=1,
+                             retries=1, backoff=0, write_concern=None)
+    with pytest.raises(AutoReconnect):
+        with writer:
+            writer.extend(docs(6))
+
+
+def test_upsert_replaces_existing_documents(memory):
+    collection = memory.collection('upserts')
+    with AtlasBulkWriter(collection, batch_docs=4, in_flight=0,
+                         write_concern=None) as writer:
+        writer.extend(docs(6))
+    replaced = [dict(d, properties={'values': [-1]}) for d in docs(4, 4)]
+    with AtlasBulkWriter(collection, batch_docs=4, in_flight=0,
+                         write_concern=None, upsert=True) as writer:
+        writer.extend(replaced)
+    assert writer.stats['docs'] == 4
+    stored = {d['_id']: d['properties']['values'] for d in collection.find()}
+    assert len(stored) == 8
+    assert stored[3] == [3] and stored[5] == [-1] and stored[7] == [-1]
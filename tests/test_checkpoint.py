@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+from atlas_db.ingestors.checkpoint import (
+    AtlasCheckpoint, AtlasFileCheckpoint, AtlasMongoCheckpoint)
+
+
+@pytest.fixture(params=['memory', 'file', 'mongo'])
+def checkpoint(request, tmp_path):
+    if request.param == 'memory':
+        return lambda: AtlasCheckpoint()
+    if request.param == 'file':
+        path = str(tmp_path / 'checkpoint.jsonl')
+        return lambda: AtlasFileCheckpoint(path)
+    mongomock = pytest.importorskip('mongomock')
+    collection = mongomock.MongoClient().db.checkpoint
+    return lambda: AtlasMongoCheckpoint(collection)
+
+
+def test_mark_and_get(checkpoint):
+    c = checkpoint()
+    assert c.get('ds', 'var0', '0:10') is None
+    c.mark('ds', 'var0', '0:10', {'var0': {'count': 3}})
+    c.mark('ds', None, 'tile')
+    record = c.get('ds', 'var0', '0:10')
+    assert record['unit'] == '0:10'
+    assert record['stats'] == {'var0': {'count': 3}}
+    assert c.get('ds', None, 'tile')['variable'] is None
+    assert c.get('ds', 'var1', '0:10') is None
+
+
+def test_clear_keeps_other_datasets(checkpoint):
+    c = checkpoint()
+    c.mark('ds', 'var0', '0:10')
+    c.mark('other', 'var0', '0:10')
+    c.clear('ds')
+    assert c.get('ds', 'var0', '0:10') is None
+    assert c.get('other', 'var0', '0:10') is not None
+
+
+def test_file_checkpoint_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    AtlasFileCheckpoint(path).mark('ds', 'var0', '0:10')
+    AtlasFileCheckpoint(path).mark('ds', 'var0', '10:20')
+    c = AtlasFileCheckpoint(path)
+    assert c.get('ds', 'var0', '0:10') is not None
+    assert c.get('ds', 'var0', '10:20') is not None
+    c.clear('ds')
+    assert AtlasFileCheckpoint(path).get('ds', 'var0', '0:10') is None
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+from atlas_db.clients import AtlasMongoRegistry, AtlasElasticRegistry
+
+
+class FakeClient(dict):
+    closed = 0
+
+    def __missing__(self, name):
+        self[name] = FakeClient()
+        return self[name]
+
+    def close(self):
+        FakeClient.closed += 1
+
+
+def settings(**overrides):
+    values = dict(local=True, port=27017, database='test',
+                  max_pool_size=10, connect_timeout_ms=100,
+                  server_selection_timeout_ms=100, socket_timeout_ms=None,
+                  write_concern=1)
+    values.update(overrides)
+    return values
+
+
+def test_registry_shares_client_and_collections():
+    built = list()
+
+    def factory():
+        built.append(FakeClient())
+        return built[-1]
+
+    registry = AtlasMongoRegistry(settings(), factory)
+    assert registry.collection('a') is registry.collection('a')
+    assert registry.grid('ds', 'var') is registry.collection('ds_var')
+    assert registry.grid('ds', None) is registry.collection('ds')
+    assert len(built) == 1
+
+
+def test_registry_rebuilds_client_after_fork():
+    built = list()
+
+    def factory():
+        built.append(FakeClient())
+        return built[-1]
+
+    registry = AtlasMongoRegistry(settings(), factory)
+    first = registry.client
+    # As seen by a forked child: the pid no longer matches.
+    registry._pid = os.getpid() + 1
+    closed = FakeClient.closed
+    assert registry.client is not first
+    # The parent's client is dropped, not closed.
+    assert FakeClient.closed == closed
+    assert len(built) == 2
+
+
+def test_registry_options_skip_unset_values():
+    options = AtlasMongoRegistry(settings()).options
+    assert 'socketTimeoutMS' not in options
+    assert options['maxPoolSize'] == 10
+
+
+def test_elastic_index_names():
+    assert AtlasElasticRegistry.index('PSims', 'Yield') == 'psims_yield'
+    assert AtlasElasticRegistry.index('PSims', None) == 'psims'
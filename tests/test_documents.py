@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+from atlas_db.ingestors.mongodb import AtlasMongoDocument
+
+
+def values_grid():
+    rng = np.random.RandomState(0)
+    data = rng.uniform(-50, 50, (4, 5, 3))
+    mask = np.zeros(data.shape, dtype=bool)
+    mask[0, 0] = True          # whole pixel masked
+    mask[1, 2, 1] = True       # one null element
+    data[2, 3, 0] = np.nan     # NaN counts as null
+    return np.ma.MaskedArray(data, mask=mask)
+
+
+def test_documents_match_per_pixel_schema():
+    values = values_grid()
+    lats = np.array([1.5, .5, -.5, -1.5])
+    lons = np.array([-2., -1., 0., 1., 2.])
+    docs = list(AtlasMongoDocument.documents(values, lats, lons, 3))
+    expected = list()
+    for i, y in enumerate(lats):
+        for j, x in enumerate(lons):
+            if np.ma.getmaskarray(values[i, j]).all():
+                continue
+            pixel = np.ma.filled(values[i, j].astype(np.float64), np.nan)
+            expected.append(AtlasMongoDocument(x, y, pixel, 3).as_dict)
+    assert len(docs) == 19
+    for doc, exp in zip(docs, expected):
+        assert doc['geometry'] == exp['geometry']
+        assert doc['properties'] == exp['properties']
+
+
+def test_documents_keep_nulls_and_grid_ids():
+    values = values_grid()
+    lats = np.array([1.5, .5, -.5, -1.5])
+    lons = np.array([-2., -1., 0., 1., 2.])
+    docs = {tuple(d['geometry']['coordinates']): d for d in
+            AtlasMongoDocument.documents(values, lats, lons, 3)}
+    assert (-2., 1.5) not in docs
+    assert docs[(0., .5)]['properties']['values'][1] is None
+    assert docs[(1., -.5)]['properties']['values'][0] is None
+    ids = [d['_id'] for d in docs.values()]
+    assert len(set(ids)) == len(ids)
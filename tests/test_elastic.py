@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import copy
+import os
+import pytest
+from atlas_db.clients import elastic_registry
+from atlas_db.constants import SCALE
+from atlas_db.ingestors.elastic import AtlasElasticIngestor, MAPPING
+
+
+class FakeIndices(object):
+    def __init__(self, es):
+        self.es = es
+
+    def exists(self, index):
+        return index in self.es.indexes
+
+    def create(self, index, settings, mappings):
+        if index in self.es.indexes:
+            return {'status': 400}
+        self.es.indexes[index] = {'settings': dict(settings),
+                                  'mappings': copy.deepcopy(mappings),
+                                  'docs': dict()}
+        return {'acknowledged': True}
+
+    def get_settings(self, index):
+        settings = self.es.indexes[index]['settings']
+        # Settings come back as strings.
+        return {index: {'settings': {'index': {
+            k: str(v) for k, v in settings.items()}}}}
+
+    def put_settings(self, index, settings):
+        self.es.indexes[index]['settings'].update(settings)
+
+    def get_mapping(self, index):
+        if index not in self.es.indexes:
+            return {'status': 404}
+        return {index: {'mappings': self.es.indexes[index]['mappings']}}
+
+    def put_mapping(self, index, meta):
+        self.es.indexes[index]['mappings']['_meta'] = meta
+
+    def refresh(self, index):
+        self.es.refreshed.append(index)
+
+
+class FakeElasticsearch(object):
+    def __init__(self):
+        self.indexes = dict()
+        self.refreshed = list()
+        self.searches = list()
+        self.indices = FakeIndices(self)
+
+    def options(self, **kwargs):
+        return self
+
+    def index(self, index, id, document, refresh=False):
+        self.indexes.setdefault(index, {'docs': dict()})['docs'][id] = \
+            document
+
+    def search(self, index, query, source, sort, size, track_total_hits,
+               search_after=None):
+        self.searches.append(search_after)
+        docs = sorted(self.indexes[index]['docs'].values(),
+                      key=lambda d: d['cell'])
+        if search_after is not None:
+            docs = [d for d in docs if d['cell'] > search_after[0]]
+        return {'hits': {'hits': [{'_source': d, 'sort': [d['cell']]}
+                                  for d in docs[:size]]}}
+
+
+def parallel_bulk(client, actions, thread_count=4, chunk_size=500,
+                  max_chunk_bytes=None, raise_on_error=True):
+    for action in actions:
+        if action['_source'].get('bad'):
+            yield False, {'index': {'_id': action['_id'], 'status': 400}}
+            continue
+        client.indexes[action['_index']]['docs'][action['_id']] = \
+            action['_source']
+        yield True, {'index': {'_id': action['_id']}}
+
+
+@pytest.fixture
+def es(monkeypatch):
+    from elasticsearch import helpers
+    client = FakeElasticsearch()
+    monkeypatch.setattr(helpers, 'parallel_bulk', parallel_bulk)
+    monkeypatch.setattr(elastic_registry, '_client', client)
+    monkeypatch.setattr(elastic_registry, '_pid', os.getpid())
+    return client
+
+
+def test_ingest(es, psims_path):
+    from atlas_db.interfaces.psims import AtlasPsims
+    dataset = AtlasPsims(AtlasElasticIngestor(SCALE), psims_path, SCALE)
+    dataset.ingest()
+    index = elastic_registry.index(dataset.name, 'var0')
+    loaded = es.indexes[index]
+    assert loaded['docs']
+    assert loaded['mappings']['properties'] == MAPPING['properties']
+    # Load settings were restored and the index refreshed.
+    assert loaded['settings'] == {'refresh_interval': '1s',
+                                  'number_of_replicas': 1}
+    assert loaded['mappings']['_meta'] == dict()
+    assert index in es.refreshed
+
+
+def test_write_documents_counts(es):
+    from elasticsearch.helpers import BulkIndexError
+    backend = AtlasElasticIngestor(SCALE)
+    docs = [{'cell': i} for i in range(5)]
+    assert backend.write_documents(docs, 'ds', 'v') == {'docs': 5,
+                                                        'errors': 0}
+    docs[1]['bad'] = docs[3]['bad'] = True
+    with pytest.raises(BulkIndexError) as raised:
+        backend.write_documents(docs, 'ds', 'v')
+    # The good documents are still written.
+    assert len(raised.value.errors) == 2
+    assert backend.stats == {'docs': 8, 'errors': 2}
+
+
+def test_concurrent_loaders_restore_once(es):
+    es.indexes['ds_v'] = {'settings': {'refresh_interval': '30s',
+                                       'number_of_replicas': 2},
+                          'mappings': copy.deepcopy(MAPPING),
+                          'docs': dict()}
+    first, second = AtlasElasticIngestor(SCALE), AtlasElasticIngestor(SCALE)
+    first.start_load('ds_v')
+    second.start_load('ds_v')
+    assert es.indexes['ds_v']['settings']['refresh_interval'] == '-1'
+    # A loader other than the one that started the load finishes it.
+    second.finish_load('ds_v')
+    assert es.indexes['ds_v']['settings'] == {'refresh_interval': '30s',
+                                              'number_of_replicas': 2}
+    first.finish_load('ds_v')
+    assert es.refreshed == ['ds_v']
+
+
+def test_search_after(es):
+    from atlas_db.extractors.elastic import AtlasElasticExtractor
+    es.indexes['ds_v'] = {'docs': {
+        i: {'cell': i, 'location': {'lat': 0., 'lon': float(i)},
+            'properties': {'values': [i]}} for i in range(25)}}
+    extractor = AtlasElasticExtractor()
+    extractor.grid_db = 'ds_v'
+    docs = list(extractor.iter_query({}, batch_size=10, limit=0))
+    assert [d['properties']['values'][0] for d in docs] == list(range(25))
+    assert es.searches == [None, [9], [19]]
+    assert len(list(extractor.iter_query({}, batch_size=10, limit=15))) \
+        == 15
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from atlas_db.constants import SCALE
+from atlas_db.ingestors.encoding import AtlasEncoding
+from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+from atlas_db.interfaces.psims import AtlasPsims
+
+
+def test_for_range():
+    assert AtlasEncoding.for_range(0., 30., 3).dtype.str == '<i2'
+    assert AtlasEncoding.for_range(-40., 30., 3).dtype.str == '<i4'
+    assert AtlasEncoding.for_range(0., 1e7, 3).dtype.str == '<i8'
+    with pytest.raises(ValueError):
+        AtlasEncoding.for_range(0., 1e20, 3)
+
+
+def test_pack_and_decode():
+    encoding = AtlasEncoding('<i2')
+    scaled = np.array([[1, 2, 3], [4, 5, 6]])
+    nulls = np.array([[False, True, False], [False, False, False]])
+    blobs = encoding.blobs(scaled[:, None], nulls[:, None],
+                           np.array([0, 1]), np.array([0, 0]))
+    assert [len(b) for b in blobs] == [6, 6]
+    assert encoding.decode(blobs[0]).tolist() == [1, None, 3]
+    assert encoding.decode(blobs[1]).tolist() == [4, 5, 6]
+
+
+def test_block_round_trip():
+    encoding = AtlasEncoding('<i4')
+    scaled = np.arange(2 * 4 * 3).reshape(2, 4, 3)
+    nulls = np.zeros(scaled.shape, dtype=bool)
+    nulls[0, 1] = True
+    values, masks = encoding.block_blobs(scaled, nulls)
+    block = encoding.decode_block(values[0], masks[0], 2)
+    assert block.shape == (2, 2, 3)
+    assert block.mask[0, 1].all() and not block.mask[0, 0].any()
+    assert block[1, 1].tolist() == scaled[0, 3].tolist()
+
+
+def dataset(path):
+    return AtlasPsims(AtlasMongoIngestor(SCALE), path, SCALE)
+
+
+def test_unknown_encoding(memory, psims_path):
+    ds = dataset(psims_path)
+    ds.encoding = 'pakced'
+    with pytest.raises(ValueError):
+        ds.ingest()
+
+
+def test_declared_range_skips_statistics_pass(memory, psims_path,
+                                              monkeypatch):
+    from netCDF4 import Dataset
+    nc = Dataset(psims_path, 'a')
+    for v in ('var0', 'var1'):
+        nc.variables[v].actual_range = np.array([0., 1.], 'f4')
+    nc.close()
+    ds = dataset(psims_path)
+    ds.encoding = 'packed'
+    monkeypatch.setattr(ds, 'statistics', None)
+    assert ds.encodings['var0'].dtype.str == '<i2'
+
+
+def test_undeclared_range_reads_statistics(memory, psims_path):
+    ds = dataset(psims_path)
+    ds.encoding = 'packed'
+    assert ds.declared_range('var0') is None
+    # Values reach 10000, which needs 32 bits at 3 decimals.
+    assert ds.encodings['var0'].dtype.str == '<i4'
+    assert 'var0' in ds._statistics
+
+
+def test_pack_refuses_overflow():
+    encoding = AtlasEncoding('<i2')
+    nulls = np.array([False, True])
+    assert encoding.pack(np.array([32767, 10 ** 6]), nulls).tolist() == \
+        [32767, encoding.sentinel]
+    for value in (32768, encoding.sentinel):
+        with pytest.raises(ValueError):
+            encoding.pack(np.array([value, 0]), nulls)
+
+
+def test_configured_dtype(memory, psims_path, monkeypatch):
+    ds = dataset(psims_path)
+    ds.encoding = 'packed'
+    ds.packed_dtype = '<i8'
+    monkeypatch.setattr(ds, 'statistics', None)
+    assert ds.encodings['var0'].dtype.str == '<i8'
+    ds = dataset(psims_path)
+    ds.encoding = 'packed'
+    ds.packed_dtype = 'f4'
+    with pytest.raises(ValueError):
+        ds.encodings
+
+
+def test_refuses_an_encoding_other_than_the_stored_one(memory, psims_path):
+    ds = dataset(psims_path)
+    ds.encoding = 'packed'
+    ds.ingest()
+    again = dataset(psims_path)
+    again.encoding = 'packed'
+    again.overwrite = True
+    again.packed_dtype = '<i8'
+    with pytest.raises(ValueError, match='stored as <i4'):
+        again.ingest()
+    assert again.backend.stats['docs'] == 0
+    # The same encoding is accepted.
+    again.packed_dtype = None
+    again._encodings = None
+    again.ingest()
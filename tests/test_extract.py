@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from atlas_db.constants import SCALE
+from atlas_db.extractors.mongodb import AtlasMongoExtractor
+from atlas_db.extractors.selection import AtlasSelection
+from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+from atlas_db.interfaces.psims import AtlasPsims
+
+
+@pytest.fixture(params=['list', 'packed'])
+def dataset(request, memory, psims_path):
+    """pSIMS file ingested with each encoding, and its values of `var0`
+    as a (lat, lon, time) array with latitudes ascending.
+    """
+    from netCDF4 import Dataset
+    ds = AtlasPsims(AtlasMongoIngestor(SCALE), psims_path, SCALE)
+    ds.encoding = request.param
+    ds.ingest()
+    nc = Dataset(psims_path)
+    try:
+        values = np.ma.asarray(nc.variables['var0'][:]).transpose(1, 2, 0)
+        lats = nc.variables['lat'][:]
+    finally:
+        nc.close()
+    if lats[0] > lats[-1]:
+        values = values[::-1]
+    return ds.name, values
+
+
+def extractor(name):
+    e = AtlasMongoExtractor()
+    e.set_grid_db(name, 'var0')
+    return e
+
+
+def test_raster(dataset):
+    name, values = dataset
+    data, lats, lons = extractor(name).raster(-180, -90, 180, 90,
+                                              budget=10 ** 6)
+    assert data.shape == values.shape
+    assert (data.mask == values.mask).all()
+    np.testing.assert_allclose(data.compressed(), values.compressed(),
+                               atol=10 ** -SCALE)
+
+
+def on_server(monkeypatch, path):
+    """Force list selections through the `$slice` projection or, when
+    `path` is 'aggregate', through the aggregation pipeline.
+    """
+    if path == 'aggregate':
+        monkeypatch.setattr(AtlasSelection, 'slice', property(
+            lambda self: None))
+
+
+@pytest.mark.parametrize('path', ['slice', 'aggregate'])
+def test_raster_selection_shape(dataset, monkeypatch, path):
+    name, values = dataset
+    on_server(monkeypatch, path)
+    data = extractor(name).raster(-180, -90, 180, 90, budget=10 ** 6,
+                                  select={'time': (1, 3)})[0]
+    assert data.shape == values.shape[:2] + (2, )
+    np.testing.assert_allclose(data.compressed(),
+                               values[..., 1:3].compressed(),
+                               atol=10 ** -SCALE)
+
+
+@pytest.mark.parametrize('path', ['slice', 'aggregate'])
+def test_quadrilateral_selection(dataset, monkeypatch, path):
+    name, _ = dataset
+    world = (-180, -90, 180, -90, 180, 90, -180, 90)
+    e = extractor(name)
+    whole = e.quadrilateral(*world, limit=0, budget=10 ** 6)
+    on_server(monkeypatch, path)
+    docs = e.quadrilateral(*world, limit=0, budget=10 ** 6,
+                           select={'time': (1, 3)})
+    assert [d['geometry'] for d in docs] == [d['geometry'] for d in whole]
+    key = e.value_field.split('.', 1)[1]
+    for doc, full in zip(docs, whole):
+        assert list(doc['properties'][key]) == \
+            list(full['properties'][key][1:3])
+
+
+def test_raw_values_match_decoded_documents(dataset):
+    import bson
+    name, _ = dataset
+    e = extractor(name)
+    batch = b''.join(bson.encode(d) for d in e.grid_db.find(
+        {}, {'_id': True, 'properties.values': True}).limit(50))
+    cells, values = e.raw_values(batch)
+    # The same documents, decoded one by one.
+    docs = bson.decode_all(batch)
+    assert cells.tolist() == [d['_id'] for d in docs]
+    if e.encoding is None:
+        expected = [d['properties']['values'] for d in docs]
+    else:
+        expected = [e.encoding.decode(d['properties']['values']).filled(
+            e.encoding.sentinel).tolist() for d in docs]
+    assert values.tolist() == expected
+
+
+def test_raster_reads_batches_without_decoding(dataset, monkeypatch):
+    import bson
+    name, values = dataset
+    monkeypatch.setattr(bson, 'decode_all', None)
+    data = extractor(name).raster(-180, -90, 180, 90, budget=10 ** 6)[0]
+    assert data.count() == values.count()
+
+
+def test_points(dataset):
+    name, _ = dataset
+    e = extractor(name)
+    data, lats, lons = e.raster(-180, -90, 180, 90, budget=10 ** 6)
+    i, j = np.array([0, 10, 44, 10]), np.array([0, 20, 89, 20])
+    values, snapped_lats, snapped_lons = e.points(lons[j], lats[i])
+    assert values.shape == (4, data.shape[-1])
+    assert (values.mask == data.mask[i, j]).all()
+    np.testing.assert_allclose(values.compressed(), data[i, j].compressed())
+    np.testing.assert_allclose(snapped_lats, lats[i])
+    np.testing.assert_allclose(snapped_lons, lons[j])
+
+
+def test_points_off_the_globe(dataset):
+    name, _ = dataset
+    e = extractor(name)
+    data, lats, lons = e.raster(-180, -90, 180, 90, budget=10 ** 6)
+    values, snapped_lats, snapped_lons = e.points(
+        [lons[20], np.nan, 0., lons[20], np.inf],
+        [lats[10], 0., 91., np.nan, -90.5])
+    assert values.shape == (5, data.shape[-1])
+    assert values[1:].mask.all()
+    assert (values.mask[0] == data.mask[10, 20]).all()
+    assert np.isnan(snapped_lats[1:]).all()
+    assert np.isnan(snapped_lons[1:]).all()
+    assert snapped_lats[0] == lats[10]
+
+
+@pytest.mark.parametrize('select, width', [(None, 5), ({'time': (1, 3)}, 2)])
+def test_points_without_data_keep_the_value_shape(dataset, select, width):
+    name, _ = dataset
+    values, snapped_lats, _ = extractor(name).points(
+        [np.nan, 0.], [0., 100.], select=select)
+    assert values.shape == (2, width)
+    assert values.mask.all()
+    assert np.isnan(snapped_lats).all()
+
+
+def test_block_points_off_the_globe(memory, psims_path):
+    ds = AtlasPsims(AtlasMongoIngestor(SCALE), psims_path, SCALE)
+    ds.encoding = 'packed'
+    ds.block_size = 5
+    ds.ingest()
+    e = extractor(ds.name)
+    data, lats, lons = e.raster(-180, -90, 180, 90, budget=10 ** 6)
+    values, snapped_lats, _ = e.points([np.nan, lons[20], 0.],
+                                       [0., lats[10], -95.])
+    assert values.shape == (3, data.shape[-1])
+    assert values[[0, 2]].mask.all()
+    assert (values.mask[1] == data.mask[10, 20]).all()
+    np.testing.assert_allclose(values[1].compressed(),
+                               data[10, 20].compressed())
+    assert np.isnan(snapped_lats[[0, 2]]).all()
+
+
+class Recorder(object):
+    """Patches `find` on the memory collections to record its keyword
+    arguments and whether each cursor was closed.
+    """
+    def __init__(self, monkeypatch):
+        from atlas_db.benchmarks.memory import AtlasMemoryCollection
+        self.calls = list()
+        self.cursors = list()
+        find = AtlasMemoryCollection.find
+        recorder = self
+
+        def recording_find(collection, *args, **kwargs):
+            recorder.calls.append(kwargs)
+            cursor = find(collection, *args, **kwargs)
+            recorder.cursors.append(cursor)
+            cursor.closed_by_caller = False
+            close = cursor.close
+
+            def closing():
+                cursor.closed_by_caller = True
+                close()
+            cursor.close = closing
+            return cursor
+
+        monkeypatch.setattr(AtlasMemoryCollection, 'find', recording_find)
+
+
+WORLD_QUAD = (-180, -90, 180, -90, 180, 90, -180, 90)
+
+
+def test_batch_size_and_limit(dataset, monkeypatch):
+    name, values = dataset
+    n = int((~np.ma.getmaskarray(values).all(axis=2)).sum())
+    e = extractor(name)
+    recorder = Recorder(monkeypatch)
+    assert len(e.quadrilateral(*WORLD_QUAD, limit=0, budget=10 ** 6)) == n
+    assert len(e.quadrilateral(*WORLD_QUAD, limit=25,
+                               budget=10 ** 6)) == 25
+    batches = list(e.iter_quadrilateral_batches(
+        *WORLD_QUAD, batch_size=100, limit=0, budget=10 ** 6))
+    assert [len(b) for b in batches[:-1]] == [100] * (len(batches) - 1)
+    assert sum(len(b) for b in batches) == n
+    assert [(c['limit'], c['batch_size']) for c in recorder.calls] == [
+        (0, 1000), (25, 1000), (0, 100)]
+    assert all(c.closed_by_caller for c in recorder.cursors)
+
+
+def test_early_exit_closes_the_cursor(dataset, monkeypatch):
+    name, _ = dataset
+    recorder = Recorder(monkeypatch)
+    docs = extractor(name).iter_quadrilateral(*WORLD_QUAD, batch_size=10,
+                                              limit=0, budget=10 ** 6)
+    next(docs)
+    cursor, = recorder.cursors
+    assert not cursor.closed_by_caller
+    docs.close()
+    assert cursor.closed_by_caller
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from atlas_db.grid import AtlasGrid
+
+
+def tile(lat, lon, n, res):
+    """Centroids of an `n` x `n` tile with its south-west corner at
+    (`lat`, `lon`).
+    """
+    return (lat + res / 2 + np.arange(n) * res,
+            lon + res / 2 + np.arange(n) * res)
+
+
+def test_check_blocks_accepts_aligned_tiles():
+    res = 2. / 240
+    lats, lons = tile(0., 0., 240, res)
+    grid = AtlasGrid(lats, lons)
+    for size in (16, 48, 240):
+        grid.check_blocks(lats, lons, size)
+
+
+def test_check_blocks_rejects_partial_blocks():
+    res = 2. / 240
+    lats, lons = tile(0., 0., 240, res)
+    with pytest.raises(ValueError):
+        AtlasGrid(lats, lons).check_blocks(lats, lons, 32)
+
+
+def test_check_blocks_allows_the_edge_of_the_globe():
+    lats = -89.75 + .5 * np.arange(360)
+    lons = np.r_[.25 + .5 * np.arange(360), -179.75 + .5 * np.arange(360)]
+    # 360 rows and 720 columns are not multiples of 32, but nothing lies
+    # beyond them; the columns wrap around the antimeridian.
+    AtlasGrid(lats, lons).check_blocks(lats, lons, 32)
+
+
+def world(res=10.):
+    """Global grid with centroids at half a cell from -90 and -180."""
+    return AtlasGrid(-90. + res / 2 + np.arange(int(180 / res)) * res,
+                     -180. + res / 2 + np.arange(int(360 / res)) * res)
+
+
+def brute_cells(grid, west, south, east, north):
+    """Cells whose centroids lie in the box, longitudes taken modulo 360.
+    """
+    cells = set()
+    n_rows = int(round(180. / grid.res_lat))
+    lats = grid.row_lats(np.arange(n_rows))
+    lons = grid.col_lons(np.arange(grid.n_cols))
+    for r, lat in enumerate(lats):
+        if not south - 1e-9 <= lat <= north + 1e-9:
+            continue
+        for c, lon in enumerate(lons):
+            shift = np.ceil((west - 1e-9 - lon) / 360.) * 360.
+            if lon + shift <= east + 1e-9:
+                cells.add(int(grid.cells(r, c)))
+    return cells
+
+
+def range_cells(ranges):
+    return set(c for first, last in ranges for c in range(first, last + 1))
+
+
+def test_antimeridian():
+    grid = world()
+    assert grid.col_ranges(170., 190.) == [(35, 35), (0, 0)]
+    assert grid.col_ranges(-190., -170.) == [(35, 35), (0, 0)]
+    # Rows 8 and 9 have their centroids at -5 and 5.
+    assert grid.cell_ranges(170., -10., 190., 10.) == [
+        (8 * 36 + 35, 8 * 36 + 35), (8 * 36, 8 * 36),
+        (9 * 36 + 35, 9 * 36 + 35), (9 * 36, 9 * 36)]
+    assert grid.n_cells(170., -10., 190., 10.) == 4
+
+
+def test_full_width():
+    grid = world()
+    for west, east in ((-180., 180.), (-200., 200.), (0., 360.)):
+        assert grid.col_ranges(west, east) == [(0, 35)]
+    # Rows spanning the full width merge into one range of cells.
+    assert grid.cell_ranges(-180., -10., 180., 10.) == [(8 * 36,
+                                                         9 * 36 + 35)]
+    assert grid.n_cells(-180., -90., 180., 90.) == 18 * 36
+
+
+def test_empty_boxes():
+    grid = world()
+    # Between two centroids, or inverted.
+    assert grid.row_range(1., 4.) is None
+    assert grid.col_ranges(1., 4.) == []
+    assert grid.col_ranges(10., -10.) == []
+    for box in ((1., -80., 4., 80.), (-170., 1., 170., 4.),
+                (10., 10., -10., 20.)):
+        assert grid.cell_ranges(*box) == []
+        assert grid.n_cells(*box) == 0
+
+
+def test_ranges_match_brute_force():
+    rng = np.random.RandomState(0)
+    for res in (10., 7.5):
+        grid = world(res)
+        for _ in range(100):
+            west = rng.uniform(-200., 180.)
+            east = west + rng.uniform(0., 400.)
+            south = rng.uniform(-90., 90.)
+            north = min(90., south + rng.uniform(0., 90.))
+            expected = brute_cells(grid, west, south, east, north)
+            assert range_cells(grid.cell_ranges(west, south, east,
+                                                north)) == expected
+            assert grid.n_cells(west, south, east, north) == len(expected)
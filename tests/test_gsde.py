@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import threading
+import pytest
+from atlas_db.interfaces.gsde import AtlasGsde
+
+try:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Local tile server over `tmp_path/tiles`. Its `fail` dict gives,
+    per file name, how many GETs to answer with a 503 first; its `gets`
+    list records every GET.
+    """
+    pytest.importorskip('requests')
+    pytest.importorskip('netCDF4')
+    from atlas_db.benchmarks.fixtures import gsde_file
+    directory = tmp_path / 'tiles'
+    directory.mkdir()
+    for lat in (0., 2.):
+        gsde_file(str(directory), lat=lat, res=.25, n_depths=2)
+    fail = dict()
+    gets = list()
+
+    class Handler(SimpleHTTPRequestHandler):
+        def translate_path(self, path):
+            return os.path.join(str(directory), path.split('/')[-1])
+
+        def do_GET(self):
+            name = self.path.split('/')[-1]
+            gets.append(name)
+            if fail.get(name):
+                fail[name] -= 1
+                self.send_error(503)
+                return
+            SimpleHTTPRequestHandler.do_GET(self)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    httpd.url = 'http://127.0.0.1:{}/'.format(httpd.server_port)
+    httpd.tiles = sorted(os.listdir(str(directory)))
+    httpd.fail = fail
+    httpd.gets = gets
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def gsde(tmp_path):
+    p = AtlasGsde()
+    p.cache_dir = str(tmp_path / 'cache')
+    p.ingest_workers = 0
+    p.download_threads = 2
+    p.retries = 2
+    return p
+
+
+def test_init_is_lazy(tmp_path):
+    p = gsde(tmp_path)
+    assert p._session is None and p._backend is None and p._cache is None
+    assert not os.path.exists(p.cache_dir)
+
+
+def test_cache_skips_downloads(memory, server, tmp_path):
+    links = [server.url + t for t in server.tiles]
+    gsde(tmp_path).ingest_tiles(links)
+    assert sorted(server.gets) == server.tiles
+    assert len(os.listdir(str(tmp_path / 'cache'))) == 2 * len(links)
+    # Into an empty database again, from the cache.
+    memory.close()
+    gsde(tmp_path).ingest_tiles(links)
+    assert len(server.gets) == len(links)
+
+
+def test_retry(memory, server, tmp_path):
+    server.fail[server.tiles[0]] = 2
+    gsde(tmp_path).ingest_tiles([server.url + server.tiles[0]])
+    assert server.gets == [server.tiles[0]] * 3
+
+
+def test_failed_tile(memory, server, tmp_path):
+    links = [server.url + t for t in server.tiles + ['missing.nc4']]
+    p = gsde(tmp_path)
+    with pytest.raises(Exception, match='1 of 3 tiles failed'):
+        p.ingest_tiles(links)
+    for tile in server.tiles:
+        assert p.backend.checkpoint.get(p.name, None, tile) is not None
+    # A resumed run only asks for the tile that failed.
+    del server.gets[:]
+    p = gsde(tmp_path)
+    p.resume = True
+    with pytest.raises(Exception, match='1 of 1 tiles failed'):
+        p.ingest_tiles(links)
+    assert server.gets == []
+
+
+def test_overviews_are_indexed(memory, server, settings, tmp_path):
+    settings(ingest={'overviews': (2, )})
+    p = gsde(tmp_path)
+    queued = list()
+    index_grid = p.backend.index_grid
+    p.backend.index_grid = lambda name, collection: (
+        queued.append(collection), index_grid(name, collection))
+    p.ingest_tiles([server.url + t for t in server.tiles])
+    assert 'CLAY_x2' in queued
+    assert set(memory.db.list_collection_names()) >= set(
+        '{}_{}'.format(p.name, c) for c in queued)
+
+
+@pytest.mark.parametrize('layout', [dict(encoding='packed'),
+                                    dict(block_size=4)])
+def test_tiles_share_an_encoding(memory, settings, tmp_path, layout):
+    pytest.importorskip('netCDF4')
+    import numpy as np
+    from netCDF4 import Dataset
+    from atlas_db.constants import SCALE
+    from atlas_db.benchmarks.fixtures import gsde_file
+    from atlas_db.extractors.mongodb import AtlasMongoExtractor
+    from atlas_db.ingestors.encoding import AtlasEncoding
+    settings(ingest=layout)
+    tiles = [gsde_file(str(tmp_path), lat=lat, res=.25, n_depths=2)
+             for lat in (0., 2.)]
+    # Ranges that fit 32 and 16 bits: each tile alone would pick its own.
+    nc = Dataset(tiles[1], 'a')
+    nc.variables['CLAY'][:] = nc.variables['CLAY'][:] / 100.
+    nc.close()
+    expected = list()
+    for path in tiles:
+        nc = Dataset(path)
+        values = np.ma.asarray(nc.variables['CLAY'][:]).transpose(1, 2, 0)
+        nc.close()
+        assert AtlasEncoding.for_range(values.min(), values.max(),
+                                       SCALE).dtype.str == \
+            ('<i4' if not expected else '<i2')
+        expected.append(values)
+    p = gsde(tmp_path)
+    for path in tiles:
+        p.ingest_tile(path)
+    e = AtlasMongoExtractor()
+    e.set_grid_db(p.name, 'CLAY')
+    assert e.encoding.dtype.str == '<i4'
+    assert e.block_size == layout.get('block_size', 0)
+    data = e.raster(0., 0., 2., 4., budget=10 ** 6)[0]
+    expected = np.ma.concatenate(expected)
+    assert data.shape == expected.shape
+    assert (data.mask == np.ma.getmaskarray(expected)).all()
+    np.testing.assert_allclose(data.compressed(), expected.compressed(),
+                               atol=10 ** -SCALE)
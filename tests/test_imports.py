@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from atlas_db.benchmarks.imports import BUDGETS, check, measure
+
+
+def test_entry_points_within_budget():
+    # Time budgets are loose here: the test machine may be busy.
+    results = check(repeat=1, scale=5.)
+    assert sorted(results) == sorted(m for m, _, _ in BUDGETS)
+    assert {m: r['failures'] for m, r in results.items()
+            if r['failures']} == dict()
+
+
+def test_ingestors_do_not_import_pymongo():
+    result = measure('atlas_db.ingestors.mongodb', repeat=1)
+    assert 'pymongo' not in result['loaded']
+    assert not result['config_read']
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+from atlas_db.ingestors.indexes import AtlasIndexPlan
+
+
+class Collection(object):
+    def __init__(self, name):
+        self.name = name
+        self.built = list()
+
+    def create_indexes(self, indexes):
+        self.built.append(indexes)
+        return [index.document['name'] for index in indexes]
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        AtlasIndexPlan(('sphere', 'hexagonal'))
+
+
+def test_build_once_per_collection():
+    plan = AtlasIndexPlan(('sphere', 'grid'))
+    a, b = Collection('a'), Collection('b')
+    plan.add('ds', a)
+    plan.add('ds', b)
+    plan.add('ds', a)
+    report = plan.build('ds')
+    assert sorted(report) == ['a', 'b']
+    # Each index is built once, on its own so that it is timed alone.
+    assert [len(call) for call in a.built] == [1, 1]
+    assert report['a']['indexes'] == [
+        'geometry_2dsphere', 'grid.row_1_grid.col_1_geometry_2dsphere']
+    assert list(report['a']['index_seconds']) == report['a']['indexes']
+    assert report['a']['seconds'] == sum(
+        report['a']['index_seconds'].values())
+    assert plan.build('ds') == dict()
+
+
+def test_planar_refuses_blocks():
+    AtlasIndexPlan(('planar', )).check_layout(None)
+    AtlasIndexPlan(('sphere', 'grid')).check_layout(16)
+    with pytest.raises(ValueError):
+        AtlasIndexPlan(('planar', )).check_layout(16)
+
+
+def test_ingest_refuses_planar_blocks(memory, psims_path):
+    from atlas_db.constants import SCALE
+    from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+    from atlas_db.interfaces.psims import AtlasPsims
+    backend = AtlasMongoIngestor(SCALE, index_kinds=('planar', ))
+    dataset = AtlasPsims(backend, psims_path, SCALE)
+    dataset.block_size = 5
+    with pytest.raises(ValueError):
+        dataset.ingest()
+    assert backend.stats['docs'] == 0
+
+
+def test_build_indexes_logs_each_index(memory, psims_path, tmp_path,
+                                       capsys):
+    import json
+    from atlas_db.constants import SCALE
+    from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+    from atlas_db.interfaces.psims import AtlasPsims
+    from atlas_db.metrics import metrics
+    log = str(tmp_path / 'metrics.jsonl')
+    backend = AtlasMongoIngestor(SCALE, index_kinds=('sphere', 'grid'))
+    dataset = AtlasPsims(backend, psims_path, SCALE)
+    dataset.no_index = False
+    metrics.log_path = log
+    try:
+        dataset.ingest()
+    finally:
+        metrics.log_path = None
+    with open(log) as f:
+        events = [json.loads(line) for line in f]
+    builds = [e for e in events if e['event'] == 'index_build']
+    assert len(builds) == 2 * len(dataset.variables)
+    assert set(e['index'] for e in builds) == {
+        'geometry_2dsphere', 'grid.row_1_grid.col_1_geometry_2dsphere'}
+    assert 'geometry_2dsphere' not in capsys.readouterr().out
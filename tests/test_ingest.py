@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+from atlas_db.constants import SCALE
+from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+from atlas_db.interfaces.psims import AtlasPsims
+
+
+class FailingIngestor(AtlasMongoIngestor):
+    """Ingestor whose `fail_at`-th write fails."""
+    def __init__(self, *args, **kwargs):
+        self.fail_at = kwargs.pop('fail_at', 2)
+        super(FailingIngestor, self).__init__(*args, **kwargs)
+        self.writes = 0
+
+    def write_documents(self, docs, metadata, variable):
+        self.writes += 1
+        if self.writes == self.fail_at:
+            raise RuntimeError('write failed')
+        return super(FailingIngestor, self).write_documents(
+            docs, metadata, variable)
+
+
+def ingest(path, backend=None, **options):
+    backend = backend or AtlasMongoIngestor(SCALE)
+    dataset = AtlasPsims(backend, path, SCALE)
+    for k, v in options.items():
+        setattr(dataset, k, v)
+    dataset.ingest()
+    return dataset
+
+
+def backend_meta(dataset):
+    return dataset.backend.meta_db.find_one({'name': dataset.name})
+
+
+def test_ingest(memory, psims_path):
+    dataset = ingest(psims_path)
+    assert backend_meta(dataset)['name'] == dataset.name
+    for variable in dataset.variables:
+        assert memory.grid(dataset.name, variable).count_documents({}) > 0
+
+
+def test_failed_slab_raises(memory, psims_path):
+    backend = FailingIngestor(SCALE)
+    with pytest.raises(RuntimeError):
+        ingest(psims_path, backend)
+    # Only the slab written before the failure is recorded as done.
+    assert backend.writes == 2
+    assert backend.checkpoint.collection.count_documents({}) == 1
+
+
+def test_resume_after_failure(memory, psims_path, settings, monkeypatch):
+    # Five latitude rows, one chunk, per slab: nine slabs per variable.
+    settings(ingest={'slab_bytes': 5 * 90 * 5 * 4})
+    reads = list()
+    read_slab = AtlasPsims.read_slab
+
+    def recording_read_slab(self, variable, start, stop):
+        reads.append((variable, start, stop))
+        return read_slab(self, variable, start, stop)
+
+    monkeypatch.setattr(AtlasPsims, 'read_slab', recording_read_slab)
+
+    fresh = ingest(psims_path)
+    counts = {v: memory.grid(fresh.name, v).count_documents({})
+              for v in fresh.variables}
+    statistics = backend_meta(fresh)['variables']
+    all_slabs = set(reads)
+    assert len(all_slabs) == 2 * 9
+    memory.close()
+
+    backend = FailingIngestor(SCALE, fail_at=12)
+    del reads[:]
+    with pytest.raises(RuntimeError):
+        ingest(psims_path, backend)
+    done = {(r['variable'],) + tuple(
+        int(i) for i in r['unit'].split(':')[-1].split('-'))
+        for r in backend.checkpoint.collection.find()}
+    assert 0 < len(done) < len(all_slabs)
+
+    del reads[:]
+    resumed = ingest(psims_path, resume=True)
+    # Slabs recorded before the failure are not read again.
+    assert set(reads) == all_slabs - done
+    assert len(reads) == len(set(reads))
+    assert {v: memory.grid(resumed.name, v).count_documents({})
+            for v in resumed.variables} == counts
+    for fresh_meta, meta in zip(statistics, backend_meta(resumed)[
+            'variables']):
+        assert meta['name'] == fresh_meta['name']
+        for key in ('count', 'min', 'max', 'mean', 'std'):
+            if key in fresh_meta:
+                assert meta[key] == pytest.approx(fresh_meta[key])
+
+
+def test_rerun_needs_overwrite(memory, psims_path):
+    from pymongo.errors import BulkWriteError
+    ingest(psims_path)
+    with pytest.raises(BulkWriteError):
+        ingest(psims_path)
+    ingest(psims_path, overwrite=True)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from atlas_db.constants import SCALE
+from atlas_db.inputs import AtlasStatistics
+
+
+def test_merged_statistics_match_one_pass():
+    rng = np.random.RandomState(0)
+    values = np.ma.masked_greater(rng.random_sample((12, 5, 3)), .8)
+    values[0, 0, 0] = np.nan
+    whole = AtlasStatistics(4, (0., 1.))
+    whole.update(values)
+    merged = AtlasStatistics(4, (0., 1.))
+    for start in range(0, 12, 5):
+        part = AtlasStatistics(4, (0., 1.))
+        part.update(values[start:start + 5])
+        merged.merge(part.state)
+    # An empty slab leaves the statistics unchanged.
+    merged.merge(AtlasStatistics(4, (0., 1.)).state)
+    valid = values.compressed()
+    valid = valid[~np.isnan(valid)]
+    assert merged.count == whole.count == valid.size
+    assert merged.min == whole.min == valid.min()
+    assert merged.max == whole.max == valid.max()
+    assert merged.mean == pytest.approx(valid.mean())
+    assert merged.counts.tolist() == whole.counts.tolist() == \
+        np.histogram(valid, np.linspace(0., 1., 5))[0].tolist()
+    assert merged.as_dict['histogram']['bins'] == \
+        np.linspace(0., 1., 5).tolist()
+
+
+def test_statistics_without_values():
+    stats = AtlasStatistics()
+    stats.update(np.ma.masked_all((2, 2)))
+    assert stats.as_dict == {'min': None, 'max': None, 'count': 0,
+                             'mean': None}
+
+
+def dataset(path):
+    from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+    from atlas_db.interfaces.psims import AtlasPsims
+    return AtlasPsims(AtlasMongoIngestor(SCALE), path, SCALE)
+
+
+def test_streamed_statistics_match_a_full_read(psims_path):
+    from netCDF4 import Dataset
+    nc = Dataset(psims_path, 'a')
+    nc.variables['var0'].valid_range = np.array([0., 10000.], 'f4')
+    nc.close()
+    ds = dataset(psims_path)
+    ds.histogram_bins = 10
+    rows = [stop - start for start, stop, _ in ds.iter_slabs('var0', 7)]
+    assert len(rows) > 1
+    nc = Dataset(psims_path)
+    values = nc.variables['var0'][:]
+    nc.close()
+    stats = ds.statistics('var0')
+    assert stats.count == values.count()
+    assert stats.min == pytest.approx(float(values.min()))
+    assert stats.max == pytest.approx(float(values.max()))
+    assert stats.mean == pytest.approx(float(values.mean()), rel=1e-6)
+    assert stats.counts.sum() == values.count()
+    # Without a declared range there is no histogram.
+    ds.statistics('var1')
+    assert 'histogram' not in ds.metadata['variables'][1]
+
+
+def test_metadata_is_cached(psims_path, monkeypatch):
+    ds = dataset(psims_path)
+    metadata = ds.metadata
+    assert [v['count'] for v in metadata['variables']] == [
+        ds.statistics(v).count for v in ds.variables]
+    monkeypatch.setattr(ds, 'iter_slabs', None)
+    assert ds.metadata is metadata
+
+
+def test_dimensions_in_variable_order(tmp_path):
+    pytest.importorskip('netCDF4')
+    from netCDF4 import Dataset
+    from atlas_db.inputs.nc4 import AtlasNc4Input
+    path = str(tmp_path / 'soil.nc4')
+    nc = Dataset(path, 'w')
+    for name, size in (('depth', 2), ('time', 3), ('lat', 2), ('lon', 4)):
+        nc.createDimension(name, size)
+        var = nc.createVariable(name, 'f8', (name, ))
+        var[:] = np.arange(size) * 10. + 5.
+        var.long_name = name
+        var.units = '1'
+    var = nc.createVariable('moisture', 'f4', ('time', 'depth', 'lat',
+                                               'lon'))
+    var[:] = np.arange(48).reshape(3, 2, 2, 4)
+    var.long_name = 'moisture'
+    var.units = '1'
+    nc.close()
+    ds = AtlasNc4Input(path, SCALE)
+    ds.name = 'soil'
+    ds.parameters = dict()
+    meta = ds.metadata['variables'][0]
+    assert [d['name'] for d in ds.metadata['dimensions']] == ['depth',
+                                                              'time']
+    assert meta['dimensions'] == ['time', 'depth']
+    assert meta['dimension_idxs'] == [1, 0]
+    # Values of a pixel are flattened in that order.
+    slab = ds.read_slab('moisture', 0, 1)
+    assert slab.shape == (1, 4, 3, 2)
+    assert slab[0, 0].ravel().tolist() == [0., 8., 16., 24., 32., 40.]
+    ds.nc_dataset.close()
+
+
+def test_slabs_follow_chunks(psims_path):
+    ds = dataset(psims_path)
+    var = ds.nc_dataset.variables['var0']
+    chunk_rows = var.chunking()[var.dimensions.index('lat')]
+    row_bytes = var.dtype.itemsize * var.size // len(ds.lats)
+    for slab_bytes in (1, 3 * chunk_rows * row_bytes, 10 ** 9):
+        rows = ds.slab_rows('var0', slab_bytes)
+        assert rows % chunk_rows == 0 or rows == len(ds.lats)
+    assert ds.slab_rows('var0', 3 * chunk_rows * row_bytes) == \
+        3 * chunk_rows
+
+
+@pytest.mark.parametrize('align', [None, 2, 4])
+def test_slabs_cover_the_file(psims_path, align):
+    from netCDF4 import Dataset
+    ds = dataset(psims_path)
+    ranges = ds.slab_ranges('var0', 7, align)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(ds.lats)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    rows = ds.grid.rows(ds.lats)
+    for start, stop in ranges[1:]:
+        # A slab never splits a group of `align` global rows.
+        assert rows[start - 1] // (align or 1) != rows[start] // (align or 1)
+        assert stop - start >= 7 or stop == len(ds.lats)
+    slabs = [ds.read_slab('var0', start, stop) for start, stop in ranges]
+    assert all(s.flags['C_CONTIGUOUS'] for s in slabs)
+    nc = Dataset(psims_path)
+    expected = np.ma.asarray(nc.variables['var0'][:]).transpose(1, 2, 0)
+    nc.close()
+    whole = np.ma.concatenate(slabs)
+    assert (whole.mask == np.ma.getmaskarray(expected)).all()
+    assert (whole.compressed() == expected.compressed()).all()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+from atlas_db.metrics import AtlasMetrics
+
+
+def test_stages_and_counters():
+    m = AtlasMetrics(log='')
+    with m.stage('read'):
+        pass
+    assert list(m.timed(range(3), 'transform')) == [0, 1, 2]
+    m.count('docs', 5)
+    m.count('docs')
+    state = m.as_dict
+    assert state['stages']['read']['calls'] == 1
+    assert state['stages']['transform']['calls'] == 3
+    assert state['counters'] == {'docs': 6}
+
+
+def test_timed_records_a_partial_iteration():
+    m = AtlasMetrics(log='')
+    items = m.timed(range(10), 'encode')
+    next(items)
+    next(items)
+    items.close()
+    assert m.as_dict['stages']['encode']['calls'] == 2
+
+
+def test_merge_adds_workers():
+    parent, child = AtlasMetrics(log=''), AtlasMetrics(log='')
+    parent.worker(1, 100, 2.)
+    child.worker(1, 50, 1.)
+    child.worker(2, 10, 0.)
+    child.add_time('write', 1.5)
+    child.count('docs', 60)
+    # As sent back from a pool worker, with string keys.
+    parent.merge(json.loads(json.dumps(child.as_dict)))
+    state = parent.as_dict
+    assert state['workers'][1] == dict(docs=150, seconds=3., tasks=2,
+                                       docs_per_second=50.)
+    assert state['workers'][2]['docs_per_second'] == 0.
+    assert state['stages']['write'] == dict(seconds=1.5, calls=1)
+    assert state['counters'] == {'docs': 60}
+
+
+def test_log_and_profile(tmp_path):
+    log = str(tmp_path / 'metrics.jsonl')
+    m = AtlasMetrics(log=log, profile_dir=str(tmp_path / 'profiles'))
+    assert m.profiled('square', lambda x: x * x, 3) == 9
+    m.log('file', path='a.nc4', docs=3)
+    with open(log) as f:
+        events = [json.loads(line) for line in f]
+    assert [e['event'] for e in events] == ['profile', 'file']
+    assert os.path.exists(events[0]['path'])
+    assert events[1]['docs'] == 3
+
+
+def test_profiling_off():
+    m = AtlasMetrics(log='', profile_dir='')
+    assert m.profile_path('square') is None
+    assert m.profiled('square', lambda x: x * x, 3) == 9
+
+
+def test_ingestion_step_logs_failures(tmp_path, settings, capsys):
+    import pytest
+    from atlas_db.ingestors.decorators import mongo_ingestion
+    from atlas_db.metrics import metrics
+    settings(metrics={'debug': True})
+
+    @mongo_ingestion('Raster')
+    def write(fail):
+        if fail:
+            raise RuntimeError('write failed')
+        return 1
+
+    log = str(tmp_path / 'metrics.jsonl')
+    metrics.log_path = log
+    try:
+        assert write(False) == 1
+        with pytest.raises(RuntimeError):
+            write(True)
+    finally:
+        metrics.log_path = None
+    with open(log) as f:
+        events = [json.loads(line) for line in f]
+    assert [e['event'] for e in events] == ['raster', 'error']
+    assert events[1]['stage'] == 'raster'
+    assert events[1]['error'] == 'RuntimeError'
+    assert events[1]['message'] == 'write failed'
+    # Debug output shows readable times and nothing about the error.
+    out = capsys.readouterr().out
+    assert '*** Start Raster ***\n20' in out
+    assert 'error' not in out
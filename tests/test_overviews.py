@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from atlas_db.grid import AtlasGrid
+from atlas_db.ingestors.overviews import AtlasOverview
+
+
+def native():
+    lats = -89.75 + .5 * np.arange(4)
+    lons = -179.75 + .5 * np.arange(4)
+    return AtlasGrid(lats, lons), lats, lons
+
+
+def test_mean_ignores_masked_cells():
+    grid, lats, lons = native()
+    values = np.ma.masked_array(np.arange(16.).reshape(4, 4, 1))
+    values[0, 0] = np.ma.masked
+    out, o_lats, o_lons = AtlasOverview(grid, 2).aggregate(values, lats,
+                                                           lons)
+    assert out.shape == (2, 2, 1)
+    assert out[0, 0, 0] == np.mean([1., 4., 5.])
+    assert out[1, 1, 0] == np.mean([10., 11., 14., 15.])
+    np.testing.assert_allclose(o_lats, [-89.5, -88.5])
+    np.testing.assert_allclose(o_lons, [-179.5, -178.5])
+
+
+def test_fully_masked_cell_stays_masked():
+    grid, lats, lons = native()
+    values = np.ma.masked_array(np.ones((4, 4, 1)))
+    values[:2, :2] = np.ma.masked
+    out = AtlasOverview(grid, 2, 'nearest').aggregate(values, lats, lons)[0]
+    assert np.ma.getmaskarray(out).tolist() == [[[True], [False]],
+                                                [[False], [False]]]
+
+
+def test_overview_grid_ids():
+    grid, lats, lons = native()
+    overview = AtlasOverview(grid, 2)
+    assert overview.grid.n_cols == grid.n_cols // 2
+    o_lats = overview.aggregate(np.ma.ones((4, 4)), lats, lons)[1]
+    assert overview.grid.rows(o_lats).tolist() == [0, 1]
+    assert overview.collection('yield', 2) == 'yield_x2'
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        AtlasOverview(native()[0], 2, 'median')
+
+
+def test_factor_must_divide_the_columns():
+    # 4 degree cells: 90 columns, which 4 does not divide.
+    grid = AtlasGrid(-88. + 4 * np.arange(45), -178. + 4 * np.arange(90))
+    assert AtlasOverview(grid, 3).grid.n_cols == 30
+    with pytest.raises(ValueError):
+        AtlasOverview(grid, 4)
+
+
+def dataset(path, factors):
+    from atlas_db.constants import SCALE
+    from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+    from atlas_db.interfaces.psims import AtlasPsims
+    ds = AtlasPsims(AtlasMongoIngestor(SCALE), path, SCALE)
+    ds.overviews = factors
+    return ds
+
+
+def test_ingest_rejects_a_wrapping_factor(memory, psims_path):
+    ds = dataset(psims_path, (2, 4))
+    with pytest.raises(ValueError):
+        ds.ingest()
+    assert ds.backend.stats['docs'] == 0
+
+
+def test_level_follows_the_budget(memory, psims_path):
+    from atlas_db.extractors.mongodb import AtlasMongoExtractor
+    ds = dataset(psims_path, (2, 3))
+    ds.ingest()
+    e = AtlasMongoExtractor()
+    e.set_grid_db(ds.name, 'var0')
+    world = (-180, -90, 180, 90)
+    # 45 x 90 = 4050 native cells.
+    assert e.level(*world, budget=10 ** 6)[0] == 1
+    assert e.level(*world, budget=0)[0] == 1
+    assert e.level(*world, budget=1100)[0] == 2
+    assert e.level(*world, budget=500)[0] == 3
+    assert e.level(*world, budget=1)[0] == 3
+    # A small box stays native under the same budget.
+    assert e.level(-20, -20, 20, 20, budget=500)[0] == 1
+    assert e.raster(*world, budget=10 ** 6)[0].shape[:2] == (45, 90)
+    assert e.raster(*world, budget=1100)[0].shape[:2] == (23, 45)
+    assert e.raster(*world, budget=500)[0].shape[:2] == (15, 30)
+    docs = e.bbox(*world, limit=0, budget=500)
+    assert 0 < len(docs) <= 15 * 30
+    assert len(set(d['geometry']['coordinates'][0] for d in docs)) <= 30
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+from atlas_db.ingestors.pool import AtlasSharedArray, AtlasWorkerPool
+
+
+def band_sum(task):
+    start, stop, spec = task
+    return float(AtlasSharedArray.attach(spec)[start:stop].sum())
+
+
+def test_shared_array_round_trip(tmp_path):
+    values = np.ma.masked_greater(np.arange(24.).reshape(2, 3, 4), 20)
+    shared = AtlasSharedArray(values, str(tmp_path))
+    try:
+        attached = AtlasSharedArray.attach(shared.spec)
+        assert np.ma.allequal(attached, values)
+        assert (attached.mask == values.mask).all()
+    finally:
+        shared.close()
+    assert not any(os.path.exists(p) for p in shared.spec)
+
+
+def test_shared_array_without_mask(tmp_path):
+    shared = AtlasSharedArray(np.ones((2, 2)), str(tmp_path))
+    try:
+        assert shared.mask_path is None
+        assert AtlasSharedArray.attach(shared.spec).sum() == 4
+    finally:
+        shared.close()
+
+
+def test_bands_cover_every_row_once():
+    pool = AtlasWorkerPool(processes=3, bands_per_process=2)
+    bands = pool.bands(20)
+    assert len(bands) == 6
+    assert [r for a, b in bands for r in range(a, b)] == list(range(20))
+    assert pool.bands(2) == [(0, 1), (1, 2)]
+
+
+def test_map_bands_runs_in_workers(tmp_path):
+    values = np.arange(40.).reshape(10, 4)
+    shared = AtlasSharedArray(values, str(tmp_path))
+    pool = AtlasWorkerPool(processes=2)
+    try:
+        assert sum(pool.map_bands(band_sum, 10, shared.spec)) == \
+            values.sum()
+    finally:
+        pool.close()
+        shared.close()
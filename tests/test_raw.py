@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import bson
+import numpy as np
+from bson import Binary
+from atlas_db.extractors import raw
+
+
+def batch(docs):
+    return b''.join(bson.encode(d) for d in docs)
+
+
+def test_packed_columns():
+    values = np.arange(12, dtype='<i2').reshape(4, 3)
+    docs = [{'_id': i, 'properties': {'values': Binary(v.tobytes())}}
+            for i, v in enumerate(values)]
+    rows, layout = raw.fixed_layout(batch(docs))
+    assert raw.column(rows, layout, '_id').tolist() == [0, 1, 2, 3]
+    packed = raw.column(rows, layout, 'properties.values', np.dtype('<i2'))
+    assert packed.tolist() == values.tolist()
+
+
+def test_list_columns():
+    docs = [{'_id': 2 ** 40 + i, 'properties': {'values': [i, 2 * i]}}
+            for i in range(3)]
+    rows, layout = raw.fixed_layout(batch(docs))
+    assert raw.column(rows, layout, '_id').tolist() == \
+        [2 ** 40, 2 ** 40 + 1, 2 ** 40 + 2]
+    assert raw.column(rows, layout, 'properties.values').tolist() == \
+        [[0, 0], [1, 2], [2, 4]]
+
+
+def test_differing_layouts():
+    # A null, a wider _id or a missing field changes the layout.
+    for other in ({'_id': 1, 'properties': {'values': [1, None]}},
+                  {'_id': 2 ** 40, 'properties': {'values': [1, 2]}},
+                  {'_id': 1, 'properties': {}}):
+        docs = [{'_id': 0, 'properties': {'values': [1, 2]}}, other]
+        assert raw.fixed_layout(batch(docs)) is None
+
+
+def test_mixed_types_are_not_a_column():
+    docs = [{'_id': 0, 'properties': {'values': [1, 2.5]}}] * 2
+    rows, layout = raw.fixed_layout(batch(docs))
+    assert raw.column(rows, layout, 'properties.values') is None
+    assert raw.column(rows, layout, 'properties.missing') is None
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+from atlas_db.interfaces import scheduler
+from atlas_db.interfaces.scheduler import AtlasScheduler
+
+
+class BrokenIngestor(AtlasMongoIngestor):
+    def write_documents(self, docs, metadata, variable):
+        raise RuntimeError('write failed')
+
+
+def test_run(memory, psims_path):
+    summary = AtlasScheduler(processes=1).run(
+        [os.path.dirname(psims_path)], progress=False)
+    assert (summary['ingested'], summary['failed']) == (1, 0)
+    assert summary['docs'] > 0
+
+
+def test_failed_write_fails_file(memory, psims_path):
+    summary = AtlasScheduler(backend=BrokenIngestor, processes=1).run(
+        [psims_path], progress=False)
+    assert (summary['ingested'], summary['failed']) == (0, 1)
+    assert 'RuntimeError: write failed' in summary['results'][0]['error']
+
+
+def test_main_exit_code(memory, psims_path, monkeypatch):
+    monkeypatch.setattr(AtlasMongoIngestor, 'write_documents',
+                        BrokenIngestor.write_documents)
+    assert scheduler.main(['--processes', '1', psims_path]) == 1
+
+
+def test_plan_rejects_duplicate_names(psims_path, tmp_path):
+    copy = tmp_path / 'copy'
+    copy.mkdir()
+    other = str(copy / os.path.basename(psims_path))
+    with open(psims_path, 'rb') as src, open(other, 'wb') as dst:
+        dst.write(src.read())
+    tasks, rejected = AtlasScheduler().plan(
+        AtlasScheduler.find([psims_path, other]))
+    assert len(tasks) == 1
+    assert 'also ingested' in rejected[0]['error']
+
+
+class RecordingInterface(object):
+    """Interface that records the flags it is ingested with."""
+    flags = list()
+
+    def __init__(self, backend, path, scaling):
+        self.name = os.path.basename(path)
+        self.resume = self.overwrite = None
+
+    def ingest(self):
+        self.flags.append((self.resume, self.overwrite))
+
+
+def test_flags_reach_the_interface(memory, psims_path):
+    del RecordingInterface.flags[:]
+    for resume, overwrite in ((False, True), (True, False)):
+        tasks = AtlasScheduler(RecordingInterface, resume=resume,
+                               overwrite=overwrite).plan([psims_path])[0]
+        assert 'error' not in scheduler.ingest_file(tasks[0])
+    assert RecordingInterface.flags == [(False, True), (True, False)]
+
+
+def test_main_finds_files_once(memory, psims_path, monkeypatch):
+    calls = list()
+    find = AtlasScheduler.find
+
+    def counted(paths, pattern='*.nc4'):
+        calls.append((paths, pattern))
+        return find(paths, pattern)
+
+    monkeypatch.setattr(AtlasScheduler, 'find', staticmethod(counted))
+    directory = os.path.dirname(psims_path)
+    assert scheduler.main(['--processes', '1', directory]) == 0
+    assert calls == [([directory], '*.nc4')]
+    assert scheduler.main(['--pattern', '*.nc', directory]) == 1
+
+
+def test_main_overwrite(psims_path, monkeypatch):
+    seen = list()
+
+    def run(self, paths, progress=True, pattern='*.nc4'):
+        seen.append((self.resume, self.overwrite))
+        return dict(files=1, failed=0, ingested=1, seconds=1.,
+                    bytes_per_second=0., docs_per_second=0., results=[])
+
+    monkeypatch.setattr(AtlasScheduler, 'run', run)
+    assert scheduler.main(['--overwrite', psims_path]) == 0
+    assert scheduler.main(['--resume', psims_path]) == 0
+    assert seen == [(False, True), (True, False)]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from atlas_db.constants import SCALE
+from atlas_db.extractors.mongodb import AtlasMongoExtractor
+from atlas_db.ingestors.mongodb import AtlasMongoIngestor
+from atlas_db.interfaces.psims import AtlasPsims
+
+WORLD = (-180, -90, 180, 90)
+
+
+@pytest.fixture
+def wide(memory, psims_path):
+    """pSIMS file ingested in wide mode, and the values of each variable
+    as (lat, lon, time) arrays with latitudes ascending. The variables
+    are masked independently, so each has pixels where the other is not.
+    """
+    from netCDF4 import Dataset
+    dataset = AtlasPsims(AtlasMongoIngestor(SCALE), psims_path, SCALE)
+    dataset.wide = True
+    dataset.ingest()
+    nc = Dataset(psims_path)
+    try:
+        values = dict((v, np.ma.asarray(nc.variables[v][:])
+                       .transpose(1, 2, 0)[::-1])
+                      for v in dataset.variables)
+    finally:
+        nc.close()
+    return dataset, values
+
+
+def valid(values):
+    return ~np.ma.getmaskarray(values).all(axis=2)
+
+
+def extractor(name, variable):
+    e = AtlasMongoExtractor()
+    e.set_grid_db(name, variable, wide=True)
+    return e
+
+
+def test_one_document_per_pixel(memory, wide):
+    dataset, values = wide
+    var0, var1 = valid(values['var0']), valid(values['var1'])
+    assert (var0 & ~var1).any() and (var1 & ~var0).any()
+    collection = memory.grid(dataset.name, None)
+    assert collection.count_documents({}) == (var0 | var1).sum()
+    assert collection.count_documents(
+        {'properties.var0': {'$exists': True}}) == var0.sum()
+    # No per-variable collections are written.
+    assert memory.grid(dataset.name, 'var0').count_documents({}) == 0
+    meta = dataset.backend.meta_db.find_one({'name': dataset.name})
+    assert meta['wide'] is True
+
+
+@pytest.mark.parametrize('variable', ['var0', 'var1'])
+def test_bbox_skips_pixels_without_the_variable(wide, variable):
+    dataset, values = wide
+    docs = extractor(dataset.name, variable).bbox(*WORLD, limit=0,
+                                                  budget=10 ** 6)
+    assert len(docs) == valid(values[variable]).sum()
+    assert all(variable in d['properties'] for d in docs)
+    other = 'var1' if variable == 'var0' else 'var0'
+    assert not any(other in d['properties'] for d in docs)
+
+
+@pytest.mark.parametrize('variable', ['var0', 'var1'])
+def test_raster(wide, variable):
+    dataset, values = wide
+    data = extractor(dataset.name, variable).raster(*WORLD,
+                                                    budget=10 ** 6)[0]
+    expected = values[variable]
+    assert data.shape == expected.shape
+    assert (data.mask == np.ma.getmaskarray(expected)).all()
+    np.testing.assert_allclose(data.compressed(), expected.compressed(),
+                               atol=10 ** -SCALE)
+
+
+def test_selection(wide):
+    dataset, values = wide
+    docs = extractor(dataset.name, 'var0').bbox(
+        *WORLD, limit=0, budget=10 ** 6, select={'time': (1, 3)})
+    assert len(docs) == valid(values['var0']).sum()
+    assert all(len(d['properties']['var0']) == 2 for d in docs)
+
+
+def test_async_targets(wide):
+    from atlas_db.extractors.aio import AtlasAsyncMongoExtractor
+    dataset, values = wide
+    targets = [(dataset.name, v, True) for v in ('var0', 'var1')]
+    e = AtlasAsyncMongoExtractor()
+    try:
+        results = e.quadrilaterals(targets, -180, -90, 180, -90, 180, 90,
+                                   -180, 90, limit=0, budget=10 ** 6)
+    finally:
+        e.close()
+    for name, variable, _ in targets:
+        docs = results[(name, variable, True)]
+        assert len(docs) == valid(values[variable]).sum()